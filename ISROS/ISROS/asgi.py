@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ISROS.settings')
 
 application = get_asgi_application()
+
+# Load the sea graph in the master process so forked workers share it
+if os.environ.get('ISROS_PRELOAD_GRAPH') == '1':
+    from routing.graph_provider import preload_graph
+    preload_graph()
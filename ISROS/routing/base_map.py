@@ -0,0 +1,122 @@
+import hashlib
+import threading
+import folium
+from branca.element import MacroElement
+from jinja2 import Template
+from .polyline import encode_polyline
+
+WEATHER_RADIUS_M = 15000
+
+
+class RouteLayer(MacroElement):
+    """Adds ``window.drawRoute(payload)`` to the map page so the page around
+    it can draw a route payload (see route_payload) on the cached map."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var layer = null;
+
+            // Google encoded polyline, the same format as polyline.encode_polyline
+            function decodePolyline(encoded, precision) {
+                var factor = Math.pow(10, precision || 5), coords = [], lat = 0, lon = 0, index = 0;
+                while (index < encoded.length) {
+                    var deltas = [];
+                    for (var k = 0; k < 2; k++) {
+                        var result = 0, shift = 0, chunk;
+                        do {
+                            chunk = encoded.charCodeAt(index++) - 63;
+                            result |= (chunk & 0x1f) << shift;
+                            shift += 5;
+                        } while (chunk >= 0x20);
+                        deltas.push(result & 1 ? ~(result >> 1) : result >> 1);
+                    }
+                    lat += deltas[0];
+                    lon += deltas[1];
+                    coords.push([lat / factor, lon / factor]);
+                }
+                return coords;
+            }
+
+            function marker(point, color, icon, label) {
+                return L.marker(point, {
+                    icon: L.AwesomeMarkers.icon({icon: icon, markerColor: color, prefix: 'glyphicon'})
+                }).bindPopup(label + ': ' + point[0] + ', ' + point[1]);
+            }
+
+            window.drawRoute = function(payload) {
+                if (layer !== null) {
+                    map.removeLayer(layer);
+                }
+                layer = L.layerGroup().addTo(map);
+                (payload.weather || []).forEach(function(point) {
+                    L.circle(point, {radius: payload.weather_radius_m, color: 'red', fill: true, fillOpacity: 0.2}).addTo(layer);
+                });
+                if (payload.route) {
+                    L.polyline(decodePolyline(payload.route), {color: 'green', weight: 1, opacity: 1}).addTo(layer);
+                }
+                if (payload.start) {
+                    marker(payload.start, 'green', 'play', 'Start').addTo(layer);
+                }
+                if (payload.goal) {
+                    marker(payload.goal, 'red', 'flag', 'Goal').addTo(layer);
+                }
+            };
+        })();
+        {% endmacro %}
+    """)
+
+
+def build_base_map(grid_size=1):
+    min_lat, max_lat = -90, 90
+    min_lon, max_lon = -180, 180
+
+    # Always Mercator Projection
+    m = folium.Map(
+        location=[(max_lat + min_lat) / 2, (max_lon + min_lon) / 2],
+        zoom_start=3,
+        min_zoom=3,
+        tiles="Cartodb Positron",
+        max_bounds=[[min_lat, min_lon], [max_lat, max_lon]],  # This will restrict the view to the map's initial bounds
+    )
+    m.fit_bounds([[min_lat, min_lon], [max_lat, max_lon]])
+
+    # Latitude and longitude lines as one multi-polyline instead of one layer per line
+    graticule = [[(lat, min_lon), (lat, max_lon)] for lat in range(min_lat, max_lat, grid_size)]
+    graticule += [[(min_lat, lon), (max_lat, lon)] for lon in range(min_lon, max_lon, grid_size)]
+    folium.PolyLine(graticule, color="blue", weight=0.1).add_to(m)
+
+    # Emphasize the boundaries (equator and prime meridian)
+    folium.PolyLine([(0, min_lon), (0, max_lon)], color="red", weight=0.3).add_to(m)  # Equator
+    folium.PolyLine([(min_lat, 0), (max_lat, 0)], color="red", weight=0.3).add_to(m)  # Prime Meridian
+
+    RouteLayer().add_to(m)
+    return m
+
+
+_base_map = {}
+_base_map_lock = threading.Lock()
+
+
+def base_map_html():
+    """(html, etag) of the base map page, rendered once per process."""
+    if 'html' not in _base_map:
+        with _base_map_lock:
+            if 'html' not in _base_map:
+                html = build_base_map().get_root().render()
+                _base_map['etag'] = hashlib.md5(html.encode('utf-8')).hexdigest()
+                _base_map['html'] = html
+    return _base_map['html'], _base_map['etag']
+
+
+def route_payload(path=None, start=None, goal=None, weather_points=(), precision=5):
+    """What the page needs to draw a route on the base map: the path as an
+    encoded polyline, the endpoints and the weather circles."""
+    return {
+        "route": encode_polyline(path, precision) if path else None,
+        "start": [round(start[0], precision), round(start[1], precision)] if start else None,
+        "goal": [round(goal[0], precision), round(goal[1], precision)] if goal else None,
+        "weather": [[round(lat, 3), round(lon, 3)] for lat, lon in weather_points],
+        "weather_radius_m": WEATHER_RADIUS_M,
+    }
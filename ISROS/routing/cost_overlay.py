@@ -0,0 +1,185 @@
+import hashlib
+import threading
+import weakref
+import numpy as np
+from .csr_graph import to_unit_vectors
+from .spatial_index import get_spatial_index, km_to_chord
+
+BASE_VERSION = 'base'
+
+# Weather feed thresholds: waves (m) or wind (m/s) at or above the block
+# values close the area, below that every metre of wave height adds
+# WAVE_COST_PER_M and every m/s of wind WIND_COST_PER_MS to the multiplier
+BLOCK_WAVE_HEIGHT_M = 8.0
+BLOCK_WIND_SPEED_MS = 25.0
+WAVE_COST_PER_M = 0.05
+WIND_COST_PER_MS = 0.01
+
+
+def weather_multiplier(data):
+    """(multiplier, blocked) for one weather reading."""
+    wave = data.get("waveHeight") or 0.0
+    wind = data.get("windSpeed") or 0.0
+    if wave >= BLOCK_WAVE_HEIGHT_M or wind >= BLOCK_WIND_SPEED_MS:
+        return 1.0, True
+    return 1.0 + WAVE_COST_PER_M * wave + WIND_COST_PER_MS * wind, False
+
+
+def _token(value):
+    # Bytes of an update argument for the version hash
+    return b'' if value is None else np.asarray(value, dtype=np.float32).tobytes()
+
+
+class CostOverlay:
+    """Search-time costs layered over the static weights of a CSRGraph.
+
+    The cost of an edge is its base length times the multiplier of the node
+    it enters and, once any edge was set, its own multiplier; edges into a
+    blocked node or blocked themselves cost inf. Nodes the graph build marked
+    as not walkable start out blocked. Multipliers are kept at 1 or above so
+    the haversine and landmark bounds stay admissible.
+
+    Updates change the arrays in place and move ``version`` on, which is what
+    route caches key on. The version is a hash chain over the updates, so
+    workers that apply the same updates in the same order agree on it.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.node_multiplier = np.ones(graph.number_of_nodes(), dtype=np.float32)
+        self.base_blocked = np.zeros(graph.number_of_nodes(), dtype=bool) if graph.walkable is None \
+            else ~np.asarray(graph.walkable, dtype=bool)
+        self.node_blocked = self.base_blocked.copy()
+        # Per-edge layers are only allocated once an edge is set, they are as
+        # long as the CSR indices
+        self.edge_multiplier = None
+        self.edge_blocked = None
+        self.version = BASE_VERSION
+        self._lock = threading.Lock()
+
+    def is_base(self):
+        return self.version == BASE_VERSION
+
+    def cost(self, node, g, edges, neighbors, weights):
+        # SearchEngine cost callback
+        weights = weights * self.node_multiplier[neighbors]
+        blocked = self.node_blocked[neighbors]
+        if self.edge_multiplier is not None:
+            weights *= self.edge_multiplier[edges]
+            blocked = blocked | self.edge_blocked[edges]
+        weights[blocked] = np.inf
+        return weights
+
+    def reverse_cost(self, node, g, edges, neighbors, weights):
+        # Cost callback of a backward search: the weights of the edges from
+        # neighbors into node, which sit at the reverse positions of edges
+        if self.node_blocked[node]:
+            return np.full(len(weights), np.inf)
+        weights = weights * self.node_multiplier[node]
+        if self.edge_multiplier is not None:
+            reverse = self.graph.reverse_edges()[edges]
+            weights *= self.edge_multiplier[reverse]
+            weights[self.edge_blocked[reverse]] = np.inf
+        return weights
+
+    def edge_weights(self):
+        """Effective weight of every CSR edge, for whole-graph algorithms."""
+        weights = np.asarray(self.graph.weights, dtype=np.float64) * self.node_multiplier[self.graph.indices]
+        blocked = self.node_blocked[self.graph.indices]
+        if self.edge_multiplier is not None:
+            weights *= self.edge_multiplier
+            blocked |= self.edge_blocked
+        weights[blocked] = np.inf
+        return weights
+
+    def is_blocked(self, node):
+        return bool(self.node_blocked[node])
+
+    def _bump(self, *update):
+        # Called with the lock held
+        digest = hashlib.md5(repr((self.version,) + update).encode()).hexdigest()[:12]
+        self.version = digest
+
+    def set_nodes(self, nodes, multiplier=None, blocked=None):
+        """Set the multiplier and/or blocked flag of node ids, returns them."""
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        with self._lock:
+            if multiplier is not None:
+                self.node_multiplier[nodes] = np.maximum(np.asarray(multiplier, dtype=np.float32), 1.0)
+            if blocked is not None:
+                self.node_blocked[nodes] = blocked
+            self._bump('nodes', nodes.tobytes(), _token(multiplier), blocked)
+        return nodes
+
+    def set_edges(self, edges, multiplier=None, blocked=None):
+        """Same as set_nodes for CSR edge positions (one direction of an edge)."""
+        edges = np.unique(np.asarray(edges, dtype=np.int64))
+        with self._lock:
+            if self.edge_multiplier is None:
+                self.edge_multiplier = np.ones(len(self.graph.indices), dtype=np.float32)
+                self.edge_blocked = np.zeros(len(self.graph.indices), dtype=bool)
+            if multiplier is not None:
+                self.edge_multiplier[edges] = np.maximum(np.asarray(multiplier, dtype=np.float32), 1.0)
+            if blocked is not None:
+                self.edge_blocked[edges] = blocked
+            self._bump('edges', edges.tobytes(), _token(multiplier), blocked)
+        return edges
+
+    def region_nodes(self, latitude, longitude, radius_km):
+        tree = get_spatial_index(self.graph).tree
+        point = to_unit_vectors(np.array([latitude]), np.array([longitude]))[0]
+        return np.asarray(tree.query_ball_point(point, float(km_to_chord(radius_km))), dtype=np.int64)
+
+    def set_region(self, latitude, longitude, radius_km, multiplier=None, blocked=None):
+        """Apply a multiplier and/or block flag to every node within radius_km of a point."""
+        return self.set_nodes(self.region_nodes(latitude, longitude, radius_km), multiplier, blocked)
+
+    def reset_region(self, latitude, longitude, radius_km):
+        """Return the nodes of a region to their base costs."""
+        nodes = self.region_nodes(latitude, longitude, radius_km)
+        with self._lock:
+            self.node_multiplier[nodes] = 1.0
+            self.node_blocked[nodes] = self.base_blocked[nodes]
+            self._bump('reset', nodes.tobytes())
+        return nodes
+
+    def apply_weather(self, weather_data, radius_km=50.0):
+        """Set regional costs from weather readings, e.g. the entries of
+        weather.get_path_weather: dicts with lat, lon and weather fields."""
+        points = [(item["lat"], item["lon"]) + weather_multiplier(item) for item in weather_data]
+        if not points:
+            return np.empty(0, dtype=np.int64)
+        lat, lon, multipliers, blocked = (np.array(column) for column in zip(*points))
+        tree = get_spatial_index(self.graph).tree
+        regions = tree.query_ball_point(to_unit_vectors(lat, lon), float(km_to_chord(radius_km)))
+
+        touched = []
+        with self._lock:
+            for nodes, multiplier, block in zip(regions, multipliers, blocked):
+                nodes = np.asarray(nodes, dtype=np.int64)
+                self.node_multiplier[nodes] = np.maximum(self.node_multiplier[nodes], multiplier)
+                self.node_blocked[nodes] |= block
+                touched.append(nodes)
+            self._bump('weather', lat.tobytes(), lon.tobytes(), multipliers.tobytes(), blocked.tobytes(), radius_km)
+        return np.unique(np.concatenate(touched))
+
+    def reset(self):
+        with self._lock:
+            self.node_multiplier[:] = 1.0
+            self.node_blocked[:] = self.base_blocked
+            self.edge_multiplier = None
+            self.edge_blocked = None
+            self.version = BASE_VERSION
+
+
+_overlays = weakref.WeakKeyDictionary()
+_overlays_lock = threading.Lock()
+
+
+def get_cost_overlay(graph):
+    with _overlays_lock:
+        overlay = _overlays.get(graph)
+        if overlay is None:
+            overlay = CostOverlay(graph)
+            _overlays[graph] = overlay
+        return overlay
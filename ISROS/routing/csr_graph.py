@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+# Files making up an exported sea graph. Everything that scales with the graph
+# is a plain .npy array so it can be memory-mapped; the metadata is tiny JSON.
+META_FILE = 'meta.json'
+LAT_FILE = 'lat.npy'
+LON_FILE = 'lon.npy'
+INDPTR_FILE = 'indptr.npy'
+INDICES_FILE = 'indices.npy'
+WEIGHTS_FILE = 'weights.npy'
+WALKABLE_FILE = 'walkable.npy'
+WEATHER_NODES_FILE = 'weather_nodes.npy'
+COMPONENTS_FILE = 'components.npy'
+COMPONENT_SIZES_FILE = 'component_sizes.npy'
+UNIT_VECTORS_FILE = 'unit_vectors.npy'
+SPATIAL_INDEX_FILE = 'spatial_index.pkl'
+LANDMARKS_FILE = 'landmarks.npy'
+LANDMARK_DISTANCES_FILE = 'landmark_distances.npy'
+
+# Files derived from the graph after export, cleared whenever it is re-exported
+DERIVED_FILES = [UNIT_VECTORS_FILE, SPATIAL_INDEX_FILE, LANDMARKS_FILE, LANDMARK_DISTANCES_FILE]
+
+FORMAT_VERSION = 1
+
+
+class CSRGraph:
+    """Read-only sea graph stored as compressed sparse rows.
+
+    Node ``i`` sits at ``(lat[i], lon[i])`` and its neighbours are
+    ``indices[indptr[i]:indptr[i + 1]]`` with the matching edge lengths (km)
+    in ``weights``. Every undirected edge is stored once in each direction.
+    """
+
+    def __init__(self, lat, lon, indptr, indices, weights, walkable=None, weather_nodes=None, meta=None, directory=None,
+                 components=None, component_sizes=None):
+        self.lat = lat
+        self.lon = lon
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.walkable = walkable
+        self.weather_nodes = weather_nodes if weather_nodes is not None else np.empty(0, dtype=np.int64)
+        self.meta = meta or {}
+        self.directory = directory
+        self._unit_vectors = None
+        self._reverse_edges = None
+        if components is None:
+            components, component_sizes = label_components(indptr, indices)
+        self.components = components
+        self.component_sizes = component_sizes
+
+    @property
+    def version(self):
+        return self.meta.get('version', '')
+
+    def number_of_nodes(self):
+        return len(self.lat)
+
+    def number_of_edges(self):
+        # Each undirected edge is stored in both directions
+        return len(self.indices) // 2
+
+    def __len__(self):
+        return self.number_of_nodes()
+
+    def degree(self, node):
+        return int(self.indptr[node + 1] - self.indptr[node])
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def same_component(self, node1, node2):
+        # O(1) reachability test against the precomputed labels
+        return self.components[node1] == self.components[node2]
+
+    def component_size(self, node):
+        return int(self.component_sizes[self.components[node]])
+
+    def number_of_components(self):
+        return len(self.component_sizes)
+
+    def neighbors(self, node):
+        start, end = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:end], self.weights[start:end]
+
+    def coord(self, node):
+        # float32 storage is accurate to ~1 m, round away the representation noise
+        return (round(float(self.lat[node]), 5), round(float(self.lon[node]), 5))
+
+    def coords(self, nodes):
+        return [self.coord(node) for node in nodes]
+
+    def coordinate_array(self):
+        return np.column_stack((self.lat, self.lon))
+
+    def unit_vectors(self):
+        # Nodes as (x, y, z) points on the unit sphere, i.e. the sin/cos of every
+        # latitude and longitude folded together. Persisted next to the graph so
+        # the trigonometry is paid once per build rather than once per process.
+        if self._unit_vectors is None:
+            path = os.path.join(self.directory, UNIT_VECTORS_FILE) if self.directory else None
+            if path and os.path.isfile(path):
+                self._unit_vectors = np.load(path, mmap_mode='r')
+            else:
+                self._unit_vectors = to_unit_vectors(self.lat, self.lon)
+                if path:
+                    try:
+                        np.save(path, self._unit_vectors)
+                    except OSError:
+                        pass
+        return self._unit_vectors
+
+    def reverse_edges(self):
+        # CSR position of the opposite direction of every edge, so that
+        # indices[reverse_edges()[e]] is the source node of edge e
+        if self._reverse_edges is None:
+            n = self.number_of_nodes()
+            sources = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr))
+            targets = np.asarray(self.indices, dtype=np.int64)
+            # Rows are contiguous, so sorting by (source, target) only sorts within rows
+            keys = sources * n + targets
+            order = np.argsort(keys, kind='stable')
+            self._reverse_edges = order[np.searchsorted(keys[order], targets * n + sources)]
+        return self._reverse_edges
+
+
+def to_unit_vectors(lat, lon):
+    lat_rad = np.radians(np.asarray(lat, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat_rad)
+    return np.column_stack((cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)))
+
+
+def label_components(indptr, indices):
+    num_nodes = len(indptr) - 1
+    adjacency = csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr), shape=(num_nodes, num_nodes))
+    _, labels = connected_components(adjacency, directed=False)
+    labels = labels.astype(np.int32)
+    return labels, np.bincount(labels).astype(np.int64)
+
+
+def save_components(directory, components, component_sizes):
+    np.save(os.path.join(directory, COMPONENTS_FILE), components)
+    np.save(os.path.join(directory, COMPONENT_SIZES_FILE), component_sizes)
+
+
+def _edges_to_csr(num_nodes, src, dst, weights):
+    # Store both directions and group the edges by source node
+    rows = np.concatenate((src, dst))
+    cols = np.concatenate((dst, src))
+    data = np.concatenate((weights, weights)).astype(np.float32)
+
+    order = np.argsort(rows, kind='stable')
+    indices = cols[order].astype(np.int32 if num_nodes < 2**31 else np.int64)
+    data = data[order]
+
+    counts = np.bincount(rows, minlength=num_nodes)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, indices, data
+
+
+def save_csr_arrays(directory, lat, lon, src, dst, weights, walkable=None, weather_nodes=None):
+    """Write an undirected edge list as a memory-mappable CSR graph."""
+    os.makedirs(directory, exist_ok=True)
+    num_nodes = len(lat)
+
+    for name in [META_FILE] + DERIVED_FILES:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    indptr, indices, data = _edges_to_csr(num_nodes, np.asarray(src, dtype=np.int64),
+                                          np.asarray(dst, dtype=np.int64), np.asarray(weights))
+
+    np.save(os.path.join(directory, LAT_FILE), np.asarray(lat, dtype=np.float32))
+    np.save(os.path.join(directory, LON_FILE), np.asarray(lon, dtype=np.float32))
+    np.save(os.path.join(directory, INDPTR_FILE), indptr)
+    np.save(os.path.join(directory, INDICES_FILE), indices)
+    np.save(os.path.join(directory, WEIGHTS_FILE), data)
+
+    if walkable is None:
+        walkable = np.ones(num_nodes, dtype=bool)
+    np.save(os.path.join(directory, WALKABLE_FILE), np.asarray(walkable, dtype=bool))
+
+    if weather_nodes is None:
+        weather_nodes = []
+    np.save(os.path.join(directory, WEATHER_NODES_FILE), np.asarray(weather_nodes, dtype=np.int64))
+
+    # Connected components are labelled once here so reachability checks are lookups
+    components, component_sizes = label_components(indptr, indices)
+    save_components(directory, components, component_sizes)
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'num_nodes': int(num_nodes),
+        'num_edges': int(len(indices) // 2),
+        'num_components': int(len(component_sizes)),
+        'version': f"{int(time.time())}-{num_nodes}-{len(indices) // 2}",
+    }
+    # Metadata is written last so a half-written export is never picked up
+    with open(os.path.join(directory, META_FILE), 'w') as file:
+        json.dump(meta, file)
+
+    print(f"CSR graph saved to {directory} with {meta['num_nodes']} nodes and {meta['num_edges']} edges.")
+    return meta
+
+
+def export_csr_graph(G, directory, weather_nodes=None):
+    """Convert a networkx sea graph with (lat, lon) nodes to the CSR format."""
+    nodes = list(G.nodes)
+    node_index = {node: i for i, node in enumerate(nodes)}
+
+    coords = np.array(nodes, dtype=np.float64)
+    num_edges = G.number_of_edges()
+    src = np.empty(num_edges, dtype=np.int64)
+    dst = np.empty(num_edges, dtype=np.int64)
+    weights = np.empty(num_edges, dtype=np.float64)
+    for i, (u, v, w) in enumerate(G.edges(data='weight')):
+        src[i] = node_index[u]
+        dst[i] = node_index[v]
+        weights[i] = w
+
+    walkable = np.fromiter((G.nodes[node].get('walkable', True) for node in nodes), dtype=bool, count=len(nodes))
+    weather_ids = [node_index[node] for node in (weather_nodes or []) if node in node_index]
+
+    return save_csr_arrays(directory, coords[:, 0], coords[:, 1], src, dst, weights, walkable, weather_ids)
+
+
+def csr_graph_exists(directory):
+    return os.path.isfile(os.path.join(directory, META_FILE))
+
+
+def load_csr_graph(directory, mmap_mode='r'):
+    """Load an exported graph. With mmap_mode='r' the arrays stay in the page
+    cache and are shared between every process that maps them."""
+    with open(os.path.join(directory, META_FILE)) as file:
+        meta = json.load(file)
+
+    def load(name):
+        return np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+
+    indptr = load(INDPTR_FILE)
+    indices = load(INDICES_FILE)
+
+    # Exports from before component labelling get their labels computed and stored now
+    if os.path.isfile(os.path.join(directory, COMPONENTS_FILE)):
+        components, component_sizes = load(COMPONENTS_FILE), load(COMPONENT_SIZES_FILE)
+    else:
+        components, component_sizes = label_components(indptr, indices)
+        save_components(directory, components, component_sizes)
+
+    return CSRGraph(
+        lat=load(LAT_FILE),
+        lon=load(LON_FILE),
+        indptr=indptr,
+        indices=indices,
+        weights=load(WEIGHTS_FILE),
+        walkable=load(WALKABLE_FILE),
+        weather_nodes=np.load(os.path.join(directory, WEATHER_NODES_FILE)),
+        meta=meta,
+        directory=directory,
+        components=components,
+        component_sizes=component_sizes,
+    )
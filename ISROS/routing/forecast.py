@@ -0,0 +1,170 @@
+import os
+import json
+import threading
+import numpy as np
+from scipy.spatial import cKDTree
+from .csr_graph import to_unit_vectors
+from .cost_overlay import BLOCK_WAVE_HEIGHT_M, BLOCK_WIND_SPEED_MS
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+forecast_dir = os.path.join(script_dir, 'grid_map', 'forecast')
+
+# Layout of a forecast directory:
+#   forecast.json     start time (unix seconds), hours between layers, layer
+#                     count and the graph version the layers were sampled for
+#   layer_0000.npy    (nodes, 2) float32 wave height (m) and wind speed (m/s)
+#                     at every graph node, one file per time bucket
+FORECAST_FILE = 'forecast.json'
+FIELDS = ["waveHeight", "windSpeed"]
+
+# Fraction of the calm-water speed lost per metre of waves and per m/s of wind,
+# a ship never drops below MIN_SPEED_FACTOR outside the blocked conditions
+WAVE_SPEED_LOSS_PER_M = 0.04
+WIND_SPEED_LOSS_PER_MS = 0.005
+MIN_SPEED_FACTOR = 0.3
+
+
+def layer_path(directory, k):
+    return os.path.join(directory, f"layer_{k:04d}.npy")
+
+
+def weather_speed_factor(wave_height, wind_speed):
+    """Fraction of the calm-water speed a ship makes in the given conditions,
+    0 where they are bad enough to close the area. Missing values (NaN) count
+    as calm."""
+    wave_height = np.nan_to_num(np.asarray(wave_height, dtype=np.float64))
+    wind_speed = np.nan_to_num(np.asarray(wind_speed, dtype=np.float64))
+    factor = np.clip(1 - WAVE_SPEED_LOSS_PER_M * wave_height - WIND_SPEED_LOSS_PER_MS * wind_speed,
+                     MIN_SPEED_FACTOR, 1.0)
+    return np.where((wave_height >= BLOCK_WAVE_HEIGHT_M) | (wind_speed >= BLOCK_WIND_SPEED_MS), 0.0, factor)
+
+
+def readings_to_layer(graph, readings):
+    """Sample point readings ({"lat", "lon", "waveHeight", "windSpeed"} dicts)
+    onto every graph node, each node taking the values of its nearest reading."""
+    lat = np.array([float(item["lat"]) for item in readings])
+    lon = np.array([float(item["lon"]) for item in readings])
+    values = np.array([[np.nan if item.get(name) is None else float(item[name]) for name in FIELDS]
+                       for item in readings], dtype=np.float32).reshape(-1, len(FIELDS))
+    _, nearest = cKDTree(to_unit_vectors(lat, lon)).query(graph.unit_vectors(), k=1)
+    return values[nearest]
+
+
+def save_forecast_layers(layers, start_time, step_hours, graph_version, directory=forecast_dir):
+    """Write (nodes, 2) layers, one per step_hours starting at start_time. The
+    header goes last so readers never see a half-written forecast."""
+    os.makedirs(directory, exist_ok=True)
+    for k, layer in enumerate(layers):
+        np.save(layer_path(directory, k), np.asarray(layer, dtype=np.float32))
+    header = {'start_time': float(start_time), 'step_hours': float(step_hours), 'layers': len(layers),
+              'graph_version': graph_version}
+    with open(os.path.join(directory, FORECAST_FILE), 'w') as file:
+        json.dump(header, file)
+
+
+class ForecastLayers:
+    """Time-bucketed forecast, read lazily.
+
+    Only the header is read up front. A layer is memory-mapped the first
+    time a search asks for its time bucket, and only the rows of the nodes
+    on the search frontier are ever paged in. Times before the first layer
+    use the first one, times past the horizon the last one.
+    """
+
+    def __init__(self, directory=forecast_dir):
+        with open(os.path.join(directory, FORECAST_FILE)) as file:
+            header = json.load(file)
+        self.directory = directory
+        self.start_time = header['start_time']
+        self.step_hours = header['step_hours']
+        self.num_layers = header['layers']
+        self.graph_version = header['graph_version']
+        self._layers = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, timestamp):
+        k = int((timestamp - self.start_time) // (self.step_hours * 3600))
+        return min(max(k, 0), self.num_layers - 1)
+
+    def layer(self, k):
+        layer = self._layers.get(k)
+        if layer is None:
+            with self._lock:
+                layer = self._layers.get(k)
+                if layer is None:
+                    layer = np.load(layer_path(self.directory, k), mmap_mode='r')
+                    self._layers[k] = layer
+        return layer
+
+    def loaded_layers(self):
+        return sorted(self._layers)
+
+    def speed_factors(self, timestamp, nodes):
+        values = self.layer(self.bucket(timestamp))[nodes]
+        return weather_speed_factor(values[:, 0], values[:, 1])
+
+
+_forecasts = {}
+
+
+def get_forecast(directory=forecast_dir):
+    # None until a forecast has been written
+    if directory not in _forecasts:
+        if not os.path.isfile(os.path.join(directory, FORECAST_FILE)):
+            return None
+        _forecasts[directory] = ForecastLayers(directory)
+    return _forecasts[directory]
+
+
+def travel_time_heuristic(heuristic, speed_kmh):
+    # Turns a distance bound (km) into a time bound (hours). Weather only ever
+    # slows a ship down, so dividing by the calm-water speed stays admissible.
+    def factory(engine, goal):
+        distance = heuristic(engine, goal)
+
+        def bound(nodes):
+            return distance(nodes) / speed_kmh
+
+        return bound
+
+    return factory
+
+
+class TravelTimeCost:
+    """SearchEngine cost callback giving edge costs in hours.
+
+    ``g`` of an expanded node is the time since departure, so each edge is
+    costed with the forecast bucket the ship reaches its start in. The edge
+    length comes from the cost overlay when one is given, so blocked areas
+    and multipliers still apply.
+    """
+
+    def __init__(self, forecast, departure_time, speed_kmh, overlay=None):
+        self.forecast = forecast
+        self.departure_time = departure_time
+        self.speed_kmh = speed_kmh
+        self.overlay = overlay
+
+    def __call__(self, node, g, edges, neighbors, weights):
+        if self.overlay is not None:
+            weights = self.overlay.cost(node, g, edges, neighbors, weights)
+        speed = np.full(len(neighbors), self.speed_kmh)
+        if self.forecast is not None:
+            speed = speed * self.forecast.speed_factors(self.departure_time + g * 3600, neighbors)
+        hours = np.full(len(neighbors), np.inf)
+        np.divide(weights, speed, out=hours, where=speed > 0)
+        return hours
+
+
+def arrival_hours(graph, nodes, cost):
+    """Hours after departure at which the ship reaches every node of a path,
+    replaying the cost callback along it."""
+    hours = [0.0]
+    for node, next_node in zip(nodes[:-1], nodes[1:]):
+        start_edge = int(graph.indptr[node])
+        neighbors = graph.indices[start_edge:int(graph.indptr[node + 1])]
+        edge = start_edge + int(np.flatnonzero(neighbors == next_node)[0])
+        weight = cost(node, hours[-1], slice(edge, edge + 1), graph.indices[edge:edge + 1],
+                      graph.weights[edge:edge + 1].astype(np.float64))
+        hours.append(hours[-1] + float(weight[0]))
+    return hours
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+
+def resident_memory_mb():
+    # Current resident set size, from /proc where available, else the peak
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_sea_graph():
+    # Imported here so nothing of the graph stack is loaded before the first route
+    from .graph_update import generate_or_load_csr_graph, file_path, graph_file_path, csr_graph_dir
+    return generate_or_load_csr_graph(file_path, graph_file_path, csr_graph_dir)
+
+
+class GraphProvider:
+    """Loads the sea graph on first use and hands out the same instance after.
+
+    The graph arrays are memory-mapped read-only, so processes forked after
+    the load (gunicorn --preload, see preload_graph) share one copy of them
+    in the page cache instead of each reading the graph again.
+    """
+
+    def __init__(self, loader=load_sea_graph):
+        self.loader = loader
+        self.graph = None
+        self.load_seconds = None
+        self.rss_before_mb = None
+        self.rss_after_mb = None
+        self.loaded_in_pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        graph = self.graph
+        if graph is None:
+            with self._lock:
+                if self.graph is None:
+                    self._load()
+                graph = self.graph
+        return graph
+
+    def _load(self):
+        # Called with the lock held
+        self.rss_before_mb = resident_memory_mb()
+        start_time = time.perf_counter()
+        graph = self.loader()
+        self.load_seconds = time.perf_counter() - start_time
+        self.rss_after_mb = resident_memory_mb()
+        self.loaded_in_pid = os.getpid()
+        self.graph = graph
+        print(f"Graph loaded in {self.load_seconds:.2f}s, resident memory "
+              f"{self.rss_before_mb:.0f} MB -> {self.rss_after_mb:.0f} MB.")
+
+    def is_loaded(self):
+        return self.graph is not None
+
+    def stats(self):
+        graph = self.graph
+        return {
+            "loaded": graph is not None,
+            "nodes": graph.number_of_nodes() if graph is not None else None,
+            "version": graph.version if graph is not None else None,
+            "load_seconds": self.load_seconds,
+            "rss_before_mb": self.rss_before_mb,
+            "rss_after_mb": self.rss_after_mb,
+            "rss_now_mb": resident_memory_mb(),
+            # Differs from the current pid in workers forked after a preload
+            "loaded_in_pid": self.loaded_in_pid,
+            "pid": os.getpid(),
+        }
+
+
+graph_provider = GraphProvider()
+
+
+def get_graph():
+    return graph_provider.get()
+
+
+def preload_graph():
+    """Load the graph now, meant for a server's master process before it forks
+    its workers. Enabled from wsgi.py/asgi.py with ISROS_PRELOAD_GRAPH=1."""
+    return graph_provider.get()
@@ -1,28 +1,60 @@
 import os
 import pickle
-import networkx as nx
-import pandas as pd
 import numpy as np
 import gc
 import random
-from scipy.spatial import cKDTree
 import math
-from math import radians
-from itertools import islice
+import time
 
-from sklearn.neighbors import BallTree
+# networkx, pandas and scikit-learn are only needed to build graphs and are
+# imported by the functions that do, loading an exported graph needs none of them
+if __package__:
+    from .csr_graph import csr_graph_exists, export_csr_graph, load_csr_graph, save_csr_arrays
+else:
+    # Run as a script, python graph_update.py
+    from csr_graph import csr_graph_exists, export_csr_graph, load_csr_graph, save_csr_arrays
 
 def debug_print(message):
     print(f"DEBUG: {message}")
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
-debug_print(f"Script directory: {script_dir}")
 
 file_path = os.path.join(script_dir, 'grid_map', 'sea_grid.pkl')
 graph_file_path = os.path.join(script_dir, 'grid_map', 'sea_graph.pkl')
-debug_print(f"Grid file path: {file_path}")
+csr_graph_dir = os.path.join(script_dir, 'grid_map', 'sea_graph_csr')
 path_print = os.path.join(script_dir, 'data')
 
+EARTH_RADIUS_KM = 6371
+
+# Hand-placed waypoints through the Suez canal and the Red Sea
+SUEZ_CANAL_NODES = [
+    (31.29, 32.34),
+    (31.25, 32.30),
+    (31.10, 32.30),
+    (30.81, 32.31),
+    (30.72, 32.32),
+    (30.65, 32.34),
+    (30.57, 32.33),
+    (30.41, 32.36),
+    (24.64, 35.99),
+    (18.72, 39.15),
+    (11.48, 44.78),
+    (14.64, 52.29)
+]
+
+def peak_memory_mb():
+    # Peak resident set size of this process, ru_maxrss is in KB on Linux
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def haversine_array(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
 def haversine(lat1, lon1, lat2, lon2):
     # Convert latitude and longitude from degrees to radians
     lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
@@ -47,6 +79,8 @@ def add_weighted_edges(G):
         G[edge[0]][edge[1]]['weight'] = distance
 
 def add_edges_knn(G, nodes, k, batch_size=1000, progress_callback=None):
+    from sklearn.neighbors import BallTree
+
     nodes_rad = np.radians(nodes)
     tree = BallTree(nodes_rad, metric='haversine')
 
@@ -66,6 +100,9 @@ def add_edges_knn(G, nodes, k, batch_size=1000, progress_callback=None):
                 G.add_edge(node, neighbor)
 
 def generate_or_load_graph(file_path, graph_file, k_neighbors=8):
+    import networkx as nx
+    import pandas as pd
+    from sklearn.neighbors import BallTree
 
     def report_progress(current_index, total_nodes):
         progress = (current_index / total_nodes) * 100
@@ -92,20 +129,7 @@ def generate_or_load_graph(file_path, graph_file, k_neighbors=8):
         print(f"Graph created with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges.")
 
         # New code starts here: Add custom nodes and connect them
-    suez_canal = [
-        (31.29, 32.34),
-        (31.25, 32.30),
-        (31.10, 32.30),
-        (30.81, 32.31),
-        (30.72, 32.32),
-        (30.65, 32.34),
-        (30.57, 32.33),
-        (30.41, 32.36),
-        (24.64, 35.99),
-        (18.72, 39.15),
-        (11.48, 44.78),
-        (14.64, 52.29)
-    ]
+    suez_canal = SUEZ_CANAL_NODES
 
     # Add the new nodes to the graph
     G.add_nodes_from(suez_canal)
@@ -145,20 +169,136 @@ def generate_or_load_graph(file_path, graph_file, k_neighbors=8):
 
     return G, weather_nodes
 
-def check_graph_connectivity(G):
+def knn_edge_arrays(tree, nodes_rad, k, batch_size=100000, progress_callback=None):
+    # Query the kNN of every node in bulk and keep each undirected edge once,
+    # reusing the BallTree's haversine distances as the edge weights
+    num_nodes = len(nodes_rad)
+    keys = []
+    weights = []
+
+    for i in range(0, num_nodes, batch_size):
+        if progress_callback is not None:
+            progress_callback(i, num_nodes)
+
+        distances, indices = tree.query(nodes_rad[i:i + batch_size], k + 1)
+        src = np.repeat(np.arange(i, i + len(indices), dtype=np.int64), k + 1)
+        dst = indices.ravel().astype(np.int64)
+        not_self = src != dst
+
+        keys.append(edge_keys(src[not_self], dst[not_self], num_nodes))
+        weights.append((distances.ravel()[not_self] * EARTH_RADIUS_KM).astype(np.float32))
+
+    return unique_edges(np.concatenate(keys), np.concatenate(weights), num_nodes)
+
+def edge_keys(src, dst, num_nodes):
+    # One int64 key per undirected edge, independent of its direction
+    return np.minimum(src, dst) * num_nodes + np.maximum(src, dst)
+
+def unique_edges(keys, weights, num_nodes):
+    keys, first = np.unique(keys, return_index=True)
+    return keys // num_nodes, keys % num_nodes, weights[first]
+
+def build_csr_graph(file_path, csr_dir, k_neighbors=8, weather_node_count=50, batch_size=100000):
+    # Builds the CSR graph straight from the sea grid columns without networkx
+    import pandas as pd
+    from sklearn.neighbors import BallTree
 
-    if nx.is_connected(G):
+    start_time = time.perf_counter()
+
+    def report(stage):
+        print(f"{stage} ({time.perf_counter() - start_time:.1f}s elapsed, peak memory {peak_memory_mb():.0f} MB)")
+
+    def report_progress(current_index, total_nodes):
+        progress = (current_index / total_nodes) * 100
+        print(f"Querying neighbours: {progress:.2f}% complete.")
+
+    sea_grid = pd.read_pickle(file_path)
+    is_water = sea_grid['is_water'].to_numpy(dtype=bool)
+    lat = sea_grid['latitude'].to_numpy(dtype=np.float64)[is_water]
+    lon = sea_grid['longitude'].to_numpy(dtype=np.float64)[is_water]
+    del sea_grid, is_water
+    gc.collect()
+    num_sea_nodes = len(lat)
+    report(f"Loaded {num_sea_nodes} water nodes")
+
+    nodes_rad = np.radians(np.column_stack((lat, lon)))
+    tree = BallTree(nodes_rad, metric='haversine')
+    report("BallTree built")
+
+    src, dst, weights = knn_edge_arrays(tree, nodes_rad, k_neighbors, batch_size, report_progress)
+    report(f"{len(src)} unique kNN edges")
+
+    # Suez canal waypoints are chained together and each joined to its nearest node
+    suez = np.array(SUEZ_CANAL_NODES, dtype=np.float64)
+    suez_ids = np.arange(num_sea_nodes, num_sea_nodes + len(suez), dtype=np.int64)
+    sea_dist, sea_nearest = tree.query(np.radians(suez), k=1)
+    sea_dist = sea_dist[:, 0] * EARTH_RADIUS_KM
+    suez_dist = haversine_array(suez[:, None, 0], suez[:, None, 1], suez[None, :, 0], suez[None, :, 1])
+    np.fill_diagonal(suez_dist, np.inf)
+    nearest = np.where(suez_dist.min(axis=1) < sea_dist, suez_ids[suez_dist.argmin(axis=1)], sea_nearest[:, 0])
+    nearest_dist = np.minimum(suez_dist.min(axis=1), sea_dist)
+
+    extra_src = np.concatenate((suez_ids[:-1], suez_ids))
+    extra_dst = np.concatenate((suez_ids[1:], nearest))
+    extra_weights = np.concatenate((haversine_array(suez[:-1, 0], suez[:-1, 1], suez[1:, 0], suez[1:, 1]), nearest_dist))
+    # The nearest node of a waypoint is often its neighbour in the chain
+    num_nodes = num_sea_nodes + len(suez)
+    extra_src, extra_dst, extra_weights = unique_edges(edge_keys(extra_src, extra_dst, num_nodes), extra_weights, num_nodes)
+
+    lat = np.concatenate((lat, suez[:, 0]))
+    lon = np.concatenate((lon, suez[:, 1]))
+    src = np.concatenate((src, extra_src))
+    dst = np.concatenate((dst, extra_dst))
+    weights = np.concatenate((weights, extra_weights.astype(np.float32)))
+
+    # Random weather nodes with their 20 nearest neighbours marked as non walkable
+    walkable = np.ones(len(lat), dtype=bool)
+    weather_nodes = np.array(random.sample(range(num_sea_nodes), min(weather_node_count, num_sea_nodes)), dtype=np.int64)
+    if len(weather_nodes):
+        _, blocked = tree.query(nodes_rad[weather_nodes], k=min(21, num_sea_nodes))
+        blocked = blocked[blocked != weather_nodes[:, None]]
+        walkable[blocked] = False
+    del tree, nodes_rad
+    gc.collect()
+
+    save_csr_arrays(csr_dir, lat, lon, src, dst, weights, walkable, weather_nodes)
+    report("Graph build finished")
+
+def generate_or_load_csr_graph(file_path, graph_file, csr_dir, k_neighbors=8):
+    # The CSR export is the runtime format. An existing networkx pickle is
+    # converted as is, otherwise the graph is built straight from the sea grid.
+    if not csr_graph_exists(csr_dir):
+        if os.path.isfile(graph_file):
+            print(f"CSR graph not found at {csr_dir}. Exporting from the networkx graph...")
+            G, weather_nodes = generate_or_load_graph(file_path, graph_file, k_neighbors)
+            export_csr_graph(G, csr_dir, weather_nodes)
+            del G
+            gc.collect()
+        else:
+            print(f"CSR graph not found at {csr_dir}. Building it from the sea grid...")
+            build_csr_graph(file_path, csr_dir, k_neighbors)
+
+    print(f"Loading CSR graph from {csr_dir}...")
+    return load_csr_graph(csr_dir, mmap_mode='r')
+
+def check_graph_connectivity(G):
+    # G is a CSRGraph, its component labels are computed when it is exported or loaded
+    sizes = np.sort(G.component_sizes)[::-1]
+    if len(sizes) == 1:
         print("The graph is connected.")
         return True
     else:
-        print("The graph is not connected.")
+        print(f"The graph is not connected: {len(sizes)} components.")
+        print(f"Largest component sizes: {sizes[:10].tolist()}")
+        print(f"Isolated nodes: {int(np.count_nonzero(sizes == 1))}")
         return False
     
 def write_isolated_nodes_to_file(graph, output_file="isolated_nodes.txt", checkpoint_file="checkpoint.txt", write_to_file=True):
+    # graph is a CSRGraph, a node without edges is isolated
     if graph is None:
         raise ValueError("No graph object provided. Ensure the graph is loaded correctly.")
-    
-    isolated_nodes = list(nx.isolates(graph))
+
+    isolated_nodes = np.flatnonzero(graph.degrees() == 0)
     debug_print(f"There are {len(isolated_nodes)} isolated nodes in the graph.")
     
     last_processed_index = 0
@@ -169,13 +309,10 @@ def write_isolated_nodes_to_file(graph, output_file="isolated_nodes.txt", checkp
         debug_print(f"Resuming from index: {last_processed_index}")  # Debug print for resuming index
     
     batch_size = 1000  # Process nodes in batches
-    node_infos = []  # Buffer for isolated node information
 
     # Determine the latitude and longitude bounds
-    lats = [node[0] for node in graph.nodes]
-    lons = [node[1] for node in graph.nodes]
-    lat_min, lat_max = min(lats), max(lats)
-    lon_min, lon_max = min(lons), max(lons)
+    lat_min, lat_max = float(np.min(graph.lat)), float(np.max(graph.lat))
+    lon_min, lon_max = float(np.min(graph.lon)), float(np.max(graph.lon))
 
     # Divide the area into blocks (e.g., 4x5 grid)
     lat_blocks = np.linspace(lat_min, lat_max, 5) # Adjust the number of blocks as needed
@@ -185,26 +322,25 @@ def write_isolated_nodes_to_file(graph, output_file="isolated_nodes.txt", checkp
     block_counts = {(i, j): 0 for i in range(len(lat_blocks)-1) for j in range(len(lon_blocks)-1)}
 
     if write_to_file:
+        pending = isolated_nodes[last_processed_index:]
+        lats = np.round(np.asarray(graph.lat[pending], dtype=np.float64), 5)
+        lons = np.round(np.asarray(graph.lon[pending], dtype=np.float64), 5)
+
+        # Assign isolated nodes to blocks, the upper edges belong to no block
+        lat_block = np.searchsorted(lat_blocks, lats, side='right') - 1
+        lon_block = np.searchsorted(lon_blocks, lons, side='right') - 1
+        inside = (lat_block >= 0) & (lat_block < len(lat_blocks) - 1) & (lon_block >= 0) & (lon_block < len(lon_blocks) - 1)
+        for i, j in zip(lat_block[inside], lon_block[inside]):
+            block_counts[(int(i), int(j))] += 1
+
         with open(output_file, 'a') as file:
-            for i in range(last_processed_index, len(isolated_nodes)):
-                node = isolated_nodes[i]
-                node_infos.append(f"{node[0]},{node[1]}\n")
-
-                # Assign isolated nodes to blocks
-                lat, lon = node
-                for i in range(len(lat_blocks)-1):
-                    for j in range(len(lon_blocks)-1):
-                        if lat_blocks[i] <= lat < lat_blocks[i+1] and lon_blocks[j] <= lon < lon_blocks[j+1]:
-                            block_counts[(i, j)] += 1
-
-                # Write in batches and update the checkpoint file
-                if len(node_infos) >= batch_size or i == len(isolated_nodes) - 1:
-                    file.writelines(node_infos)  # Write buffered node information
-                    node_infos = []  # Clear the buffer
-                    
-                    # Update the checkpoint
-                    with open(checkpoint_file, 'w') as f:
-                        f.write(str(i))
+            # Write in batches and update the checkpoint file
+            for start in range(0, len(pending), batch_size):
+                end = min(start + batch_size, len(pending))
+                file.writelines(f"{lat},{lon}\n" for lat, lon in zip(lats[start:end], lons[start:end]))
+                file.flush()
+                with open(checkpoint_file, 'w') as f:
+                    f.write(str(last_processed_index + end))
                     
     # Debug print to show the block counts
     for block, count in block_counts.items():
@@ -224,8 +360,10 @@ if __name__ == "__main__":
     file_path = os.path.join(script_dir, 'grid_map', 'sea_grid.pkl')
     graph_file_path = os.path.join(script_dir, 'grid_map', 'sea_graph.pkl')
 
-    # Generate the graph with nodes and edges, or load from file if already generated
-    G = generate_or_load_graph(file_path, graph_file_path)
+    csr_graph_dir = os.path.join(script_dir, 'grid_map', 'sea_graph_csr')
+
+    # Rebuild the runtime CSR graph straight from the sea grid
+    build_csr_graph(file_path, csr_graph_dir)
 
     # Check if the graph is connected
-    connected = check_graph_connectivity(G)
+    connected = check_graph_connectivity(load_csr_graph(csr_graph_dir))
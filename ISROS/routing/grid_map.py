@@ -1,80 +1,201 @@
 import os
+import json
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Point
+import shapely
 import pickle
 import logging
 import numpy as np
 from multiprocessing import Pool
 from shapely.ops import unary_union
+from .land_mask import LandMask, land_mask_dir, land_mask_path
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
+# Land geometry of the current worker process, set once by the pool initializer
+_worker_land = None
+
+def _init_worker(land_wkb):
+    global _worker_land
+    _worker_land = shapely.from_wkb(land_wkb)
+
+def _classify_tile(tile):
+    # Clip the land to the tile (padded so no grid point sits on the clip edge),
+    # prepare it and test every point of the tile in one vectorized call
+    tile_id, latitudes, longitudes, pad = tile
+    clipped = shapely.clip_by_rect(_worker_land, longitudes[0] - pad, latitudes[0] - pad,
+                                   longitudes[-1] + pad, latitudes[-1] + pad)
+    lon_grid, lat_grid = np.meshgrid(longitudes, latitudes)
+    if clipped.is_empty:
+        return tile_id, np.zeros(lat_grid.shape, dtype=bool)
+    shapely.prepare(clipped)
+    return tile_id, shapely.contains_xy(clipped, lon_grid, lat_grid)
+
 class GridMap:
-    def __init__(self, land_data_path, lat_min, lat_max, lon_min, lon_max, lat_step, lon_step):
+    def __init__(self, land_data_path, lat_min, lat_max, lon_min, lon_max, lat_step, lon_step,
+                 workers=None, tile_size=10.0, checkpoint_dir=None, land_mask=None):
         logging.debug("Initializing GridMap with land data from: {}".format(land_data_path))
+        self.land_data_path = land_data_path
         self.land = gpd.read_file(land_data_path)
         self.land_sindex = self.land.sindex
         self.grid_df = self.create_grid(lat_min, lat_max, lon_min, lon_max, lat_step, lon_step)
-        self.classify_land_water()
+        if land_mask is not None:
+            # Mask mode: water/land comes from a rasterized LandMask, no shapely calls
+            self.classify_with_land_mask(land_mask)
+        else:
+            self.classify_land_water(workers=workers, tile_size=tile_size, checkpoint_dir=checkpoint_dir)
 
     def create_grid(self, lat_min, lat_max, lon_min, lon_max, lat_step, lon_step):
         logging.debug("Creating grid...")
         latitudes = np.arange(lat_min, lat_max, lat_step)
         longitudes = np.arange(lon_min, lon_max, lon_step)
+        self.latitudes, self.longitudes = latitudes, longitudes
         
         # Ensure that each point is defined with latitude first, then longitude
         grid_points = np.transpose([np.repeat(latitudes, len(longitudes)), np.tile(longitudes, len(latitudes))])
         
         # Create the DataFrame
         grid_df = pd.DataFrame(grid_points, columns=['latitude', 'longitude'])
-        grid_df['geometry'] = grid_df.apply(lambda x: Point(x.longitude, x.latitude), axis=1)
+        grid_df['geometry'] = gpd.points_from_xy(grid_df['longitude'], grid_df['latitude'])
         
         # Convert the DataFrame to a GeoDataFrame
         grid_gdf = gpd.GeoDataFrame(grid_df, geometry='geometry', crs="EPSG:4326")
         return grid_gdf
 
-    def classify_land_water(self, chunk_size=1000):
-        total_points = len(self.grid_df)
-        num_chunks = (total_points // chunk_size) + 1
-        logging.debug(f"Classifying land and water in {num_chunks} chunks...")
-
+    def buffered_land_geometry(self, buffer_meters=20000):
         # Project land geometries to a CRS that uses meters (e.g., World Mercator)
         land_meters = self.land.to_crs(epsg=3395)
 
         # Apply a 20km buffer
-        buffered_land = land_meters.geometry.buffer(20000)
+        buffered_land = land_meters.geometry.buffer(buffer_meters)
         
-        # Merge all land geometries into a single geometry for faster spatial join
+        # Merge all land geometries into a single geometry
         merged_land = unary_union(buffered_land)
         
         # Re-project back to the original CRS (EPSG:4326)
-        merged_land = gpd.GeoSeries([merged_land], crs=land_meters.crs).to_crs(epsg=4326)
-
-        # Initialize an empty Series to store results
-        is_land_series = pd.Series(False, index=self.grid_df.index)
-
-        for i in range(num_chunks):
-            # Calculate the range for the current chunk
-            start_idx = i * chunk_size
-            end_idx = start_idx + chunk_size
-            current_chunk = self.grid_df.iloc[start_idx:end_idx]
-
-            # Perform the spatial join with the single merged land geometry
-            points_within_buffered_land = current_chunk[current_chunk.geometry.within(merged_land.iloc[0])]
-
-            # Update the is_land Series with the results
-            is_land_series.loc[points_within_buffered_land.index] = True
-
-            # Report progress
-            progress = ((i + 1) / num_chunks) * 100
-            logging.debug(f"Chunk {i + 1} of {num_chunks} processed ({progress:.2f}% complete)")
-
-        # Assign the results to the grid DataFrame
-        self.grid_df['is_land'] = is_land_series
-        self.grid_df['is_water'] = ~is_land_series
+        return gpd.GeoSeries([merged_land], crs=land_meters.crs).to_crs(epsg=4326).iloc[0]
+
+    @staticmethod
+    def make_tiles(latitudes, longitudes, tile_size):
+        # Split a lat/lon grid into tiles of roughly tile_size degrees
+        lat_per_tile = max(1, int(round(tile_size / abs(latitudes[1] - latitudes[0])))) if len(latitudes) > 1 else 1
+        lon_per_tile = max(1, int(round(tile_size / abs(longitudes[1] - longitudes[0])))) if len(longitudes) > 1 else 1
+        tiles = []
+        for i in range(0, len(latitudes), lat_per_tile):
+            for j in range(0, len(longitudes), lon_per_tile):
+                tiles.append((i, min(i + lat_per_tile, len(latitudes)), j, min(j + lon_per_tile, len(longitudes))))
+        return tiles
+
+    @staticmethod
+    def open_checkpoint(checkpoint_dir, latitudes, longitudes, tile_size):
+        # Checkpoints are only reused for exactly the same grid and tiling
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        manifest = {
+            'latitudes': [float(latitudes[0]), float(latitudes[-1]), len(latitudes)],
+            'longitudes': [float(longitudes[0]), float(longitudes[-1]), len(longitudes)],
+            'tile_size': tile_size,
+        }
+        manifest_path = os.path.join(checkpoint_dir, 'manifest.json')
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as file:
+                if json.load(file) != manifest:
+                    logging.debug("Checkpoint in {} is for a different grid, starting over".format(checkpoint_dir))
+                    for name in os.listdir(checkpoint_dir):
+                        if name.startswith('tile_'):
+                            os.remove(os.path.join(checkpoint_dir, name))
+        with open(manifest_path, 'w') as file:
+            json.dump(manifest, file)
+
+    def classify_points(self, latitudes, longitudes, workers=None, tile_size=10.0, checkpoint_dir=None):
+        # Returns a (len(latitudes), len(longitudes)) array, True where the point
+        # lies inside the buffered land
+        is_land = np.zeros((len(latitudes), len(longitudes)), dtype=bool)
+        tiles = self.make_tiles(latitudes, longitudes, tile_size)
+        logging.debug(f"Classifying land and water in {len(tiles)} tiles...")
+
+        def checkpoint_path(tile_id):
+            return os.path.join(checkpoint_dir, 'tile_{}_{}.npy'.format(tile_id[0], tile_id[2]))
+
+        def save_checkpoint(tile_id, tile_is_land):
+            # Written under a temporary name and renamed so a killed run never leaves half a tile
+            path = checkpoint_path(tile_id)
+            tmp_path = path[:-len('.npy')] + '.tmp.npy'
+            np.save(tmp_path, tile_is_land)
+            os.replace(tmp_path, path)
+
+        pending = tiles
+        if checkpoint_dir is not None:
+            self.open_checkpoint(checkpoint_dir, latitudes, longitudes, tile_size)
+            pending = [tile_id for tile_id in tiles if not os.path.isfile(checkpoint_path(tile_id))]
+            logging.debug(f"Resuming with {len(tiles) - len(pending)} of {len(tiles)} tiles already classified")
+
+        if pending:
+            merged_land = self.buffered_land_geometry()
+            pad = max(abs(latitudes[-1] - latitudes[0]) / max(len(latitudes) - 1, 1),
+                      abs(longitudes[-1] - longitudes[0]) / max(len(longitudes) - 1, 1))
+            jobs = [(tile_id, latitudes[tile_id[0]:tile_id[1]], longitudes[tile_id[2]:tile_id[3]], pad)
+                    for tile_id in pending]
+
+            with Pool(workers, initializer=_init_worker, initargs=(shapely.to_wkb(merged_land),)) as pool:
+                for done, (tile_id, tile_is_land) in enumerate(pool.imap_unordered(_classify_tile, jobs), start=1):
+                    is_land[tile_id[0]:tile_id[1], tile_id[2]:tile_id[3]] = tile_is_land
+                    if checkpoint_dir is not None:
+                        save_checkpoint(tile_id, tile_is_land)
+
+                    # Report progress
+                    progress = (done / len(jobs)) * 100
+                    logging.debug(f"Tile {done} of {len(jobs)} processed ({progress:.2f}% complete)")
+
+        # Tiles finished by an earlier run come straight from the checkpoint
+        if checkpoint_dir is not None:
+            classified_now = set(pending)
+            for tile_id in tiles:
+                if tile_id not in classified_now:
+                    is_land[tile_id[0]:tile_id[1], tile_id[2]:tile_id[3]] = np.load(checkpoint_path(tile_id))
+
+        return is_land
+
+    def classify_land_water(self, workers=None, tile_size=10.0, checkpoint_dir=None):
+        is_land = self.classify_points(self.latitudes, self.longitudes, workers, tile_size, checkpoint_dir)
+        self.set_classification(is_land)
+
+    def classify_with_land_mask(self, land_mask):
+        if isinstance(land_mask, str):
+            land_mask = LandMask.load(land_mask)
+        logging.debug("Classifying land and water from the land mask...")
+        lon_grid, lat_grid = np.meshgrid(self.longitudes, self.latitudes)
+        self.set_classification(land_mask.is_land(lat_grid, lon_grid))
+
+    def set_classification(self, is_land):
+        # Assign the results to the grid DataFrame, rows are latitude-major
+        is_land = np.asarray(is_land, dtype=bool).ravel()
+        self.grid_df['is_land'] = is_land
+        self.grid_df['is_water'] = ~is_land
+
+    def rasterize_land(self, step, lat_min=-90, lat_max=90, lon_min=-180, lon_max=180,
+                       workers=None, tile_size=10.0, checkpoint_dir=None):
+        # Classify the buffered land once on a step-degree lattice and pack it into a LandMask
+        logging.debug(f"Rasterizing buffered land at {step} degree resolution...")
+        latitudes = lat_min + step * np.arange(int(round((lat_max - lat_min) / step)) + 1)
+        longitudes = lon_min + step * np.arange(int(round((lon_max - lon_min) / step)))
+        is_land = self.classify_points(latitudes, longitudes, workers, tile_size, checkpoint_dir)
+        return LandMask.from_array(is_land, lat_min, lon_min, step)
+
+    @classmethod
+    def build_land_mask(cls, land_data_path, step, folder_path=land_mask_dir, **kwargs):
+        # Load the mask for this resolution, rasterizing and saving it on first use
+        path = land_mask_path(step, folder_path)
+        if os.path.isfile(path):
+            return LandMask.load(path)
+        grid_map = cls.__new__(cls)
+        grid_map.land_data_path = land_data_path
+        grid_map.land = gpd.read_file(land_data_path)
+        land_mask = grid_map.rasterize_land(step, **kwargs)
+        land_mask.save(path)
+        logging.debug("Land mask saved to: {}".format(path))
+        return land_mask
 
     def save_grid(self, file_name, folder_path):
         logging.debug("Saving grid to file...")
@@ -96,7 +217,10 @@ if __name__ == "__main__":
     land_data_path = os.path.join(script_dir, 'data', 'geopackages', 'ne_10m_land.gpkg')
 
     logging.debug("Starting program...")
-    grid_map = GridMap(land_data_path, LAT_MIN, LAT_MAX, LON_MIN, LON_MAX, LAT_STEP, LON_STEP)
+    # Rasterize the buffered land once, the grid itself is then classified by mask lookups
+    land_mask = GridMap.build_land_mask(land_data_path, LAT_STEP,
+                                        checkpoint_dir=os.path.join(script_dir, 'grid_map', 'land_mask_checkpoint'))
+    grid_map = GridMap(land_data_path, LAT_MIN, LAT_MAX, LON_MIN, LON_MAX, LAT_STEP, LON_STEP, land_mask=land_mask)
 
     sea_grid = grid_map.grid_df[grid_map.grid_df['is_water']]
     logging.debug("Total number of sea grid points: {}".format(len(sea_grid)))
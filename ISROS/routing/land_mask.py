@@ -0,0 +1,112 @@
+import os
+import json
+import numpy as np
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+land_mask_dir = os.path.join(script_dir, 'grid_map')
+
+
+def land_mask_path(step, folder_path=land_mask_dir):
+    return os.path.join(folder_path, f"land_mask_{step:g}.npy")
+
+
+class LandMask:
+    """Land/water raster of the buffered land polygons packed one bit per cell.
+
+    Row ``r`` and column ``c`` hold the classification of the sample point
+    ``(lat_min + r * step, lon_min + c * step)``; any coordinate is looked up in
+    the cell of its nearest sample point. A set bit means land. Coordinates
+    outside the raster count as land so nothing is ever routed off the map.
+    """
+
+    def __init__(self, bits, lat_min, lon_min, step, shape):
+        self.bits = bits
+        self.lat_min = lat_min
+        self.lon_min = lon_min
+        self.step = step
+        self.shape = tuple(shape)
+        # A raster covering the full circle wraps around the antimeridian
+        self.wraps = self.shape[1] * step >= 360 - 1e-9
+
+    @classmethod
+    def from_array(cls, is_land, lat_min, lon_min, step):
+        is_land = np.asarray(is_land, dtype=bool)
+        return cls(np.packbits(is_land, axis=1), lat_min, lon_min, step, is_land.shape)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.save(path, self.bits)
+        header = {'lat_min': self.lat_min, 'lon_min': self.lon_min, 'step': self.step, 'shape': list(self.shape)}
+        with open(path + '.json', 'w') as file:
+            json.dump(header, file)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(path + '.json') as file:
+            header = json.load(file)
+        bits = np.load(path, mmap_mode=mmap_mode)
+        return cls(bits, header['lat_min'], header['lon_min'], header['step'], header['shape'])
+
+    def cells(self, lats, lons):
+        rows = np.rint((np.asarray(lats, dtype=np.float64) - self.lat_min) / self.step).astype(np.int64)
+        cols = np.rint((np.asarray(lons, dtype=np.float64) - self.lon_min) / self.step).astype(np.int64)
+        if self.wraps:
+            cols %= self.shape[1]
+        inside = (rows >= 0) & (rows < self.shape[0]) & (cols >= 0) & (cols < self.shape[1])
+        return rows, cols, inside
+
+    def is_land(self, lats, lons):
+        """Vectorized lookup, accepts scalars or arrays of coordinates."""
+        rows, cols, inside = self.cells(lats, lons)
+        rows = np.where(inside, rows, 0)
+        cols = np.where(inside, cols, 0)
+        # np.packbits is big-endian within each byte
+        bytes_ = self.bits[rows, cols >> 3]
+        land = ((bytes_ >> (7 - (cols & 7))) & 1).astype(bool)
+        return land | ~inside
+
+    def is_water(self, lats, lons):
+        return ~self.is_land(lats, lons)
+
+    def segment_samples(self, starts, ends):
+        # Evenly spaced samples along every segment, dense enough that no cell
+        # on the way is skipped. Returns the sample coordinates and the index of
+        # the segment each sample belongs to.
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+        span = np.abs(ends - starts).max(axis=1)
+        counts = np.maximum(2, np.ceil(2 * span / self.step).astype(np.int64) + 1)
+
+        segment = np.repeat(np.arange(len(starts)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        t = (offsets / (counts[segment] - 1))[:, None]
+        points = starts[segment] + t * (ends[segment] - starts[segment])
+        return points[:, 0], points[:, 1], segment
+
+    def segment_crosses_land(self, start, end):
+        lats, lons, _ = self.segment_samples([start], [end])
+        return bool(self.is_land(lats, lons).any())
+
+    def find_land_crossings(self, path):
+        """Indices i of the path segments (path[i], path[i + 1]) that touch land."""
+        if len(path) < 2:
+            return []
+        path = np.asarray(path, dtype=np.float64)
+        lats, lons, segment = self.segment_samples(path[:-1], path[1:])
+        return np.unique(segment[self.is_land(lats, lons)]).tolist()
+
+    def path_is_water(self, path):
+        return not self.find_land_crossings(path)
+
+
+_land_masks = {}
+
+
+def get_land_mask(step=0.05, folder_path=land_mask_dir):
+    # Masks are memory-mapped once per process; None when not rasterized yet
+    path = land_mask_path(step, folder_path)
+    if path not in _land_masks:
+        if not os.path.isfile(path):
+            return None
+        _land_masks[path] = LandMask.load(path)
+    return _land_masks[path]
@@ -0,0 +1,122 @@
+import os
+import random
+import time
+import weakref
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from .csr_graph import LANDMARKS_FILE, LANDMARK_DISTANCES_FILE
+from .search import get_search_engine, haversine_heuristic
+
+# float32 tables round distances of up to ~20,000 km to a few metres, the bound
+# is lowered by this much (km) so it never overestimates
+TABLE_TOLERANCE_KM = 0.01
+
+
+def graph_matrix(graph):
+    n = graph.number_of_nodes()
+    return csr_matrix((np.asarray(graph.weights, dtype=np.float64), graph.indices, graph.indptr), shape=(n, n))
+
+
+def select_landmarks(graph, count=16, seed=None, matrix=None):
+    """Farthest-point landmark selection: every new landmark is the node of the
+    largest component farthest from all landmarks picked so far."""
+    matrix = matrix if matrix is not None else graph_matrix(graph)
+    largest = int(np.argmax(graph.component_sizes))
+    candidates = np.flatnonzero(np.asarray(graph.components) == largest)
+
+    rng = random.Random(seed)
+    landmarks = [int(candidates[rng.randrange(len(candidates))])]
+    for _ in range(count):
+        dist = dijkstra(matrix, directed=True, indices=landmarks, min_only=True)
+        dist = np.where(np.isfinite(dist), dist, -1)
+        landmarks.append(int(candidates[np.argmax(dist[candidates])]))
+    # The random seed node is only used to find the first real landmark
+    return landmarks[1:]
+
+
+def preprocess_landmarks(graph, count=16, seed=None):
+    """Select landmarks and store the (nodes, landmarks) distance table next to the graph."""
+    start_time = time.perf_counter()
+    matrix = graph_matrix(graph)
+    landmarks = select_landmarks(graph, count, seed, matrix)
+    print(f"Selected {len(landmarks)} landmarks in {time.perf_counter() - start_time:.1f}s.")
+
+    # Node-major layout so the bounds of a handful of neighbours are contiguous reads
+    table = dijkstra(matrix, directed=True, indices=landmarks).T.astype(np.float32)
+    np.save(os.path.join(graph.directory, LANDMARKS_FILE), np.asarray(landmarks, dtype=np.int64))
+    np.save(os.path.join(graph.directory, LANDMARK_DISTANCES_FILE), table)
+    _landmarks.pop(graph, None)
+    print(f"Landmark table ({table.nbytes / 1e6:.0f} MB) saved in {time.perf_counter() - start_time:.1f}s.")
+    return landmarks, table
+
+
+_landmarks = weakref.WeakKeyDictionary()
+
+
+def get_landmarks(graph):
+    # (landmark ids, memory-mapped distance table), or None before preprocessing
+    if graph not in _landmarks:
+        table_path = os.path.join(graph.directory or '', LANDMARK_DISTANCES_FILE)
+        if not graph.directory or not os.path.isfile(table_path):
+            return None
+        _landmarks[graph] = (np.load(os.path.join(graph.directory, LANDMARKS_FILE)),
+                             np.load(table_path, mmap_mode='r'))
+    return _landmarks[graph]
+
+
+def landmark_heuristic(engine, goal):
+    # ALT bound from the triangle inequality, |d(L, v) - d(L, goal)| <= d(v, goal)
+    # for every landmark L, combined with the great-circle distance
+    landmarks = get_landmarks(engine.graph)
+    haversine = haversine_heuristic(engine, goal)
+    if landmarks is None:
+        return haversine
+    table = landmarks[1]
+    goal_distances = np.asarray(table[goal], dtype=np.float64)
+
+    def heuristic(nodes):
+        bounds = np.abs(np.asarray(table[nodes], dtype=np.float64) - goal_distances)
+        # Landmarks in another component give inf - inf, they carry no information
+        bounds = np.where(np.isfinite(bounds), bounds, 0.0)
+        alt = np.maximum(bounds.max(axis=1) - TABLE_TOLERANCE_KM, 0.0)
+        return np.maximum(alt, haversine(nodes))
+
+    return heuristic
+
+
+def compare_heuristics(graph, pairs):
+    """Expanded node counts of plain haversine A* against ALT for (start, goal) node pairs."""
+    engine = get_search_engine(graph)
+    report = []
+    for start, goal in pairs:
+        if not graph.same_component(start, goal):
+            continue
+        plain = engine.search(start, goal, heuristic=haversine_heuristic)
+        alt = engine.search(start, goal, heuristic=landmark_heuristic)
+        report.append({
+            "start": start,
+            "goal": goal,
+            "cost": plain.cost,
+            "alt_cost": alt.cost,
+            "haversine_expanded": plain.expanded,
+            "alt_expanded": alt.expanded,
+        })
+
+    plain_total = sum(row["haversine_expanded"] for row in report)
+    alt_total = sum(row["alt_expanded"] for row in report)
+    if plain_total:
+        print(f"ALT expanded {alt_total} nodes against {plain_total} for haversine "
+              f"({100 * (1 - alt_total / plain_total):.1f}% fewer) over {len(report)} queries.")
+    return report
+
+
+if __name__ == "__main__":
+    from .csr_graph import load_csr_graph
+    from .pathing import csr_graph_dir
+
+    G = load_csr_graph(csr_graph_dir)
+    preprocess_landmarks(G)
+
+    rng = random.Random(0)
+    compare_heuristics(G, [(rng.randrange(len(G)), rng.randrange(len(G))) for _ in range(20)])
@@ -0,0 +1,99 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+# Level and destination of the routing log, e.g. ISROS_LOG_LEVEL=DEBUG.
+# ISROS_LOG_FILE=- logs to stderr instead of a file.
+LOG_LEVEL = os.environ.get('ISROS_LOG_LEVEL', 'INFO')
+LOG_FILE = os.environ.get('ISROS_LOG_FILE', 'debug_log.txt')
+
+# The file is rotated at this size, keeping LOG_BACKUPS older files
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 3
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s'
+
+_listener = None
+_lock = threading.Lock()
+
+
+def configure_routing_logging(level=None, file_name=None):
+    """Send the ``routing`` loggers through a queue to a background writer.
+
+    Request threads only put records on an in-memory queue; a QueueListener
+    thread formats them and writes them to a size-capped rotating file, so
+    routing never waits on the disk. Nothing is changed when handlers were
+    already attached to the ``routing`` logger, e.g. by Django's LOGGING
+    setting. Safe to call more than once.
+    """
+    global _listener
+    logger = logging.getLogger('routing')
+    with _lock:
+        if _listener is not None or logger.handlers:
+            return logger
+
+        file_name = file_name or LOG_FILE
+        if file_name == '-':
+            handler = logging.StreamHandler()
+        else:
+            handler = logging.handlers.RotatingFileHandler(file_name, maxBytes=LOG_MAX_BYTES,
+                                                           backupCount=LOG_BACKUPS, delay=True)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        records = queue.SimpleQueue()
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        logger.setLevel((level or LOG_LEVEL).upper() if isinstance(level or LOG_LEVEL, str) else level)
+        logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+        _listener.start()
+        # Flush what is still queued when the process exits
+        atexit.register(stop_routing_logging)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=_hold_handlers, after_in_parent=_release_handlers,
+                                after_in_child=_restart_listener)
+    return logger
+
+
+def stop_routing_logging():
+    # Write out the queued records and stop the writer thread
+    with _lock:
+        if _listener is not None and _listener._thread is not None:
+            _listener.stop()
+
+
+def _hold_handlers():
+    # No record may be half written when the process forks, or the child
+    # writes it again from its copy of the file buffer
+    if _listener is not None:
+        for handler in _listener.handlers:
+            handler.acquire()
+
+
+def _release_handlers():
+    if _listener is not None:
+        for handler in _listener.handlers:
+            handler.release()
+
+
+def _restart_listener():
+    # Threads do not survive fork, so a forked worker gets its own queue and
+    # writer thread in front of the same handler
+    global _listener, _lock
+    _lock = threading.Lock()
+    if _listener is None:
+        return
+    records = queue.SimpleQueue()
+    for handler in logging.getLogger('routing').handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            handler.queue = records
+    _listener = logging.handlers.QueueListener(records, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def set_routing_log_level(level):
+    # Change the level at runtime, e.g. to DEBUG while investigating a route
+    logging.getLogger('routing').setLevel(level.upper() if isinstance(level, str) else level)
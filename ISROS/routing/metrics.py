@@ -0,0 +1,196 @@
+import contextvars
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+
+# Off unless ISROS_METRICS=1, every timer and counter is a no-op then and
+# /metrics/ reports nothing
+METRICS_ENABLED = os.environ.get('ISROS_METRICS', '0') == '1'
+
+# Quantiles are taken over the last WINDOW observations of every stage
+WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RollingSummary:
+    """Count, sum and the last ``window`` observations of one measurement.
+
+    Recording only appends to a bounded deque, the quantiles are computed
+    when the metrics are scraped.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantiles(self, quantiles=QUANTILES):
+        values = sorted(self.recent)
+        if not values:
+            return {q: math.nan for q in quantiles}
+        # Nearest-rank quantiles of the window
+        return {q: values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))] for q in quantiles}
+
+
+class RoutingMetrics:
+    """Stage durations and search counters of the routing pipeline."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.stages = {}
+        self.searches = {}
+        self.expanded = {}
+        self.paths = 0
+        self.path_waypoints = 0
+        self.path_km = 0.0
+        self._lock = threading.Lock()
+
+    def observe_stage(self, name, seconds):
+        with self._lock:
+            summary = self.stages.get(name)
+            if summary is None:
+                summary = self.stages[name] = RollingSummary(self.window)
+            summary.observe(seconds)
+
+    def count_search(self, mode, expanded):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self.searches[mode] = self.searches.get(mode, 0) + 1
+            self.expanded[mode] = self.expanded.get(mode, 0) + expanded
+
+    def count_path(self, waypoints, length_km=0.0):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self.paths += 1
+            self.path_waypoints += waypoints
+            self.path_km += length_km
+
+    def drain(self):
+        """Everything recorded since the last drain, and start over; a worker
+        process hands this to the parent's merge."""
+        with self._lock:
+            recorded = {
+                "stages": {name: (summary.count, summary.sum, list(summary.recent))
+                           for name, summary in self.stages.items()},
+                "searches": self.searches,
+                "expanded": self.expanded,
+                "paths": (self.paths, self.path_waypoints, self.path_km),
+            }
+            self.stages, self.searches, self.expanded = {}, {}, {}
+            self.paths, self.path_waypoints, self.path_km = 0, 0, 0.0
+        return recorded
+
+    def merge(self, recorded):
+        with self._lock:
+            for name, (count, total, recent) in recorded["stages"].items():
+                summary = self.stages.get(name)
+                if summary is None:
+                    summary = self.stages[name] = RollingSummary(self.window)
+                summary.count += count
+                summary.sum += total
+                summary.recent.extend(recent)
+            for mode, count in recorded["searches"].items():
+                self.searches[mode] = self.searches.get(mode, 0) + count
+            for mode, count in recorded["expanded"].items():
+                self.expanded[mode] = self.expanded.get(mode, 0) + count
+            paths, waypoints, path_km = recorded["paths"]
+            self.paths += paths
+            self.path_waypoints += waypoints
+            self.path_km += path_km
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            stages = {name: (summary.count, summary.sum, summary.quantiles()) for name, summary in self.stages.items()}
+            searches, expanded = dict(self.searches), dict(self.expanded)
+            paths, waypoints, path_km = self.paths, self.path_waypoints, self.path_km
+
+        lines = [
+            f"# HELP isros_stage_seconds Duration of routing pipeline stages, quantiles over the last {self.window} runs.",
+            "# TYPE isros_stage_seconds summary",
+        ]
+        for name, (count, total, quantiles) in sorted(stages.items()):
+            for q, value in quantiles.items():
+                lines.append(f'isros_stage_seconds{{stage="{name}",quantile="{q:g}"}} {value:.6f}')
+            lines.append(f'isros_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'isros_stage_seconds_count{{stage="{name}"}} {count}')
+
+        lines += ["# HELP isros_searches_total Graph searches run.", "# TYPE isros_searches_total counter"]
+        lines += [f'isros_searches_total{{mode="{mode}"}} {count}' for mode, count in sorted(searches.items())]
+        lines += ["# HELP isros_search_expanded_nodes_total Nodes expanded by graph searches.",
+                  "# TYPE isros_search_expanded_nodes_total counter"]
+        lines += [f'isros_search_expanded_nodes_total{{mode="{mode}"}} {count}' for mode, count in sorted(expanded.items())]
+        lines += [
+            "# HELP isros_paths_total Paths returned.", "# TYPE isros_paths_total counter",
+            f"isros_paths_total {paths}",
+            "# HELP isros_path_waypoints_total Waypoints of the paths returned.",
+            "# TYPE isros_path_waypoints_total counter",
+            f"isros_path_waypoints_total {waypoints}",
+            "# HELP isros_path_length_km_total Length of the paths returned in km.",
+            "# TYPE isros_path_length_km_total counter",
+            f"isros_path_length_km_total {path_km:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+metrics = RoutingMetrics()
+
+# Stage timings of the request being served, for its Server-Timing header
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class stage:
+    """Times a block as one stage: ``with stage("snap"): ...``.
+
+    The duration goes into the stage's rolling summary and, inside a view
+    wrapped with server_timing, into the response's Server-Timing header.
+    """
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if METRICS_ENABLED:
+            seconds = time.perf_counter() - self.start
+            metrics.observe_stage(self.name, seconds)
+            timings = _request_timings.get()
+            if timings is not None:
+                timings.append((self.name, seconds))
+        return False
+
+
+def server_timing(view):
+    """Adds a Server-Timing header with the stages the view went through."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not METRICS_ENABLED:
+            return view(request, *args, **kwargs)
+        timings = []
+        token = _request_timings.set(timings)
+        try:
+            # The view itself is the last entry, its stages come before it
+            with stage(f"view_{view.__name__}"):
+                response = view(request, *args, **kwargs)
+        finally:
+            _request_timings.reset(token)
+        response["Server-Timing"] = ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings)
+        return response
+
+    return wrapper
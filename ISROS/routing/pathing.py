@@ -1,33 +1,40 @@
-import pickle
 import math
 import os
-import gc
-import random
+import time
+import logging
+import threading
 import numpy as np
-from collections import defaultdict
-import pandas as pd
-import networkx as nx
-from queue import PriorityQueue
-from scipy.spatial import cKDTree
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from .ships import Ship, ContainerCargoShip, CrudeOilTankerShip, RoRoShip
-from .graph_update import generate_or_load_graph
+from .search import get_search_engine, zero_heuristic, SearchTimeout
+from .spatial_index import get_spatial_index
+from .land_mask import get_land_mask
+from .route_cache import route_cache
+from .landmarks import landmark_heuristic
+from .cost_overlay import get_cost_overlay
+from .forecast import get_forecast, travel_time_heuristic, TravelTimeCost, arrival_hours
+from .logging_setup import configure_routing_logging
+from .metrics import metrics, stage
 #from graph_update import generate_or_load_graph
 
+configure_routing_logging()
+logger = logging.getLogger(__name__)
+
 def debug_print(message):
     print(f"DEBUG: {message}")
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
-debug_print(f"Script directory: {script_dir}")
 
 file_path = os.path.join(script_dir, 'grid_map', 'sea_grid.pkl')
 graph_file_path = os.path.join(script_dir, 'grid_map', 'sea_graph.pkl')
-debug_print(f"Grid file path: {file_path}")
+csr_graph_dir = os.path.join(script_dir, 'grid_map', 'sea_graph_csr')
 path_print = os.path.join(script_dir, 'data')
 
 def find_isolated_nodes(graph):
-    isolated = list(nx.isolates(graph))
-    return isolated
+    isolated = np.flatnonzero(graph.component_sizes[graph.components] == 1)
+    sizes = np.sort(graph.component_sizes)[::-1]
+    debug_print(f"{graph.number_of_components()} components, largest sizes: {sizes[:10].tolist()}")
+    return graph.coords(isolated)
 
 # Haversine formula to calculate the distance between two points on the Earth's surface
 def haversine(coord1, coord2):
@@ -45,112 +52,331 @@ def haversine(coord1, coord2):
     return distance
 
 def find_nearest_navigable_node_within_radius(graph, point, radius=50.0):
-    # Extract the navigable nodes from the graph
-    navigable_nodes = [node for node in graph.nodes]
-
-    if len(navigable_nodes) == 0:
+    if graph.number_of_nodes() == 0:
         raise ValueError("There are no navigable nodes in the graph to find the closest point to.")
-    
-    # Create the KD-tree from the navigable nodes
-    tree = cKDTree(navigable_nodes)
-    
-    # Find the indices of all points within the specified radius
-    indices = tree.query_ball_point(point, radius)
 
-    if len(indices) == 0:  # No points found within the radius
-        error_message = f"No navigable nodes within a radius of {radius} km from point {point}."
-        raise ValueError(error_message)
-    
-    # Find the nearest node within the indices
-    nearest_index = tree.query(point, k=1, distance_upper_bound=radius)[1]
-    if nearest_index == len(navigable_nodes):
-        error_message = f"No navigable nodes within a radius of {radius} km from point {point}."
-        raise ValueError(error_message)
+    # Query the graph's persistent unit-sphere index, radius is in km
+    node, _ = get_spatial_index(graph).nearest(point[0], point[1], radius)
+    return node
 
-    # Return the nearest navigable node
-    return navigable_nodes[nearest_index]
+def find_nearest_navigable_nodes(graph, points, radius=50.0):
+    # Batched snapping, ids are -1 for points with no node inside the radius
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    nodes, _ = get_spatial_index(graph).nearest_many(points[:, 0], points[:, 1], radius)
+    return nodes
 
+def snap_to_graph(graph, point, radius, label):
+    try:
+        node = find_nearest_navigable_node_within_radius(graph, point, radius)
+    except ValueError as e:
+        logger.warning("Could not snap %s %s: %s", label, point, e)
+        return None
+    if graph.coord(node) != tuple(point):
+        logger.debug("Changed %s node to nearest navigable node: %s", label, graph.coord(node))
+    return node
 
-def log_to_file(message, file_name="debug_log.txt"):
-    with open(file_name, 'a') as f:
-        f.write(message + "\n")
+def validate_path(path, mask_step=0.05):
+    # Checks every segment against the rasterized land mask when one is available
+    land_mask = get_land_mask(mask_step)
+    if land_mask is None:
+        return True
+    crossings = land_mask.find_land_crossings(path)
+    if crossings:
+        logger.warning("Path crosses land on %d segments, first at %s", len(crossings), path[crossings[0]])
+    return not crossings
 
-def a_star_pathing(graph, start, goal, radius=50.0):
-    log_to_file("A* pathfinding called")
-    
-    # Check if the start and goal nodes are navigable, if not find the nearest navigable nodes
-    if start not in graph:
-        try:
-            start = find_nearest_navigable_node_within_radius(graph, start, radius)
-            log_to_file(f"Changed start node to nearest navigable node: {start}")
-        except ValueError as e:
-            log_to_file(str(e))
-            return None
+def snap_endpoints(graph, start, goal, radius=50.0):
+    # Snap the start and goal coordinates to the nearest navigable nodes
+    with stage("snap"):
+        start = snap_to_graph(graph, start, radius, "start")
+        goal = snap_to_graph(graph, goal, radius, "goal")
+    if start is None or goal is None:
+        return None
+    return start, goal
 
-    if goal not in graph:
-        try:
-            goal = find_nearest_navigable_node_within_radius(graph, goal, radius)
-            log_to_file(f"Changed goal node to nearest navigable node: {goal}")
-        except ValueError as e:
-            log_to_file(str(e))
-            return None
+# Heuristic used by each routing mode. A* uses the landmark (ALT) bound once
+# landmarks have been preprocessed and falls back to plain haversine before.
+ROUTING_MODES = {
+    "astar": landmark_heuristic,
+    "dijkstra": zero_heuristic,
+    "bidirectional": landmark_heuristic,
+    "bidirectional_dijkstra": zero_heuristic,
+}
 
-    if not nx.has_path(graph, start, goal):
-        log_to_file("Start and goal are not connected in the graph.")
+# Modes searched from both ends at once, mainly a gain on long-haul routes
+BIDIRECTIONAL_MODES = {"bidirectional", "bidirectional_dijkstra"}
+
+# Heuristic weights tried in turn by anytime_node_pathing, each search
+# proves its route within that factor of the optimum
+ANYTIME_WEIGHTS = (3.0, 2.0, 1.5, 1.2, 1.05, 1.0)
+
+def search_nodes(graph, start, goal, mode="astar", epsilon=1.0, deadline=None):
+    # Search between two node ids, returns a SearchResult or None. epsilon
+    # inflates the A* heuristic, bidirectional modes always search exactly.
+    with stage("connectivity"):
+        connected = graph.same_component(start, goal)
+    if not connected:
+        logger.info("Nodes %d and %d are not connected in the graph.", start, goal)
         return None
 
-    # Attempt to find the A* path
-    try:
-        path = nx.astar_path(graph, start, goal, heuristic=haversine, weight='weight')
-        log_to_file("Path found:")
-        for node in path:
-            log_to_file(str(node))
-        return path
-    except nx.NetworkXNoPath:
-        log_to_file("No path exists between the provided start and goal nodes.")
+    # Weather and other dynamic costs come from the overlay on top of the base weights
+    overlay = get_cost_overlay(graph)
+    if overlay.is_blocked(start) or overlay.is_blocked(goal):
+        logger.info("Start %d or goal %d lies in a blocked area.", start, goal)
+        return None
+
+    engine = get_search_engine(graph)
+    with stage(f"search_{mode}"):
+        if mode in BIDIRECTIONAL_MODES:
+            result = engine.bidirectional_search(start, goal, heuristic=ROUTING_MODES[mode],
+                                                 cost=overlay.cost, reverse_cost=overlay.reverse_cost)
+        else:
+            result = engine.search(start, goal, heuristic=ROUTING_MODES[mode], cost=overlay.cost,
+                                   weight=epsilon, deadline=deadline)
+    if result is None:
+        logger.info("No path exists between nodes %d and %d.", start, goal)
+        return None
+    metrics.count_search(mode, result.expanded)
+
+    logger.info("%s search from %d to %d expanded %d nodes, cost %.2f%s.", mode, start, goal, result.expanded,
+                result.cost, '' if result.bound == 1 else f', within {result.bound:.4f} of optimal')
+    return result
+
+def nodes_to_path(graph, nodes):
+    with stage("path"):
+        path = graph.coords(nodes)
+        validate_path(path)
+    # One summary line instead of a line per waypoint
+    if path:
+        logger.info("Path found: %d waypoints from %s to %s.", len(path), path[0], path[-1])
+    return path
+
+def a_star_pathing(graph, start, goal, radius=50.0, epsilon=1.0):
+    # epsilon > 1 returns a path at most epsilon times longer than the shortest, faster
+    logger.debug("A* pathfinding called")
+
+    endpoints = snap_endpoints(graph, start, goal, radius)
+    if endpoints is None:
         return None
-    except nx.NodeNotFound as e:
-        log_to_file(str(e))
+
+    # Attempt to find the A* path
+    result = search_nodes(graph, *endpoints, mode="astar", epsilon=epsilon)
+    if result is None:
         return None
+    return nodes_to_path(graph, result.nodes)
 
 def dijkstra_pathing(graph, start, goal, radius=50.0):
-    log_to_file("Dijkstra pathfinding called")
+    logger.debug("Dijkstra pathfinding called")
+
+    endpoints = snap_endpoints(graph, start, goal, radius)
+    if endpoints is None:
+        return None
+
+    # Attempt to find the Dijkstra path
+    result = search_nodes(graph, *endpoints, mode="dijkstra")
+    if result is None:
+        return None
+    return nodes_to_path(graph, result.nodes)
+
+def bidirectional_pathing(graph, start, goal, radius=50.0, mode="bidirectional"):
+    logger.debug("Bidirectional pathfinding called")
+
+    endpoints = snap_endpoints(graph, start, goal, radius)
+    if endpoints is None:
+        return None
+
+    # Attempt to find the path searching from both ends
+    result = search_nodes(graph, *endpoints, mode=mode)
+    if result is None:
+        return None
+    return nodes_to_path(graph, result.nodes)
+
+def compare_routing_modes(graph, pairs, modes=("astar", "bidirectional", "dijkstra", "bidirectional_dijkstra")):
+    """Cost and expanded node count of every routing mode for (start, goal) node pairs."""
+    report = []
+    for start, goal in pairs:
+        row = {"start": start, "goal": goal}
+        for mode in modes:
+            result = search_nodes(graph, start, goal, mode=mode)
+            row[mode] = None if result is None else {"cost": result.cost, "expanded": result.expanded}
+        report.append(row)
+
+    for mode in modes:
+        total = sum(row[mode]["expanded"] for row in report if row[mode] is not None)
+        print(f"{mode}: {total} nodes expanded over {len(report)} queries.")
+    return report
+
+def check_search_costs(graph, pairs, weights=(1.5, 3.0), tolerance=1e-6):
+    """(start, goal, weight, reported, actual) for every weighted search whose
+    reported cost differs from the summed edge costs of the path it returned."""
+    engine = get_search_engine(graph)
+    overlay = get_cost_overlay(graph)
+    mismatches = []
+    for start, goal in pairs:
+        for weight in weights:
+            result = search_nodes(graph, start, goal, epsilon=weight)
+            if result is None:
+                continue
+            actual = engine.path_cost(result.nodes, overlay.cost)
+            if abs(actual - result.cost) > tolerance * max(1.0, actual):
+                mismatches.append((start, goal, weight, result.cost, actual))
+    print(f"{len(mismatches)} weighted searches reported a cost other than their path's.")
+    return mismatches
     
-    # Check if the start and goal nodes are navigable, if not find the nearest navigable nodes
-    if start not in graph:
-        try:
-            start = find_nearest_navigable_node_within_radius(graph, start, radius)
-            log_to_file(f"Changed start node to nearest navigable node: {start}")
-        except ValueError as e:
-            log_to_file(str(e))
-            return None
+def routing_version(graph):
+    # Everything a cached route depends on: the graph build and the cost overlay
+    return f"{graph.version}:{get_cost_overlay(graph).version}"
+
+def cached_pathing(graph, start, goal, mode="astar", radius=50.0, epsilon=1.0):
+    # Same as a_star_pathing/dijkstra_pathing but answered from the route cache
+    # when these snapped endpoints were routed before under the same version
+    endpoints = snap_endpoints(graph, start, goal, radius)
+    if endpoints is None:
+        return None
+    return cached_node_pathing(graph, *endpoints, mode=mode, epsilon=epsilon)
+
+def cache_mode(mode, epsilon=1.0):
+    # Route cache key of a mode, inflated searches are kept apart from exact ones
+    return mode if epsilon == 1 else f"{mode}@{epsilon:g}"
+
+def cached_node_pathing(graph, start, goal, mode="astar", epsilon=1.0):
+    # cached_pathing for endpoints that are already node ids. An exact route
+    # cached for the mode also answers inflated requests.
+    version = routing_version(graph)
+    for key in dict.fromkeys((cache_mode(mode), cache_mode(mode, epsilon))):
+        cached = route_cache.get(start, goal, key, version)
+        if cached is not None:
+            logger.debug("Route cache hit for nodes %d and %d", start, goal)
+            return graph.coords(cached[0])
+
+    result = search_nodes(graph, start, goal, mode=mode, epsilon=epsilon)
+    if result is None:
+        return None
+    route_cache.put(start, goal, cache_mode(mode, epsilon), version, result.nodes, result.cost)
+    return nodes_to_path(graph, result.nodes)
+
+# Searches that outlive their request's budget finish here and fill the route
+# cache; pairs already being refined are not queued twice
+_refiner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="route-refine")
+_refining = set()
+_refining_lock = threading.Lock()
 
-    if goal not in graph:
+def _refine_route(graph, start, goal, version):
+    try:
+        result = search_nodes(graph, start, goal, mode="astar")
+        if result is None:
+            return
+        # Costs changed while searching, the route belongs to no version
+        if routing_version(graph) == version:
+            route_cache.put(start, goal, cache_mode("astar"), version, result.nodes, result.cost)
+            logger.info("Refined route for nodes %d and %d cached, cost %.2f.", start, goal, result.cost)
+    except Exception:
+        logger.exception("Refining route for nodes %d and %d failed.", start, goal)
+    finally:
+        with _refining_lock:
+            _refining.discard((start, goal, version))
+
+def anytime_node_pathing(graph, start, goal, budget_ms=50.0, weights=ANYTIME_WEIGHTS):
+    """Best route found within a wall-clock budget of budget_ms.
+
+    Runs weighted A* with the decreasing heuristic weights in turn, keeping
+    the best route found. The first search always runs to completion so there
+    is a route to return. When the budget runs out before the route is proven
+    optimal, an exact search carries on in the background and puts its route
+    in the route cache for the next request. Returns a dict with the path, its
+    cost, the proven bound on cost / optimal cost and whether it is exact, or
+    None when there is no route.
+    """
+    version = routing_version(graph)
+    cached = route_cache.get(start, goal, cache_mode("astar"), version)
+    if cached is not None:
+        logger.debug("Route cache hit for nodes %d and %d", start, goal)
+        return {"path": graph.coords(cached[0]), "cost": cached[1], "bound": 1.0, "exact": True}
+
+    deadline = time.perf_counter() + budget_ms / 1000
+    best = None
+    remaining = list(weights)
+    while remaining:
         try:
-            goal = find_nearest_navigable_node_within_radius(graph, goal, radius)
-            log_to_file(f"Changed goal node to nearest navigable node: {goal}")
-        except ValueError as e:
-            log_to_file(str(e))
+            result = search_nodes(graph, start, goal, mode="astar", epsilon=remaining[0],
+                                  deadline=None if best is None else deadline)
+        except SearchTimeout:
+            break
+        if result is None:
             return None
+        remaining.pop(0)
+        if best is None or result.cost <= best.cost:
+            best = result
+        # result.cost / result.bound is a lower bound on the optimum as well
+        best.bound = min(best.bound, result.bound * best.cost / result.cost)
+        if best.bound <= 1 or time.perf_counter() > deadline:
+            break
 
-    if not nx.has_path(graph, start, goal):
-        log_to_file("Start and goal are not connected in the graph.")
+    if best.bound <= 1:
+        route_cache.put(start, goal, cache_mode("astar"), version, best.nodes, best.cost)
+    else:
+        key = (start, goal, version)
+        with _refining_lock:
+            queued = key in _refining
+            _refining.add(key)
+        if not queued:
+            _refiner.submit(_refine_route, graph, start, goal, version)
+
+    return {
+        "path": nodes_to_path(graph, best.nodes),
+        "cost": best.cost,
+        "bound": best.bound,
+        "exact": best.bound <= 1,
+    }
+
+def time_dependent_pathing(graph, start, goal, departure, ship, load_percentage=50, mode="astar", radius=50.0):
+    """Fastest route for a ship leaving at ``departure`` (a datetime).
+
+    Edge costs are travel hours from the ship's adjusted speed, slowed down by
+    the forecast layer for the time the ship gets to each edge. Returns a dict
+    with the path, the hours after departure at each waypoint and the arrival
+    time, or None. Routes depend on the departure time and are not cached.
+    Arrival times are only known going forward, so bidirectional modes run
+    as a forward search with the same heuristic.
+    """
+    endpoints = snap_endpoints(graph, start, goal, radius)
+    if endpoints is None:
+        return None
+    start, goal = endpoints
+    if not graph.same_component(start, goal):
+        logger.info("Nodes %d and %d are not connected in the graph.", start, goal)
         return None
 
-    # Attempt to find the Dijkstra path
-    try:
-        path = nx.dijkstra_path(graph, start, goal)
-        log_to_file("Path found:")
-        for node in path:
-            log_to_file(str(node))
-        return path
-    except nx.NetworkXNoPath:
-        log_to_file("No path exists between the provided start and goal nodes.")
+    overlay = get_cost_overlay(graph)
+    if overlay.is_blocked(start) or overlay.is_blocked(goal):
+        logger.info("Start %d or goal %d lies in a blocked area.", start, goal)
         return None
-    except nx.NodeNotFound as e:
-        log_to_file(str(e))
+
+    forecast = get_forecast()
+    if forecast is not None and forecast.graph_version != graph.version:
+        logger.warning("Forecast layers were sampled for another graph, ignoring them.")
+        forecast = None
+
+    speed_kmh = ship.get_adjusted_speed_kmh(load_percentage)
+    cost = TravelTimeCost(forecast, departure.timestamp(), speed_kmh, overlay)
+    heuristic = travel_time_heuristic(ROUTING_MODES[mode], speed_kmh)
+    with stage("search_time_dependent"):
+        result = get_search_engine(graph).search(start, goal, heuristic=heuristic, cost=cost)
+    if result is None:
+        logger.info("No path exists between nodes %d and %d.", start, goal)
         return None
-    
+    metrics.count_search("time_dependent", result.expanded)
+
+    logger.info("Time-dependent %s search expanded %d nodes%s.", mode, result.expanded,
+                '' if forecast is None else f', forecast layers read: {forecast.loaded_layers()}')
+    hours = arrival_hours(graph, result.nodes, cost)
+    return {
+        "path": nodes_to_path(graph, result.nodes),
+        "hours": hours,
+        "travel_time_hours": result.cost,
+        "arrival": departure + timedelta(hours=result.cost),
+    }
+
 def write_path_to_file(path, path_file_name):
     with open(path_file_name, 'w') as file:
         for node in path:
@@ -158,16 +384,16 @@ def write_path_to_file(path, path_file_name):
 
 def calculate_distance(path):
     total_distance = 0
-    for i in range(len(path) - 1):
-        distance = haversine(path[i], path[i+1])
-        total_distance += distance
+    with stage("distance"):
+        for i in range(len(path) - 1):
+            distance = haversine(path[i], path[i+1])
+            total_distance += distance
     distance_str = "{:.2f}".format(total_distance)
-    log_to_file(f"Total distance: {distance_str} km")
+    logger.debug("Total distance: %s km", distance_str)
     return distance_str
 ''' TRAVEL TIME AND ARRIVAL TIME:-------------------------------------------------------------'''
 
-G, weather_nodes = generate_or_load_graph(file_path, graph_file_path)
-print(f"Graph loaded.")
+# The graph itself is loaded on first use by graph_provider.get_graph()
 
 '''
 if __name__ == "__main__":
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+# Google encoded polyline format: every coordinate is stored as the zigzag
+# varint of its delta to the previous one, five bits per printable character.
+
+def _encode_value(value, chunks):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+
+
+def encode_polyline(coords, precision=5):
+    factor = 10 ** precision
+    chunks = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        lat = int(round(lat * factor))
+        lon = int(round(lon * factor))
+        _encode_value(lat - prev_lat, chunks)
+        _encode_value(lon - prev_lon, chunks)
+        prev_lat, prev_lon = lat, lon
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded, precision=5):
+    factor = 10 ** precision
+    values = []
+    value = shift = 0
+    for char in encoded:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    deltas = np.array(values, dtype=np.int64).reshape(-1, 2)
+    coords = np.cumsum(deltas, axis=0) / factor
+    return [(float(lat), float(lon)) for lat, lon in coords]
@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import numpy as np
+from multiprocessing import Pool
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+from .csr_graph import load_csr_graph, to_unit_vectors
+from .cost_overlay import get_cost_overlay
+from .spatial_index import get_spatial_index, km_to_chord
+from .ports import parse_ports
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+csr_graph_dir = os.path.join(script_dir, 'grid_map', 'sea_graph_csr')
+port_matrix_dir = os.path.join(script_dir, 'grid_map', 'port_matrix')
+
+# Layout of an assembled matrix for n ports:
+#   ports.json         port names, snapped coordinates and nodes, the graph version
+#   distances.npy      (n, n) float32 route lengths in km, inf when unreachable
+#   tree_offsets.npy   (n + 1) offsets of every source's route tree in the two below
+#   tree_nodes.npy     int32 graph nodes of the tree, sorted within each source
+#   tree_parents.npy   int32 position of each node's predecessor in its tree, -1 at the source
+# The route tree of source i is its shortest-path tree cut down to the nodes on
+# the routes to ports j > i; routes share their prefixes, so a tree holds at
+# most one entry per graph node and usually far fewer. Paths are walked out of
+# it on lookup. Per-source shards under rows/ are what the batch job writes and
+# resumes from.
+PORTS_FILE = 'ports.json'
+DISTANCES_FILE = 'distances.npy'
+TREE_OFFSETS_FILE = 'tree_offsets.npy'
+TREE_NODES_FILE = 'tree_nodes.npy'
+TREE_PARENTS_FILE = 'tree_parents.npy'
+ROWS_DIR = 'rows'
+
+
+def row_path(out_dir, i):
+    return os.path.join(out_dir, ROWS_DIR, f"row_{i:05d}.npz")
+
+
+def route_tree(predecessors, targets):
+    """Nodes on the shortest-path-tree routes to ``targets``, sorted, and the
+    position of each one's predecessor among them (-1 at the root)."""
+    on_tree = np.zeros(len(predecessors), dtype=bool)
+    # One step up the tree for all routes at once, routes stop where they join
+    # a route already walked
+    frontier = np.unique(targets)
+    while len(frontier):
+        on_tree[frontier] = True
+        frontier = predecessors[frontier]
+        frontier = frontier[frontier >= 0]
+        frontier = np.unique(frontier[~on_tree[frontier]])
+    nodes = np.flatnonzero(on_tree).astype(np.int32)
+    parents = predecessors[nodes]
+    has_parent = parents >= 0
+    positions = np.full(len(nodes), -1, dtype=np.int32)
+    positions[has_parent] = np.searchsorted(nodes, parents[has_parent])
+    return nodes, positions
+
+
+def tree_path(nodes, parents, target):
+    # Graph nodes from the root of a route tree to target, None when target is not in it
+    k = int(np.searchsorted(nodes, target))
+    if k == len(nodes) or nodes[k] != target:
+        return None
+    path = []
+    while k >= 0:
+        path.append(int(nodes[k]))
+        k = int(parents[k])
+    path.reverse()
+    return path
+
+
+# Per-worker state, set once by the pool initializer
+_worker = {}
+
+
+def _init_worker(csr_dir, port_nodes, snapped, graph_version, out_dir):
+    graph = load_csr_graph(csr_dir, mmap_mode='r')
+    n = graph.number_of_nodes()
+    # float64 up front so scipy does not convert (copy) the graph on every call.
+    # Base overlay weights, so nodes the build marked as not walkable are avoided
+    _worker['matrix'] = csr_matrix((get_cost_overlay(graph).edge_weights(), graph.indices, graph.indptr), shape=(n, n))
+    _worker['port_nodes'] = port_nodes
+    _worker['snapped'] = snapped
+    _worker['graph_version'] = graph_version
+    _worker['out_dir'] = out_dir
+
+
+def _compute_row(i):
+    # One-to-all Dijkstra from port i, keeping its distance to every port and
+    # the route tree to every port after it
+    port_nodes = _worker['port_nodes']
+    distances = np.full(len(port_nodes), np.inf, dtype=np.float32)
+    tree_nodes = tree_parents = np.empty(0, dtype=np.int32)
+
+    source = port_nodes[i]
+    if source >= 0:
+        dist, predecessors = dijkstra(_worker['matrix'], directed=True, indices=source, return_predecessors=True)
+        snapped = port_nodes >= 0
+        distances[snapped] = dist[port_nodes[snapped]]
+        targets = port_nodes[i + 1:][np.isfinite(distances[i + 1:])]
+        tree_nodes, tree_parents = route_tree(predecessors, targets)
+        distances[i] = 0.0
+
+    save_row(_worker['out_dir'], i, distances, tree_nodes, tree_parents, _worker['snapped'], _worker['graph_version'])
+    return i
+
+
+def save_row(out_dir, i, distances, tree_nodes, tree_parents, snapped, graph_version):
+    # Written under a temporary name and renamed so a killed job never leaves half a shard
+    path = row_path(out_dir, i)
+    tmp_path = path[:-len('.npz')] + '.tmp.npz'
+    np.savez(tmp_path, distances=distances, tree_nodes=tree_nodes, tree_parents=tree_parents,
+             snapped=snapped, graph_version=np.array(graph_version))
+    os.replace(tmp_path, path)
+
+
+def row_touches(shard, graph, changed_tree, chord):
+    # Whether any route of the row passes near a changed place
+    nodes = shard['tree_nodes']
+    if not len(nodes):
+        return False
+    points = to_unit_vectors(np.asarray(graph.lat[nodes], dtype=np.float64), np.asarray(graph.lon[nodes], dtype=np.float64))
+    return bool(np.isfinite(changed_tree.query(points, k=1, distance_upper_bound=chord)[0]).any())
+
+
+def rows_to_compute(out_dir, graph, num_ports, snapped, changed_coords=None, tolerance_km=10.0):
+    """Shards that are missing or stale. A shard from an older graph version is
+    kept when changed_coords lists every place whose cost went up and none of
+    its routes passes within tolerance_km of them; cost decreases need a full
+    recompute (changed_coords=None). Node ids must mean the same in both
+    versions for a shard to be carried over."""
+    changed_tree = None
+    if changed_coords is not None and len(changed_coords):
+        changed = np.asarray(changed_coords, dtype=np.float64).reshape(-1, 2)
+        changed_tree = cKDTree(to_unit_vectors(changed[:, 0], changed[:, 1]))
+    chord = float(km_to_chord(tolerance_km))
+
+    pending = []
+    for i in range(num_ports):
+        path = row_path(out_dir, i)
+        if not os.path.isfile(path):
+            pending.append(i)
+            continue
+        with np.load(path) as shard:
+            if 'tree_nodes' not in shard.files:
+                # Written by an older build of the matrix
+                pending.append(i)
+            elif shard['snapped'].shape != snapped.shape or not np.array_equal(shard['snapped'], snapped, equal_nan=True):
+                pending.append(i)
+            elif str(shard['graph_version']) == graph.version:
+                continue
+            elif changed_coords is None or (changed_tree is not None and row_touches(shard, graph, changed_tree, chord)):
+                pending.append(i)
+            else:
+                # Untouched by the change, carried over to the new graph version
+                save_row(out_dir, i, shard['distances'], shard['tree_nodes'], shard['tree_parents'],
+                         shard['snapped'], graph.version)
+    return pending
+
+
+def assemble_port_matrix(out_dir, names, port_nodes, snapped, graph_version):
+    num_ports = len(names)
+    distances = np.lib.format.open_memmap(os.path.join(out_dir, DISTANCES_FILE), mode='w+',
+                                          dtype=np.float32, shape=(num_ports, num_ports))
+    tree_offsets = np.zeros(num_ports + 1, dtype=np.int64)
+    for i in range(num_ports):
+        with np.load(row_path(out_dir, i)) as shard:
+            tree_offsets[i + 1] = tree_offsets[i] + len(shard['tree_nodes'])
+
+    tree_nodes = np.lib.format.open_memmap(os.path.join(out_dir, TREE_NODES_FILE), mode='w+',
+                                           dtype=np.int32, shape=(int(tree_offsets[-1]),))
+    tree_parents = np.lib.format.open_memmap(os.path.join(out_dir, TREE_PARENTS_FILE), mode='w+',
+                                             dtype=np.int32, shape=(int(tree_offsets[-1]),))
+    for i in range(num_ports):
+        with np.load(row_path(out_dir, i)) as shard:
+            # Only the upper triangle comes from row i, the same pairs its
+            # routes cover. Entries below the diagonal are mirrored from the
+            # earlier rows, so a recomputed row j < i never leaves a stale
+            # distances[i, j] behind.
+            row = shard['distances']
+            distances[i, i:] = row[i:]
+            distances[i + 1:, i] = row[i + 1:]
+            tree_nodes[tree_offsets[i]:tree_offsets[i + 1]] = shard['tree_nodes']
+            tree_parents[tree_offsets[i]:tree_offsets[i + 1]] = shard['tree_parents']
+    distances.flush()
+    tree_nodes.flush()
+    tree_parents.flush()
+    np.save(os.path.join(out_dir, TREE_OFFSETS_FILE), tree_offsets)
+
+    with open(os.path.join(out_dir, PORTS_FILE), 'w') as file:
+        json.dump({'names': names, 'port_nodes': [int(node) for node in port_nodes], 'snapped': snapped.tolist(),
+                   'graph_version': graph_version}, file)
+    print(f"Port matrix for {num_ports} ports assembled in {out_dir} "
+          f"({tree_offsets[-1] * 8 / 1e6:.1f} MB of route trees).")
+
+
+def build_port_matrix(csr_dir=csr_graph_dir, out_dir=port_matrix_dir, ports=None, workers=None,
+                      radius=50.0, changed_coords=None):
+    """Distance and route matrix between all ports. Rerunning resumes from the
+    shards already written; after a graph change pass changed_coords to only
+    recompute the rows whose routes went through the changed area.
+
+    Takes one Dijkstra per port and, on disk, 8 bytes per node of every route
+    tree, at most ``len(ports) * graph.number_of_nodes() * 8`` bytes and in
+    practice the size of the sea lanes between the ports, not of the
+    len(ports)**2 / 2 routes."""
+    start_time = time.perf_counter()
+    graph = load_csr_graph(csr_dir, mmap_mode='r')
+    ports = ports if ports is not None else parse_ports()
+    names = [port['name'] for port in ports]
+    lats = np.array([float(port['latitude']) for port in ports])
+    lons = np.array([float(port['longitude']) for port in ports])
+
+    # Every port is snapped once up front
+    port_nodes, _ = get_spatial_index(graph).nearest_many(lats, lons, radius)
+    port_nodes = port_nodes.astype(np.int64)
+    # Ports in a blocked area are left out, the same as search_nodes does
+    port_nodes[(port_nodes >= 0) & get_cost_overlay(graph).node_blocked[np.maximum(port_nodes, 0)]] = -1
+    snapped = np.full((len(ports), 2), np.nan, dtype=np.float32)
+    valid = port_nodes >= 0
+    snapped[valid, 0] = graph.lat[port_nodes[valid]]
+    snapped[valid, 1] = graph.lon[port_nodes[valid]]
+    print(f"Snapped {int(valid.sum())} of {len(ports)} ports to the graph.")
+
+    os.makedirs(os.path.join(out_dir, ROWS_DIR), exist_ok=True)
+    pending = rows_to_compute(out_dir, graph, len(ports), snapped, changed_coords)
+    print(f"{len(ports) - len(pending)} rows up to date, computing {len(pending)}.")
+
+    if pending:
+        initargs = (csr_dir, port_nodes, snapped, graph.version, out_dir)
+        with Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            for done, i in enumerate(pool.imap_unordered(_compute_row, pending), start=1):
+                if done % 50 == 0 or done == len(pending):
+                    elapsed = time.perf_counter() - start_time
+                    print(f"Port rows: {done}/{len(pending)} done ({elapsed:.0f}s elapsed).")
+
+    assemble_port_matrix(out_dir, names, port_nodes, snapped, graph.version)
+
+
+class PortMatrix:
+    """Memory-mapped reader for an assembled port matrix."""
+
+    def __init__(self, directory=port_matrix_dir):
+        with open(os.path.join(directory, PORTS_FILE)) as file:
+            header = json.load(file)
+        self.names = header['names']
+        self.port_nodes = np.array(header['port_nodes'], dtype=np.int64)
+        self.graph_version = header['graph_version']
+        self.num_ports = len(self.names)
+        self.index = {}
+        for i, name in enumerate(self.names):
+            self.index.setdefault(name, i)
+        self.distances = np.load(os.path.join(directory, DISTANCES_FILE), mmap_mode='r')
+        self.tree_offsets = np.load(os.path.join(directory, TREE_OFFSETS_FILE))
+        self.tree_nodes = np.load(os.path.join(directory, TREE_NODES_FILE), mmap_mode='r')
+        self.tree_parents = np.load(os.path.join(directory, TREE_PARENTS_FILE), mmap_mode='r')
+
+    def distance(self, i, j):
+        return float(self.distances[i, j])
+
+    def route(self, i, j):
+        # Graph nodes from port i to port j, None when the pair has no route
+        if i == j or not np.isfinite(self.distances[i, j]):
+            return None
+        source, target = min(i, j), max(i, j)
+        start, end = self.tree_offsets[source], self.tree_offsets[source + 1]
+        nodes = tree_path(self.tree_nodes[start:end], self.tree_parents[start:end], self.port_nodes[target])
+        if nodes is None:
+            return None
+        return nodes if i < j else nodes[::-1]
+
+    def lookup(self, name_a, name_b, graph):
+        """(path, distance_km) for two port names, or None if the pair is not known.
+        ``graph`` must be the version the matrix was built on."""
+        i, j = self.index.get(name_a), self.index.get(name_b)
+        if i is None or j is None:
+            return None
+        nodes = self.route(i, j)
+        if nodes is None:
+            return None
+        return graph.coords(nodes), self.distance(i, j)
+
+
+_port_matrix = {}
+
+
+def get_port_matrix(directory=port_matrix_dir):
+    # None until the batch job has produced a matrix
+    if directory not in _port_matrix:
+        if not os.path.isfile(os.path.join(directory, PORTS_FILE)):
+            return None
+        _port_matrix[directory] = PortMatrix(directory)
+    return _port_matrix[directory]
+
+
+if __name__ == "__main__":
+    build_port_matrix()
@@ -0,0 +1,186 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from .graph_provider import get_graph
+from .metrics import metrics, stage
+from .ports import get_port_registry
+
+# Port-to-port routing shared by the views and the batch worker processes.
+# Nothing in here imports Django, so the workers can run it on their own.
+
+# Batch searches run in worker processes started once and kept, they are not
+# held back by the GIL the way threads are. The processes are spawned, not
+# forked: that works on every platform and never copies a threaded server in
+# the middle of a request. Each worker maps the graph files itself.
+BATCH_ROUTE_WORKERS = min(8, os.cpu_count() or 1)
+
+_processes = None
+_threads = None
+_pools_lock = threading.Lock()
+
+
+def find_port_route(loc_a, loc_b, mode="astar", epsilon=1.0):
+    # Known port pairs come straight from the precomputed port matrix while no
+    # dynamic costs are set, other geometry from the route cache when this
+    # pair was routed before
+    from .pathing import cached_node_pathing
+    from .port_matrix import get_port_matrix
+    from .cost_overlay import get_cost_overlay
+
+    graph = get_graph()
+    port_matrix = get_port_matrix()
+    if (port_matrix is not None and port_matrix.graph_version == graph.version and get_cost_overlay(graph).is_base()
+            and mode in ("astar", "dijkstra")):
+        with stage("port_matrix"):
+            known_route = port_matrix.lookup(loc_a["name"], loc_b["name"], graph)
+        if known_route is not None:
+            return known_route[0]
+
+    endpoints = port_endpoints(graph, loc_a, loc_b)
+    if endpoints is None:
+        return None
+    return cached_node_pathing(graph, *endpoints, mode=mode, epsilon=epsilon)
+
+
+def port_endpoints(graph, loc_a, loc_b):
+    # Graph nodes of two ports, registry ports come with their nodes already snapped
+    from .pathing import snap_endpoints
+
+    registry = get_port_registry()
+    i, j = registry.find(loc_a["name"]), registry.find(loc_b["name"])
+    if i is not None and j is not None:
+        with stage("snap"):
+            start, goal = registry.snapped_node(i, graph), registry.snapped_node(j, graph)
+        if start is None or goal is None:
+            return None
+        return start, goal
+
+    start_node = (float(loc_a['latitude']), float(loc_a['longitude']))
+    goal_node = (float(loc_b['latitude']), float(loc_b['longitude']))
+    return snap_endpoints(graph, start_node, goal_node)
+
+
+def route_port_pair(pair, mode="astar", epsilon=1.0):
+    """(simplified route, None) for a pair of port names or codes, or (None, error)."""
+    from .simplify import simplify_route
+
+    registry = get_port_registry()
+    loc_a, loc_b = registry.get(pair[0]), registry.get(pair[1])
+    if loc_a is None or loc_b is None:
+        return None, "One or both locations not found."
+    try:
+        path = find_port_route(loc_a, loc_b, mode=mode, epsilon=epsilon)
+    except Exception as e:
+        return None, str(e)
+    if path is None:
+        return None, "No path found or the start and goal nodes are not connected."
+    return simplify_route(path), None
+
+
+def _init_worker():
+    # Load what every search needs once per worker, and keep the routes the
+    # worker caches so they can be handed to the parent with each result
+    from .land_mask import get_land_mask
+    from .port_matrix import get_port_matrix
+    from .route_cache import route_cache
+
+    route_cache.journal = []
+    get_graph()
+    get_port_registry()
+    get_port_matrix()
+    get_land_mask()
+
+
+def _route_in_worker(pair, mode, epsilon, graph_version):
+    # None when the worker has a different graph than the parent, the parent
+    # routes the pair itself then
+    from .route_cache import route_cache
+
+    if get_graph().version != graph_version:
+        return None
+    route, error = route_port_pair(pair, mode, epsilon)
+    cached, route_cache.journal = route_cache.journal, []
+    return route, error, cached, metrics.drain()
+
+
+def _process_pool():
+    global _processes
+    with _pools_lock:
+        if _processes is None:
+            _processes = ProcessPoolExecutor(BATCH_ROUTE_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker)
+        return _processes
+
+
+def _thread_pool():
+    global _threads
+    with _pools_lock:
+        if _threads is None:
+            _threads = ThreadPoolExecutor(BATCH_ROUTE_WORKERS, thread_name_prefix="batch-route")
+        return _threads
+
+
+def _discard_process_pool(pool):
+    # A worker died, the next batch starts a fresh pool
+    global _processes
+    with _pools_lock:
+        if _processes is pool:
+            _processes = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_batch_pools():
+    global _processes, _threads
+    with _pools_lock:
+        pools, _processes, _threads = (_processes, _threads), None, None
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_batch_pools)
+
+
+def route_port_pairs(pairs, mode="astar", epsilon=1.0):
+    """Yield (pair, route, error) for every pair, in the order they finish.
+
+    Pairs go to the worker processes while only the base costs apply, the
+    workers know nothing of weather or blocks set in this process; with
+    dynamic costs they run on threads here. Routes the workers cached and
+    their metrics are merged into this process's route cache and metrics.
+    """
+    from .cost_overlay import get_cost_overlay
+    from .route_cache import route_cache
+
+    pairs = list(pairs)
+    if len(pairs) < 2 or BATCH_ROUTE_WORKERS < 2:
+        for pair in pairs:
+            yield (pair, *route_port_pair(pair, mode, epsilon))
+        return
+
+    graph = get_graph()
+    if not get_cost_overlay(graph).is_base():
+        futures = {_thread_pool().submit(route_port_pair, pair, mode, epsilon): pair for pair in pairs}
+        for future in as_completed(futures):
+            yield (futures[future], *future.result())
+        return
+
+    pool = _process_pool()
+    futures = {pool.submit(_route_in_worker, pair, mode, epsilon, graph.version): pair for pair in pairs}
+    for future in as_completed(futures):
+        pair = futures[future]
+        try:
+            outcome = future.result()
+        except (BrokenProcessPool, CancelledError):
+            _discard_process_pool(pool)
+            outcome = None
+        if outcome is None:
+            yield (pair, *route_port_pair(pair, mode, epsilon))
+            continue
+        route, error, cached, recorded = outcome
+        route_cache.merge(cached)
+        metrics.merge(recorded)
+        yield pair, route, error
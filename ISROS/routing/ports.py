@@ -1,22 +1,183 @@
 import csv
 import os
+import bisect
+import difflib
+import threading
+from array import array
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 csv_filepath = os.path.join(script_dir, "data", "ports.csv")
 
-def parse_ports():
-    ports = []
+# Columns of the World Port Index export used by the registry
+NAME_COLUMN = 3
+ALTERNATE_NAME_COLUMN = 4
+LOCODE_COLUMN = 5
+COUNTRY_COLUMN = 6
+LATITUDE_COLUMN = 30
+LONGITUDE_COLUMN = 31
+
+
+def normalize_locode(locode):
+    # "US HOU", "us hou" and "USHOU" all name the same port
+    return locode.replace(" ", "").upper()
+
+
+class PortRegistry:
+    """Every port of ports.csv, parsed once.
+
+    Coordinates are kept in typed arrays and ports are addressed by their row
+    index. ``by_name`` and ``by_locode`` map names and UN/LOCODEs to indices.
+    Where a name appears more than once the first row wins, the same as the
+    linear scans this replaces.
+    """
+
+    def __init__(self, names, alternate_names, locodes, countries, latitudes, longitudes):
+        self.names = names
+        self.alternate_names = alternate_names
+        self.locodes = locodes
+        self.countries = countries
+        self.latitudes = array('d', latitudes)
+        self.longitudes = array('d', longitudes)
+
+        self.by_name = {}
+        self.by_locode = {}
+        for i, (name, locode) in enumerate(zip(names, locodes)):
+            self.by_name.setdefault(name, i)
+            if locode:
+                self.by_locode.setdefault(normalize_locode(locode), i)
+
+        # Sorted lower-case names for prefix search with bisect
+        self._sorted_names = sorted((name.lower(), i) for i, name in enumerate(names))
+        self._sorted_keys = [key for key, _ in self._sorted_names]
+        self._snapped = {}
+        self._records = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path=csv_filepath):
+        names, alternate_names, locodes, countries, latitudes, longitudes = [], [], [], [], [], []
+        with open(path, mode="r", encoding="utf-8") as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader)
+            for row in reader:
+                port_name = row[NAME_COLUMN].strip()
+                try:
+                    lat = float(row[LATITUDE_COLUMN])
+                    lon = float(row[LONGITUDE_COLUMN])
+                except ValueError as e:
+                    print(f"Could not convert lat/lon to float for port {port_name}: {e}")
+                    continue
+                names.append(port_name)
+                alternate_names.append(row[ALTERNATE_NAME_COLUMN].strip())
+                locodes.append(row[LOCODE_COLUMN].strip())
+                countries.append(row[COUNTRY_COLUMN].strip())
+                latitudes.append(lat)
+                longitudes.append(lon)
+        return cls(names, alternate_names, locodes, countries, latitudes, longitudes)
+
+    def __len__(self):
+        return len(self.names)
+
+    def find(self, key):
+        """Index of a port by name or UN/LOCODE, or None."""
+        if not isinstance(key, str):
+            return None
+        i = self.by_name.get(key)
+        if i is None:
+            i = self.by_locode.get(normalize_locode(key))
+        return i
+
+    def port(self, i):
+        return {
+            "name": self.names[i],
+            "latitude": self.latitudes[i],
+            "longitude": self.longitudes[i],
+            "locode": self.locodes[i],
+            "country": self.countries[i],
+        }
+
+    def get(self, key):
+        """Port dict by name or UN/LOCODE, or None."""
+        i = self.find(key)
+        return None if i is None else self.port(i)
 
-    with open(csv_filepath, mode = "r", encoding="utf-8") as csvfile:
-        reader = csv.reader(csvfile)
-        next(reader)
+    def records(self):
+        # All ports as dicts, built once; callers must not modify them
+        if self._records is None:
+            self._records = [self.port(i) for i in range(len(self))]
+        return self._records
 
-        for row in reader:
-            port_name = row[3].strip()
-            lat = row[30].strip()
-            lon = row[31].strip()
-            ports.append({"name": port_name, "latitude": lat, "longitude": lon})
+    def autocomplete(self, query, limit=10):
+        """Ports matching a typed query: an exact UN/LOCODE first, then names
+        starting with the query, then names containing it, then close
+        spellings."""
+        query = query.strip().lower()
+        if not query:
+            return []
+        matches = []
+        seen = set()
 
-    return ports
+        def add(i):
+            if i not in seen and len(matches) < limit:
+                seen.add(i)
+                matches.append(i)
 
-    
\ No newline at end of file
+        locode = self.by_locode.get(normalize_locode(query))
+        if locode is not None:
+            add(locode)
+
+        start = bisect.bisect_left(self._sorted_keys, query)
+        for key, i in self._sorted_names[start:]:
+            if not key.startswith(query) or len(matches) >= limit:
+                break
+            add(i)
+
+        if len(matches) < limit:
+            for key, i in self._sorted_names:
+                if query in key:
+                    add(i)
+                    if len(matches) >= limit:
+                        break
+
+        if len(matches) < limit:
+            for key in difflib.get_close_matches(query, self._sorted_keys, n=limit - len(matches), cutoff=0.7):
+                add(self._sorted_names[bisect.bisect_left(self._sorted_keys, key)][1])
+
+        return [self.port(i) for i in matches]
+
+    def snapped_nodes(self, graph, radius=50.0):
+        """Graph node of every port (-1 when none is within radius km), computed
+        once per graph version."""
+        key = (graph.version, radius)
+        nodes = self._snapped.get(key)
+        if nodes is None:
+            with self._lock:
+                nodes = self._snapped.get(key)
+                if nodes is None:
+                    from .spatial_index import get_spatial_index
+
+                    nodes, _ = get_spatial_index(graph).nearest_many(self.latitudes, self.longitudes, radius)
+                    self._snapped = {key: nodes}
+        return nodes
+
+    def snapped_node(self, i, graph, radius=50.0):
+        node = int(self.snapped_nodes(graph, radius)[i])
+        return None if node < 0 else node
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_port_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PortRegistry.from_csv()
+    return _registry
+
+
+def parse_ports():
+    # All ports as {"name", "latitude", "longitude", ...} dicts
+    return get_port_registry().records()
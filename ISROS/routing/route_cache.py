@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+route_cache_path = os.path.join(script_dir, 'grid_map', 'route_cache.sqlite3')
+
+
+class RouteCache:
+    """Search results keyed on (start node, goal node, routing mode).
+
+    Entries live in a bounded in-memory LRU backed by a local SQLite file that
+    survives restarts and is shared by every worker on the machine. Each entry
+    is stored under the graph/weather version it was computed for, so workers
+    on different versions do not evict each other's routes; when a worker
+    moves to a new version, disk rows of all but the keep_versions most
+    recently written versions are dropped.
+    Only the node ids and the search cost are stored, ship and fuel figures
+    are cheap and recomputed on top of the cached geometry.
+    """
+
+    def __init__(self, max_entries=1024, keep_versions=8, db_path=route_cache_path):
+        self.max_entries = max_entries
+        self.keep_versions = keep_versions
+        self.db_path = db_path
+        self.version = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        # A list to note every put in, see merge
+        self.journal = None
+
+    def _connection(self):
+        if self._db is None and self.db_path is not None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(routes)")]
+            if columns and 'stored_at' not in columns:
+                # A cache file from before rows were kept per version
+                self._db.execute("DROP TABLE routes")
+            self._db.execute("CREATE TABLE IF NOT EXISTS routes (key TEXT, version TEXT, nodes BLOB, cost REAL, "
+                             "stored_at REAL, PRIMARY KEY (key, version))")
+            self._db.commit()
+        return self._db
+
+    def _set_version(self, version):
+        # Called with the lock held
+        if version == self.version:
+            return
+        self.version = version
+        self._entries.clear()
+        db = self._connection()
+        if db is not None:
+            # Other workers may still be on an older version, so only the
+            # least recently written versions beyond keep_versions go
+            db.execute("DELETE FROM routes WHERE version != ? AND version NOT IN (SELECT version FROM routes "
+                       "GROUP BY version ORDER BY MAX(stored_at) DESC LIMIT ?)", (version, self.keep_versions))
+            db.commit()
+
+    @staticmethod
+    def make_key(start, goal, mode):
+        return f"{int(start)}:{int(goal)}:{mode}"
+
+    def get(self, start, goal, mode, version):
+        """Return (node ids, cost) or None."""
+        key = self.make_key(start, goal, mode)
+        with self._lock:
+            self._set_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            db = self._connection()
+            row = None
+            if db is not None:
+                row = db.execute("SELECT nodes, cost FROM routes WHERE key = ? AND version = ?",
+                                 (key, version)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            entry = (np.frombuffer(row[0], dtype=np.int64).tolist(), row[1])
+            self._remember(key, entry)
+            self.hits += 1
+            self.disk_hits += 1
+            return entry
+
+    def put(self, start, goal, mode, version, nodes, cost):
+        key = self.make_key(start, goal, mode)
+        entry = (list(nodes), float(cost))
+        with self._lock:
+            self._set_version(version)
+            self._remember(key, entry)
+            db = self._connection()
+            if db is not None:
+                db.execute("INSERT OR REPLACE INTO routes (key, version, nodes, cost, stored_at) "
+                           "VALUES (?, ?, ?, ?, ?)",
+                           (key, version, np.asarray(entry[0], dtype=np.int64).tobytes(), entry[1], time.time()))
+                db.commit()
+            if self.journal is not None:
+                self.journal.append((start, goal, mode, version, entry[0], entry[1]))
+
+    def merge(self, journal):
+        # Entries another process put, and already wrote to the shared file
+        with self._lock:
+            for start, goal, mode, version, nodes, cost in journal:
+                self._set_version(version)
+                self._remember(self.make_key(start, goal, mode), (list(nodes), float(cost)))
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM routes")
+                db.commit()
+
+    def _after_fork(self):
+        # An SQLite connection must not be used across fork, and the lock may
+        # have been held by a thread that does not exist in the child
+        self._lock = threading.Lock()
+        self._db = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "version": self.version,
+            }
+
+
+route_cache = RouteCache()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=route_cache._after_fork)
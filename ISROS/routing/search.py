@@ -0,0 +1,247 @@
+import heapq
+import math
+import time
+import weakref
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_heuristic(engine, goal):
+    # Great-circle distance to the goal from the precomputed unit vectors:
+    # the chord length c between two points gives the arc as 2R * asin(c / 2)
+    xyz = engine.unit_vectors
+    goal_xyz = np.asarray(xyz[goal], dtype=np.float64)
+
+    def heuristic(nodes):
+        chord = np.sqrt(np.sum((xyz[nodes] - goal_xyz) ** 2, axis=1))
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+
+    return heuristic
+
+
+def zero_heuristic(engine, goal):
+    # Turns A* into Dijkstra
+    def heuristic(nodes):
+        return np.zeros(len(nodes))
+
+    return heuristic
+
+
+class SearchResult:
+    # ``bound`` is the proven ratio between ``cost`` and the optimal cost
+    def __init__(self, nodes, cost, expanded, bound=1.0):
+        self.nodes = nodes
+        self.cost = cost
+        self.expanded = expanded
+        self.bound = bound
+
+
+class SearchTimeout(Exception):
+    """A search ran past its deadline."""
+
+
+# Expansions between two deadline checks
+DEADLINE_CHECK_INTERVAL = 256
+
+# The heuristics work on float32 coordinates and tables, lower bounds built
+# from them are relaxed by this fraction so the reported bound still holds
+BOUND_TOLERANCE = 1e-6
+
+
+class SearchEngine:
+    """A* over the integer node ids of a CSRGraph.
+
+    ``heuristic`` is a factory ``heuristic(engine, goal)`` returning a function
+    that maps an array of node ids to lower bounds on their remaining cost.
+    ``cost`` optionally rewrites the base edge weights of one expansion:
+    ``cost(node, g, edges, neighbors, weights)`` receives the expanded node, its
+    cost so far, the slice of its edges in the CSR arrays, the neighbour ids and
+    their base weights, and returns the weights to use (``inf`` blocks an edge).
+
+    ``weight`` above 1 inflates the heuristic (weighted A*): fewer nodes are
+    expanded and the cost found is at most ``weight`` times the optimum. The
+    result reports a bound that is often tighter, from the smallest
+    uninflated ``g + h`` left open when the goal was reached. ``deadline`` is
+    a ``time.perf_counter()`` value after which SearchTimeout is raised.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.indptr = graph.indptr
+        self.indices = graph.indices
+        self.weights = graph.weights
+        self.unit_vectors = graph.unit_vectors()
+
+    def search(self, start, goal, heuristic=haversine_heuristic, cost=None, weight=1.0, deadline=None):
+        h = heuristic(self, goal)
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+
+        g_score = {start: 0.0}
+        came_from = {}
+        closed = set()
+        # Lower costs found for closed nodes, only an inflated heuristic causes
+        # them. The nodes are not reopened and keep their g and parent, so the
+        # returned path costs exactly g(goal); the lower costs only tighten
+        # the bound.
+        improved = {}
+        # The heap only holds flat (f, node) pairs, stale entries are skipped on pop
+        open_heap = [(weight * float(h(np.array([start]))[0]), start)]
+        expanded = 0
+
+        while open_heap:
+            _, current = heapq.heappop(open_heap)
+            if current in closed:
+                continue
+            if current == goal:
+                result = SearchResult(self._reconstruct(came_from, goal), g_score[goal], expanded)
+                if weight > 1:
+                    result.bound = self._suboptimality_bound(h, g_score, open_heap, closed, improved, result.cost, weight)
+                return result
+            closed.add(current)
+            expanded += 1
+            if deadline is not None and expanded % DEADLINE_CHECK_INTERVAL == 0 and time.perf_counter() > deadline:
+                raise SearchTimeout(f"Search expanded {expanded} nodes before its deadline.")
+
+            g_current = g_score[current]
+            start_edge, end_edge = int(indptr[current]), int(indptr[current + 1])
+            neighbors = indices[start_edge:end_edge]
+            edge_weights = weights[start_edge:end_edge].astype(np.float64)
+            if cost is not None:
+                edge_weights = cost(current, g_current, slice(start_edge, end_edge), neighbors, edge_weights)
+
+            tentative = g_current + edge_weights
+            estimates = h(neighbors)
+            if weight != 1:
+                estimates = weight * estimates
+            for neighbor, g_new, h_new in zip(neighbors.tolist(), tentative.tolist(), estimates.tolist()):
+                if neighbor in closed:
+                    if g_new < improved.get(neighbor, g_score[neighbor]):
+                        improved[neighbor] = g_new
+                elif g_new < g_score.get(neighbor, math.inf):
+                    g_score[neighbor] = g_new
+                    came_from[neighbor] = current
+                    heapq.heappush(open_heap, (g_new + h_new, neighbor))
+
+        return None
+
+    @staticmethod
+    def _suboptimality_bound(h, g_score, open_heap, closed, improved, cost, weight):
+        # The optimum is at least the smallest g + h over the open and improved
+        # nodes (the ARA* argument), which proves cost / that much
+        frontier = {node for _, node in open_heap if node not in closed} | improved.keys()
+        if not frontier or cost <= 0:
+            return 1.0
+        frontier = np.fromiter(frontier, dtype=np.int64, count=len(frontier))
+        g = np.array([improved.get(node, g_score[node]) for node in frontier.tolist()])
+        lower = min(float(np.min(g + h(frontier))), cost) * (1 - BOUND_TOLERANCE)
+        if lower <= 0:
+            return weight
+        return max(1.0, min(weight, cost / lower))
+
+    def bidirectional_search(self, start, goal, heuristic=haversine_heuristic, cost=None, reverse_cost=None):
+        """A* from both ends at once, meeting in the middle.
+
+        Both directions use the average potential ``p(v) = (h_goal(v) -
+        h_start(v)) / 2``, forward as ``g + p`` and backward as ``g - p``,
+        which keeps them consistent whenever the heuristic is; with
+        zero_heuristic this is plain bidirectional Dijkstra. ``reverse_cost``
+        is the cost callback of the backward search: it gets the edges out of
+        the expanded node and returns the weights of their opposite directions.
+        The search stops once the two smallest keys add up to the cost of the
+        best meeting found so far, which makes that path optimal.
+        """
+        if start == goal:
+            return SearchResult([start], 0.0, 0)
+        h_goal, h_start = heuristic(self, goal), heuristic(self, start)
+
+        def potential(nodes):
+            return (h_goal(nodes) - h_start(nodes)) / 2
+
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        p_start, p_goal = potential(np.array([start, goal])).tolist()
+        # Index 0 is the forward search from start, 1 the backward one from goal
+        g_scores = ({start: 0.0}, {goal: 0.0})
+        came_from = ({}, {})
+        closed = (set(), set())
+        heaps = ([(p_start, start)], [(-p_goal, goal)])
+        signs = (1.0, -1.0)
+        costs = (cost, reverse_cost)
+        best, meeting = math.inf, None
+        expanded = 0
+
+        while True:
+            # Drop stale entries so the heap tops are real keys
+            for side in (0, 1):
+                heap = heaps[side]
+                while heap and heap[0][1] in closed[side]:
+                    heapq.heappop(heap)
+            if not heaps[0] or not heaps[1] or heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            _, current = heapq.heappop(heaps[side])
+            g_score, other_g_score = g_scores[side], g_scores[1 - side]
+            closed[side].add(current)
+            expanded += 1
+
+            g_current = g_score[current]
+            start_edge, end_edge = int(indptr[current]), int(indptr[current + 1])
+            neighbors = indices[start_edge:end_edge]
+            edge_weights = weights[start_edge:end_edge].astype(np.float64)
+            if costs[side] is not None:
+                edge_weights = costs[side](current, g_current, slice(start_edge, end_edge), neighbors, edge_weights)
+
+            tentative = g_current + edge_weights
+            keys = tentative + signs[side] * potential(neighbors)
+            for neighbor, g_new, key in zip(neighbors.tolist(), tentative.tolist(), keys.tolist()):
+                if g_new < g_score.get(neighbor, math.inf):
+                    g_score[neighbor] = g_new
+                    came_from[side][neighbor] = current
+                    heapq.heappush(heaps[side], (key, neighbor))
+                    through = g_new + other_g_score.get(neighbor, math.inf)
+                    if through < best:
+                        best, meeting = through, neighbor
+
+        if meeting is None:
+            return None
+        # Forward half up to the meeting node, then the backward parents lead to the goal
+        path = self._reconstruct(came_from[0], meeting)
+        node = meeting
+        while node in came_from[1]:
+            node = came_from[1][node]
+            path.append(node)
+        return SearchResult(path, best, expanded)
+
+    def path_cost(self, nodes, cost=None):
+        """Cost of a node path under the same weights and cost callback a search uses."""
+        total = 0.0
+        for node, next_node in zip(nodes, nodes[1:]):
+            start_edge, end_edge = int(self.indptr[node]), int(self.indptr[node + 1])
+            neighbors = self.indices[start_edge:end_edge]
+            edge_weights = self.weights[start_edge:end_edge].astype(np.float64)
+            if cost is not None:
+                edge_weights = cost(node, total, slice(start_edge, end_edge), neighbors, edge_weights)
+            total += float(edge_weights[np.flatnonzero(neighbors == next_node)].min())
+        return total
+
+    @staticmethod
+    def _reconstruct(came_from, node):
+        path = [node]
+        while node in came_from:
+            node = came_from[node]
+            path.append(node)
+        path.reverse()
+        return path
+
+
+_engines = weakref.WeakKeyDictionary()
+
+
+def get_search_engine(graph):
+    # One engine per loaded graph so the unit vectors are only mapped once
+    engine = _engines.get(graph)
+    if engine is None:
+        engine = SearchEngine(graph)
+        _engines[graph] = engine
+    return engine
@@ -1,3 +1,5 @@
+import numpy as np
+
 class Ship:
     def __init__(self, name, average_speed_knots, max_dwt, fuel_consumption_rate, propeller_condition_factor=1.0):
         self.name = name
@@ -52,6 +54,106 @@ class Ship:
 
         return fuel_consumption, cost
 
+    def get_voyage_figures(self, distance_km, load_percentage, fuel_price_per_ton):
+        # Travel time, fuel and cost figures for a route of the given length
+        adjusted_speed_knots = self.get_adjusted_speed_knots(load_percentage)
+        fuel_consumption_per_hour = self.get_fuel_consumption_per_hour(load_percentage)
+        fuel_cost_per_nautical_mile = self.get_fuel_cost_per_nautical_mile(load_percentage, fuel_price_per_ton)
+
+        travel_time_hours = distance_km / (float(self.average_speed_knots) * 1.852)
+        fuel_consumption = travel_time_hours * self.fuel_consumption_rate
+
+        return {
+            "distance_km": distance_km,
+            "average_speed_knots": self.average_speed_knots,
+            "adjusted_speed_kmh": round(self.get_adjusted_speed_kmh(load_percentage), 3),
+            "fuel_consumption_per_hour": fuel_consumption_per_hour,
+            "fuel_cost_per_nautical_mile": round(fuel_cost_per_nautical_mile, 3),
+            "total_fuel_consumption": round(fuel_consumption_per_hour * (distance_km / adjusted_speed_knots), 3),
+            "total_fuel_cost": round(fuel_cost_per_nautical_mile * distance_km, 3),
+            "fuel_consumption_rate": self.fuel_consumption_rate,
+            "travel_time_hours": round(travel_time_hours, 3),
+            "fuel_consumption": round(fuel_consumption, 3),
+        }
+
+    # Array variants of the methods above, named in the plural. Every argument
+    # may be a scalar or a NumPy array and the results broadcast like NumPy
+    # arithmetic does.
+
+    def get_speed_adjustment_factors(self, load_percentages):
+        load_percentages = np.asarray(load_percentages, dtype=np.float64)
+        if np.any((load_percentages < 0) | (load_percentages > 100)):
+            raise ValueError("Load percentage must be between 0 and 100.")
+        return 1 - 0.1 * (load_percentages / 100)
+
+    def get_adjusted_speeds_knots(self, load_percentages):
+        return self.average_speed_knots * self.get_speed_adjustment_factors(load_percentages)
+
+    def get_fuel_consumptions_per_hour(self, speeds_knots, load_percentages):
+        # Same cubic speed law as get_fuel_consumption_per_hour, for any speed
+        # instead of only the adjusted one
+        load_percentages = np.asarray(load_percentages, dtype=np.float64)
+        speed_ratio = np.asarray(speeds_knots, dtype=np.float64) / self.average_speed_knots
+        return self.fuel_consumption_rate * speed_ratio ** 3 * (1 + load_percentages / 100) * self.propeller_condition_factor
+
+    def get_fuel_consumptions_per_nautical_mile(self, speeds_knots, load_percentages):
+        return self.get_fuel_consumptions_per_hour(speeds_knots, load_percentages) / np.asarray(speeds_knots, dtype=np.float64)
+
+    def get_fuel_costs_per_nautical_mile(self, speeds_knots, load_percentages, fuel_prices_per_ton):
+        return self.get_fuel_consumptions_per_nautical_mile(speeds_knots, load_percentages) * np.asarray(fuel_prices_per_ton, dtype=np.float64)
+
+    def laycan_sweep(self, distance_km, load_percentage, fuel_price_per_ton, day_values, num_speeds=200,
+                     min_speed_fraction=0.5):
+        """Fuel cost and profit over a range of speeds for a route of fixed length.
+
+        ``day_values[d]`` is what delivering on day ``d + 1`` is worth (arrival
+        within the first 24 hours is day 1); arriving after the last listed
+        day misses the laycan and is worth nothing. Speeds run from
+        min_speed_fraction of the adjusted speed up to the adjusted speed.
+        Returns the per-speed arrays, the cheapest speed for every reachable
+        arrival day (the cost-vs-arrival-day curve) and the profit-maximizing
+        speed.
+        """
+        max_speed = float(self.get_adjusted_speeds_knots(load_percentage))
+        speeds = np.linspace(min_speed_fraction * max_speed, max_speed, num_speeds)
+        travel_hours = distance_km / (speeds * 1.852)
+        # A zero-length voyage arrives on day 1 like any other within 24 hours
+        arrival_day = np.maximum(np.ceil(travel_hours / 24).astype(np.int64), 1)
+        fuel_tons = self.get_fuel_consumptions_per_hour(speeds, load_percentage) * travel_hours
+        fuel_cost = fuel_tons * fuel_price_per_ton
+
+        day_values = np.asarray(day_values, dtype=np.float64)
+        on_time = arrival_day <= len(day_values)
+        revenue = np.where(on_time, day_values[np.minimum(arrival_day, len(day_values)) - 1], 0.0) \
+            if len(day_values) else np.zeros(num_speeds)
+        profit = revenue - fuel_cost
+
+        # Fuel per voyage grows with the square of the speed, so the slowest
+        # speed arriving on a given day is the cheapest one for that day
+        days, cheapest = np.unique(arrival_day, return_index=True)
+        curve = [{"arrival_day": int(day), "speed_knots": float(speeds[i]), "fuel_cost": float(fuel_cost[i]),
+                  "profit": float(profit[i])} for day, i in zip(days, cheapest)]
+
+        best = int(np.argmax(profit))
+        return {
+            "ship": self.name,
+            "speeds_knots": speeds,
+            "travel_hours": travel_hours,
+            "arrival_day": arrival_day,
+            "fuel_tons": fuel_tons,
+            "fuel_cost": fuel_cost,
+            "profit": profit,
+            "curve": curve,
+            "best": {
+                "speed_knots": float(speeds[best]),
+                "arrival_day": int(arrival_day[best]),
+                "travel_hours": float(travel_hours[best]),
+                "fuel_cost": float(fuel_cost[best]),
+                "profit": float(profit[best]),
+                "on_time": bool(on_time[best]),
+            },
+        }
+
 class ContainerCargoShip(Ship):
     def __init__(self, propeller_condition_factor=1.0):
         super().__init__("Container Cargo Ship", 22, 182000, 100, propeller_condition_factor)
@@ -63,3 +165,16 @@ class CrudeOilTankerShip(Ship):
 class RoRoShip(Ship):
     def __init__(self, propeller_condition_factor=1.0):
         super().__init__("Ro-Ro Ship", 17.5, 10000, 60, propeller_condition_factor)
+
+SHIP_TYPES = {
+    "container": ContainerCargoShip,
+    "tanker": CrudeOilTankerShip,
+    "roro": RoRoShip,
+}
+
+def laycan_sweep_all(distance_km, load_percentage, fuel_price_per_ton, day_values, propeller_condition_factor=1.0,
+                     **kwargs):
+    """Ship.laycan_sweep for every ship type, keyed like SHIP_TYPES."""
+    return {key: ship_class(propeller_condition_factor).laycan_sweep(distance_km, load_percentage, fuel_price_per_ton,
+                                                                      day_values, **kwargs)
+            for key, ship_class in SHIP_TYPES.items()}
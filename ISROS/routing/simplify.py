@@ -0,0 +1,96 @@
+import numpy as np
+from .land_mask import get_land_mask
+from .metrics import metrics, stage
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+# Waypoints closer than this to the straight line replacing them are dropped
+DEFAULT_TOLERANCE_KM = 5.0
+
+
+def path_length_km(path):
+    # Great-circle length of a path of (lat, lon) points, the same haversine
+    # sum as pathing.calculate_distance
+    if len(path) < 2:
+        return 0.0
+    points = np.radians(np.asarray(path, dtype=np.float64))
+    lat1, lon1 = points[:-1, 0], points[:-1, 1]
+    lat2, lon2 = points[1:, 0], points[1:, 1]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return float((2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).sum())
+
+
+def simplify_path(path, tolerance_km=DEFAULT_TOLERANCE_KM, land_mask=None, mask_step=0.05):
+    """Douglas–Peucker simplification that never leaves the water.
+
+    A run of waypoints is replaced by the straight segment between its ends
+    only when every waypoint lies within ``tolerance_km`` of that segment and
+    the land mask finds no land along it; otherwise the run is split at its
+    farthest waypoint. With ``tolerance_km=None`` only the land check applies,
+    which keeps just the waypoints needed to stay in line of sight, an
+    any-angle version of the grid path.
+
+    Segments the search returned are kept as they are, so the result crosses
+    land nowhere the original path did not. Without a land mask nothing can
+    be checked and the path is returned unchanged.
+    """
+    path = list(path)
+    if len(path) < 3:
+        return path
+    if land_mask is None:
+        land_mask = get_land_mask(mask_step)
+        if land_mask is None:
+            return path
+
+    points = np.asarray(path, dtype=np.float64)
+    lats = points[:, 0]
+    # Continuous longitudes so segments across the antimeridian stay short
+    lons = np.unwrap(points[:, 1], period=360)
+
+    keep = np.zeros(len(path), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(path) - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+
+        # Distance of the inner waypoints from the chord, in km on a local
+        # equirectangular projection around the chord's middle
+        scale = np.cos(np.radians((lats[i] + lats[j]) / 2))
+        x = (lons[i:j + 1] - lons[i]) * scale * KM_PER_DEGREE
+        y = (lats[i:j + 1] - lats[i]) * KM_PER_DEGREE
+        length = np.hypot(x[-1], y[-1])
+        if length > 0:
+            deviation = np.abs(x[-1] * y[1:-1] - y[-1] * x[1:-1]) / length
+        else:
+            deviation = np.hypot(x[1:-1], y[1:-1])
+        k = int(np.argmax(deviation))
+
+        if ((tolerance_km is None or deviation[k] <= tolerance_km)
+                and not land_mask.segment_crosses_land((lats[i], lons[i]), (lats[j], lons[j]))):
+            continue
+
+        k += i + 1
+        keep[k] = True
+        stack.append((i, k))
+        stack.append((k, j))
+
+    return [path[i] for i in np.flatnonzero(keep)]
+
+
+def simplify_route(path, tolerance_km=DEFAULT_TOLERANCE_KM, mask_step=0.05):
+    """The simplified path with its length before and after simplification."""
+    with stage("simplify"):
+        simplified = simplify_path(path, tolerance_km, mask_step=mask_step)
+        route = {
+            "path": simplified,
+            "waypoints": len(simplified),
+            "original_waypoints": len(path),
+            "distance_km": round(path_length_km(simplified), 2),
+            "original_distance_km": round(path_length_km(path), 2),
+        }
+    # Every route handed out passes through here
+    metrics.count_path(route["original_waypoints"], route["original_distance_km"])
+    return route
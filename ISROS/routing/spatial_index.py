@@ -0,0 +1,81 @@
+import os
+import pickle
+import weakref
+import numpy as np
+from scipy.spatial import cKDTree
+from .csr_graph import SPATIAL_INDEX_FILE, to_unit_vectors
+from .search import EARTH_RADIUS_KM
+
+
+def km_to_chord(distance_km):
+    # Straight-line distance through the unit sphere for a great-circle distance
+    angle = np.minimum(np.asarray(distance_km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(angle / 2)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord, dtype=np.float64) / 2, 1.0))
+
+
+class SpatialIndex:
+    """KD-tree over the graph nodes on the unit sphere.
+
+    Euclidean distance between unit vectors is monotonic in great-circle
+    distance, so nearest-neighbour queries and kilometre radii are exact
+    everywhere, including near the poles and across the antimeridian.
+    """
+
+    def __init__(self, tree, num_nodes):
+        self.tree = tree
+        self.num_nodes = num_nodes
+
+    @classmethod
+    def build(cls, graph):
+        return cls(cKDTree(graph.unit_vectors(), balanced_tree=False), graph.number_of_nodes())
+
+    def nearest_many(self, lats, lons, radius_km=50.0):
+        """Return (node ids, distances in km) for arrays of coordinates. Points
+        without a node inside the radius get id -1 and distance inf."""
+        points = to_unit_vectors(np.atleast_1d(lats), np.atleast_1d(lons))
+        chords, nodes = self.tree.query(points, k=1, distance_upper_bound=float(km_to_chord(radius_km)))
+        missing = nodes == self.num_nodes
+        nodes = np.where(missing, -1, nodes)
+        distances = np.where(missing, np.inf, chord_to_km(np.where(missing, 0, chords)))
+        return nodes, distances
+
+    def nearest(self, lat, lon, radius_km=50.0):
+        nodes, distances = self.nearest_many([lat], [lon], radius_km)
+        if nodes[0] < 0:
+            raise ValueError(f"No navigable nodes within a radius of {radius_km} km from point {(lat, lon)}.")
+        return int(nodes[0]), float(distances[0])
+
+
+def load_or_build_spatial_index(graph):
+    # The tree is pickled next to the graph so it is only built once per export
+    path = os.path.join(graph.directory, SPATIAL_INDEX_FILE) if graph.directory else None
+    if path and os.path.isfile(path):
+        with open(path, 'rb') as file:
+            index = pickle.load(file)
+        if index.num_nodes == graph.number_of_nodes():
+            return index
+
+    print("Building spatial index for the graph nodes...")
+    index = SpatialIndex.build(graph)
+    if path:
+        try:
+            with open(path, 'wb') as file:
+                pickle.dump(index, file, pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass
+    return index
+
+
+_indexes = weakref.WeakKeyDictionary()
+
+
+def get_spatial_index(graph):
+    index = _indexes.get(graph)
+    if index is None:
+        index = load_or_build_spatial_index(graph)
+        _indexes[graph] = index
+    return index
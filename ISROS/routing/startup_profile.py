@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ['ISROS.wsgi', 'ISROS.asgi']
+# Modules that should only be imported by the requests that route
+HEAVY_MODULES = ['numpy', 'scipy', 'pandas', 'sklearn', 'networkx', 'folium', 'shapely', 'geopandas']
+
+# Run in a fresh interpreter per sample: time the entry point (Django setup)
+# and then the views module the first request imports, in seconds
+PROBE = """
+import time
+start = time.perf_counter()
+import {entry_point}
+entry = time.perf_counter()
+import routing.views
+print(entry - start, time.perf_counter() - entry)
+"""
+
+
+def parse_importtime(log):
+    """(module, self us, cumulative us, depth) for every line of an -X importtime log."""
+    modules = []
+    for line in log.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def profile_entry_point(entry_point, runs=5):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='ISROS.settings', ISROS_PRELOAD_GRAPH='0')
+    entry_times, first_request_times, log = [], [], ''
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE.format(entry_point=entry_point)],
+                                cwd=project_dir, env=env, capture_output=True, text=True, check=True)
+        entry_time, first_request_time = map(float, result.stdout.split()[-2:])
+        entry_times.append(entry_time)
+        first_request_times.append(first_request_time)
+        log = result.stderr
+
+    # Module breakdown from the last run, the earlier ones warm the OS caches
+    modules = parse_importtime(log)
+    top = sorted(modules, key=lambda module: module[2], reverse=True)[:15]
+    imported = {module[0] for module in modules}
+    return {
+        "entry_point": entry_point,
+        "runs": runs,
+        "entry_seconds_median": statistics.median(entry_times),
+        "first_request_seconds_median": statistics.median(first_request_times),
+        "modules_imported": len(modules),
+        "heavy_modules_imported": [name for name in HEAVY_MODULES if name in imported],
+        "top_cumulative_ms": [{"module": name, "cumulative_ms": cumulative / 1000, "self_ms": self_us / 1000}
+                              for name, self_us, cumulative, _ in top],
+    }, log
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import profile of the WSGI and ASGI entry points.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help="Write the JSON report here, and the raw importtime logs next to it")
+    args = parser.parse_args()
+
+    report = []
+    for entry_point in ENTRY_POINTS:
+        profile, log = profile_entry_point(entry_point, args.runs)
+        report.append(profile)
+        print(f"{entry_point}: setup {profile['entry_seconds_median'] * 1000:.0f} ms, "
+              f"first request imports {profile['first_request_seconds_median'] * 1000:.0f} ms "
+              f"(median of {args.runs}), {profile['modules_imported']} modules, "
+              f"heavy: {', '.join(profile['heavy_modules_imported']) or 'none'}")
+        for module in profile['top_cumulative_ms'][:5]:
+            print(f"    {module['cumulative_ms']:8.1f} ms  {module['module']}")
+        if args.output:
+            with open(f"{os.path.splitext(args.output)[0]}.{entry_point}.importtime.log", 'w') as file:
+                file.write(log)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
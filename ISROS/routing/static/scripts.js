@@ -1,4 +1,16 @@
 document.addEventListener('DOMContentLoaded', function() {
+  // Simulation results come as a small payload drawn on the cached base map
+  const mapFrame = document.getElementById('mapFrame');
+  const routePayload = document.getElementById('routePayload');
+  if (mapFrame && routePayload) {
+    const payload = JSON.parse(routePayload.textContent);
+    const draw = () => mapFrame.contentWindow.drawRoute && mapFrame.contentWindow.drawRoute(payload);
+    mapFrame.addEventListener('load', draw);
+    if (mapFrame.contentDocument && mapFrame.contentDocument.readyState === 'complete') {
+      draw();
+    }
+  }
+
   const vessels = document.querySelectorAll('.vessel');
   const overlay = document.querySelector('.overlay');
   const vesselImages = document.querySelectorAll('.vessel img');
@@ -52,6 +64,31 @@ document.addEventListener('DOMContentLoaded', function() {
       propellerDisplay.textContent = this.value;
   };
 
+  // Port suggestions are fetched as the user types instead of shipping every port with the page
+  document.querySelectorAll('input[data-autocomplete-url]').forEach(function(input) {
+    const options = document.getElementById(input.getAttribute('list'));
+    let pending;
+    input.addEventListener('input', function() {
+      clearTimeout(pending);
+      const query = input.value.trim();
+      if (query.length < 2) {
+        return;
+      }
+      pending = setTimeout(function() {
+        fetch(input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(query))
+          .then(response => response.json())
+          .then(data => {
+            options.replaceChildren(...data.ports.map(port => {
+              const option = document.createElement('option');
+              option.value = port.name;
+              option.label = [port.locode, port.country].filter(Boolean).join(' - ');
+              return option;
+            }));
+          });
+      }, 150);
+    });
+  });
+
   const loadingOverlay = document.getElementById('loadingOverlay');
   const vesselForm = document.getElementById('vesselForm');
 
@@ -0,0 +1,38 @@
+import networkx as nx
+import numpy as np
+
+from routing.csr_graph import load_csr_graph, save_csr_arrays
+from routing.search import EARTH_RADIUS_KM
+
+
+def great_circle_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def lattice_graph(directory, rows=6, cols=7, seed=0, spacing=1.0, detour=0.5):
+    """A rows x cols lattice ``spacing`` degrees apart saved as a CSR graph,
+    and the same graph in networkx to check results against.
+
+    Node ``r * cols + c`` sits at ``(r * spacing, c * spacing)``. Every edge
+    weighs its great-circle length times a random factor in [1.01, 1 + detour],
+    so the haversine heuristic stays admissible despite the float32
+    coordinates while shortest paths are not simply the straight ones.
+    """
+    rng = np.random.default_rng(seed)
+    row, col = np.divmod(np.arange(rows * cols), cols)
+    lat, lon = row * spacing, col * spacing
+    right = np.flatnonzero(col + 1 < cols)
+    down = np.flatnonzero(row + 1 < rows)
+    src = np.concatenate([right, down])
+    dst = np.concatenate([right + 1, down + cols])
+    weights = great_circle_km(lat[src], lon[src], lat[dst], lon[dst]) * rng.uniform(1.01, 1.0 + detour, len(src))
+    # The CSR files keep float32 weights, networkx gets the same values
+    weights = weights.astype(np.float32).astype(np.float64)
+    save_csr_arrays(directory, lat.astype(float), lon.astype(float), src, dst, weights)
+
+    expected = nx.Graph()
+    expected.add_nodes_from(range(rows * cols))
+    expected.add_weighted_edges_from(zip(src.tolist(), dst.tolist(), weights.tolist()))
+    return load_csr_graph(directory), expected
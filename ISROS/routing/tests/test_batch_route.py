@@ -0,0 +1,176 @@
+import json
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ISROS.settings')
+django.setup()
+
+from django.test import RequestFactory  # noqa: E402
+
+from routing import metrics as metrics_module, port_routing, views  # noqa: E402
+from routing.metrics import RoutingMetrics  # noqa: E402
+from routing.route_cache import RouteCache  # noqa: E402
+
+ROUTE = {"path": [(1.0, 2.0), (3.0, 4.0)], "distance_km": 314.0, "original_distance_km": 320.5}
+
+
+class BatchRouteViewTest(unittest.TestCase):
+    def setUp(self):
+        self.routed = []
+
+        def route_port_pairs(pairs, mode, epsilon):
+            for pair in pairs:
+                self.routed.append((pair, mode, epsilon))
+                yield (pair, None, "No path found.") if pair[1] == "Nowhere" else (pair, ROUTE, None)
+
+        patcher = mock.patch.object(views, 'route_port_pairs', route_port_pairs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, body):
+        request = RequestFactory().post('/batch_route/', data=json.dumps(body), content_type='application/json')
+        return views.batch_route(request)
+
+    def results(self, body):
+        response = self.post(body)
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        return {result["index"]: result for result in map(json.loads, lines)}
+
+    def test_identical_pairs_are_routed_once(self):
+        items = [{"from": "Rotterdam", "to": "Singapore", "ship_type": "container"},
+                 {"from": "Rotterdam", "to": "Singapore", "ship_type": "tanker", "weight": 80},
+                 {"from": "Singapore", "to": "Rotterdam", "ship_type": "roro"}]
+        results = self.results({"routes": items, "mode": "dijkstra", "epsilon": 1.5})
+        self.assertEqual(self.routed, [(("Rotterdam", "Singapore"), "dijkstra", 1.5),
+                                       (("Singapore", "Rotterdam"), "dijkstra", 1.5)])
+        self.assertEqual(sorted(results), [0, 1, 2])
+        self.assertEqual(results[0]["path"], [[1.0, 2.0], [3.0, 4.0]])
+        self.assertEqual(results[0]["original_distance_km"], 320.5)
+        self.assertEqual(results[0]["distance_km"], 314.0)
+        # Same route, each item gets the figures of its own ship
+        self.assertNotEqual(results[0]["fuel_consumption_rate"], results[1]["fuel_consumption_rate"])
+
+    def test_bad_items_fail_alone(self):
+        items = [{"from": ["Rotterdam"], "to": "Singapore"},
+                 {"from": {"name": "Rotterdam"}, "to": "Singapore"},
+                 {"from": True, "to": "Singapore"},
+                 "Rotterdam",
+                 {"from": "Rotterdam"},
+                 {"from": "Rotterdam", "to": "Nowhere", "ship_type": "container"},
+                 {"from": "Rotterdam", "to": "Singapore", "ship_type": "submarine"},
+                 {"from": "Rotterdam", "to": "Singapore", "ship_type": "container", "weight": 150},
+                 {"from": "Rotterdam", "to": "Singapore", "ship_type": "container"}]
+        results = self.results({"routes": items})
+        self.assertEqual(len(results), len(items))
+        for index in range(5):
+            self.assertEqual(results[index]["error"], "'from' and 'to' must be port names or codes.")
+        self.assertEqual(results[5]["error"], "No path found.")
+        self.assertEqual(results[6]["error"], "Invalid ship type selected.")
+        self.assertIn("Load percentage", results[7]["error"])
+        self.assertNotIn("error", results[8])
+        self.assertEqual([pair for pair, _, _ in self.routed], [("Rotterdam", "Nowhere"), ("Rotterdam", "Singapore")])
+
+    def test_bad_requests_are_rejected(self):
+        for body in ({}, [], {"routes": "Rotterdam"}, {"routes": [], "epsilon": "fast"},
+                     {"routes": [{}] * (views.BATCH_ROUTE_MAX_REQUESTS + 1)}, {"routes": [], "mode": "teleport"}):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        self.assertEqual(self.routed, [])
+
+
+class FakeGraph:
+    version = 'v1'
+
+
+class FakeOverlay:
+    def is_base(self):
+        return True
+
+
+class RoutePortPairsTest(unittest.TestCase):
+    """The parent side of route_port_pairs, with threads standing in for the worker processes."""
+
+    def setUp(self):
+        self.cache = RouteCache(db_path=None)
+        self.metrics = RoutingMetrics()
+        self.pool = ThreadPoolExecutor(2)
+        self.addCleanup(self.pool.shutdown)
+        self.local = []
+        for patcher in (mock.patch.object(port_routing, 'BATCH_ROUTE_WORKERS', 2),
+                        mock.patch.object(port_routing, 'get_graph', FakeGraph),
+                        mock.patch('routing.cost_overlay.get_cost_overlay', lambda graph: FakeOverlay()),
+                        mock.patch('routing.route_cache.route_cache', self.cache),
+                        mock.patch.object(port_routing, 'metrics', self.metrics),
+                        mock.patch.object(port_routing, '_process_pool', lambda: self.pool),
+                        mock.patch.object(port_routing, 'route_port_pair', self.route_locally)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def route_locally(self, pair, mode, epsilon):
+        self.local.append(pair)
+        return {"path": [], "local": True}, None
+
+    def worker(self, pair, mode, epsilon, graph_version):
+        if pair[0] == "stale":
+            return None
+        worker_metrics = RoutingMetrics()
+        worker_metrics.observe_stage("search_astar", 0.25)
+        journal = [(1, 2, mode, graph_version, [1, 5, 2], 7.0)]
+        return {"path": [pair]}, None, journal, worker_metrics.drain()
+
+    def test_worker_results_are_merged(self):
+        with mock.patch.object(port_routing, '_route_in_worker', self.worker):
+            results = sorted(port_routing.route_port_pairs([("a", "b"), ("c", "d"), ("stale", "e")]))
+        self.assertEqual(results[0], (("a", "b"), {"path": [("a", "b")]}, None))
+        self.assertEqual(results[2], (("stale", "e"), {"path": [], "local": True}, None))
+        self.assertEqual(self.local, [("stale", "e")])
+        self.assertEqual(self.cache.get(1, 2, "astar", "v1"), ([1, 5, 2], 7.0))
+        self.assertEqual(self.metrics.stages["search_astar"].count, 2)
+        self.assertAlmostEqual(self.metrics.stages["search_astar"].sum, 0.5)
+
+    def test_broken_pool_falls_back_to_routing_here(self):
+        def broken(*args):
+            raise BrokenProcessPool("worker died")
+
+        with mock.patch.object(port_routing, '_route_in_worker', broken), \
+                mock.patch.object(port_routing, '_discard_process_pool') as discard:
+            results = list(port_routing.route_port_pairs([("a", "b"), ("c", "d")]))
+        self.assertEqual(sorted(self.local), [("a", "b"), ("c", "d")])
+        self.assertEqual(len(results), 2)
+        discard.assert_called_with(self.pool)
+
+    def test_single_pair_is_routed_here(self):
+        self.assertEqual(list(port_routing.route_port_pairs([("a", "b")])),
+                         [(("a", "b"), {"path": [], "local": True}, None)])
+
+
+class MetricsMergeTest(unittest.TestCase):
+    def test_drain_and_merge(self):
+        worker, parent = RoutingMetrics(), RoutingMetrics()
+        with mock.patch.object(metrics_module, 'METRICS_ENABLED', True):
+            worker.observe_stage("snap", 0.5)
+            worker.count_search("astar", 120)
+            worker.count_path(40, 1200.0)
+            parent.count_search("astar", 30)
+            parent.observe_stage("snap", 1.5)
+
+        recorded = worker.drain()
+        parent.merge(recorded)
+        self.assertEqual((parent.searches["astar"], parent.expanded["astar"]), (2, 150))
+        self.assertEqual((parent.paths, parent.path_waypoints, parent.path_km), (1, 40, 1200.0))
+        self.assertEqual(parent.stages["snap"].count, 2)
+        self.assertEqual(list(parent.stages["snap"].recent), [1.5, 0.5])
+
+        # Drained metrics start over
+        empty = worker.drain()
+        self.assertEqual((empty["stages"], empty["searches"], empty["paths"]), ({}, {}, (0, 0, 0.0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
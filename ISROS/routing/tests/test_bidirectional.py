@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from routing.cost_overlay import CostOverlay
+from routing.csr_graph import load_csr_graph, save_csr_arrays
+from routing.search import SearchEngine, haversine_heuristic, zero_heuristic
+from routing.tests.graphs import lattice_graph
+
+PAIRS = [(0, 255), (15, 240), (37, 200), (130, 129), (250, 3)]
+
+
+class BidirectionalSearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.graph, cls.expected = lattice_graph(os.path.join(cls.tmp.name, 'csr'), rows=16, cols=16, seed=4)
+        cls.engine = SearchEngine(cls.graph)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_finds_shortest_paths(self):
+        for start, goal in PAIRS:
+            for heuristic in (haversine_heuristic, zero_heuristic):
+                result = self.engine.bidirectional_search(start, goal, heuristic=heuristic)
+                self.assertEqual((result.nodes[0], result.nodes[-1]), (start, goal))
+                self.assertTrue(nx.is_path(self.expected, result.nodes))
+                self.assertAlmostEqual(result.cost, nx.path_weight(self.expected, result.nodes, 'weight'), places=6)
+                self.assertAlmostEqual(result.cost, nx.dijkstra_path_length(self.expected, start, goal), places=6)
+
+    def test_expands_fewer_nodes_than_one_sided_dijkstra(self):
+        both = self.engine.bidirectional_search(0, 255, heuristic=zero_heuristic)
+        forward = self.engine.search(0, 255, heuristic=zero_heuristic)
+        self.assertLess(both.expanded, forward.expanded)
+
+    def test_start_is_goal(self):
+        result = self.engine.bidirectional_search(42, 42)
+        self.assertEqual((result.nodes, result.cost, result.expanded), ([42], 0.0, 0))
+
+    def test_disconnected_goal(self):
+        directory = os.path.join(self.tmp.name, 'split')
+        save_csr_arrays(directory, [0.0, 0.0, 5.0, 5.0], [0.0, 1.0, 0.0, 1.0], [0, 2], [1, 3], [111.3, 110.9])
+        engine = SearchEngine(load_csr_graph(directory))
+        self.assertIsNone(engine.bidirectional_search(0, 3))
+        self.assertIsNone(engine.bidirectional_search(0, 3, heuristic=zero_heuristic))
+
+    def test_overlay_costs_match_the_forward_search(self):
+        overlay = CostOverlay(self.graph)
+        # Block most of column 8 and make one row of nodes expensive to enter
+        overlay.set_nodes([r * 16 + 8 for r in range(1, 16)], blocked=True)
+        overlay.set_nodes(np.arange(64, 80), multiplier=3.0)
+        # One direction of a few edges costs more, which only reverse_cost
+        # can tell the backward search
+        overlay.set_edges(np.arange(self.graph.indptr[8], self.graph.indptr[10]), multiplier=2.5)
+
+        reweighted = nx.DiGraph()
+        weights = overlay.edge_weights()
+        sources = np.repeat(np.arange(len(self.graph)), self.graph.degrees())
+        for u, v, w in zip(sources.tolist(), self.graph.indices.tolist(), weights.tolist()):
+            if np.isfinite(w):
+                reweighted.add_edge(u, v, weight=w)
+
+        for start, goal in [(0, 255), (240, 15), (23, 7), (66, 78)]:
+            forward = self.engine.search(start, goal, cost=overlay.cost)
+            both = self.engine.bidirectional_search(start, goal, cost=overlay.cost, reverse_cost=overlay.reverse_cost)
+            self.assertAlmostEqual(both.cost, forward.cost, places=6)
+            self.assertAlmostEqual(both.cost, nx.dijkstra_path_length(reweighted, start, goal), places=6)
+            self.assertAlmostEqual(self.engine.path_cost(both.nodes, overlay.cost), both.cost, places=6)
+            self.assertFalse(any(overlay.is_blocked(node) for node in both.nodes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from routing.cost_overlay import BASE_VERSION, CostOverlay, weather_multiplier
+from routing.csr_graph import load_csr_graph, save_csr_arrays
+from routing.search import SearchEngine
+from routing.tests.graphs import lattice_graph
+
+
+def node(row, col):
+    return row * 8 + col
+
+
+class WeatherMultiplierTest(unittest.TestCase):
+    def test_calm_weather_costs_nothing_extra(self):
+        self.assertEqual(weather_multiplier({}), (1.0, False))
+        self.assertEqual(weather_multiplier({"waveHeight": None, "windSpeed": None}), (1.0, False))
+
+    def test_waves_and_wind_raise_the_multiplier(self):
+        multiplier, blocked = weather_multiplier({"waveHeight": 2.0, "windSpeed": 10.0})
+        self.assertAlmostEqual(multiplier, 1.2)
+        self.assertFalse(blocked)
+
+    def test_storms_block(self):
+        self.assertTrue(weather_multiplier({"waveHeight": 8.0})[1])
+        self.assertTrue(weather_multiplier({"windSpeed": 25.0})[1])
+        self.assertFalse(weather_multiplier({"waveHeight": 7.9, "windSpeed": 24.9})[1])
+
+
+class CostOverlayTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.graph, cls.expected = lattice_graph(os.path.join(cls.tmp.name, 'csr'), rows=8, cols=8, seed=6)
+        cls.engine = SearchEngine(cls.graph)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.overlay = CostOverlay(self.graph)
+
+    def test_base_costs_are_the_graph_weights(self):
+        self.assertTrue(self.overlay.is_base())
+        np.testing.assert_array_equal(self.overlay.edge_weights(), np.asarray(self.graph.weights, dtype=np.float64))
+        result = self.engine.search(node(0, 0), node(7, 7), cost=self.overlay.cost)
+        self.assertAlmostEqual(result.cost, nx.dijkstra_path_length(self.expected, node(0, 0), node(7, 7)), places=6)
+
+    def test_blocked_nodes_are_avoided(self):
+        wall = [node(row, 4) for row in range(7)]
+        self.overlay.set_nodes(wall, blocked=True)
+        result = self.engine.search(node(0, 0), node(0, 7), cost=self.overlay.cost)
+        self.assertIn(node(7, 4), result.nodes)
+        self.assertFalse(set(wall) & set(result.nodes))
+
+        open_graph = self.expected.copy()
+        open_graph.remove_nodes_from(wall)
+        self.assertAlmostEqual(result.cost, nx.dijkstra_path_length(open_graph, node(0, 0), node(0, 7)), places=6)
+
+    def test_fully_blocked_route_is_not_found(self):
+        self.overlay.set_nodes([node(row, 4) for row in range(8)], blocked=True)
+        self.assertIsNone(self.engine.search(node(0, 0), node(0, 7), cost=self.overlay.cost))
+
+    def test_multiplier_scales_edges_into_the_node(self):
+        target = node(3, 3)
+        self.overlay.set_nodes([target], multiplier=2.0)
+        weights = self.overlay.edge_weights()
+        base = np.asarray(self.graph.weights, dtype=np.float64)
+        into = np.asarray(self.graph.indices) == target
+        np.testing.assert_allclose(weights[into], 2 * base[into])
+        np.testing.assert_array_equal(weights[~into], base[~into])
+
+    def test_multipliers_below_one_are_raised_to_one(self):
+        self.overlay.set_nodes([node(3, 3)], multiplier=0.5)
+        self.overlay.set_edges([0, 1], multiplier=0.1)
+        np.testing.assert_array_equal(self.overlay.edge_weights(), np.asarray(self.graph.weights, dtype=np.float64))
+
+    def test_edge_weights_match_the_cost_callback(self):
+        self.overlay.set_nodes([node(2, 2), node(5, 6)], multiplier=1.7)
+        self.overlay.set_nodes([node(4, 4)], blocked=True)
+        self.overlay.set_edges(np.arange(self.graph.indptr[node(1, 1)], self.graph.indptr[node(1, 2)]), multiplier=3.0)
+        self.overlay.set_edges([int(self.graph.indptr[node(6, 6)])], blocked=True)
+        weights = self.overlay.edge_weights()
+        for current in range(len(self.graph)):
+            edges = slice(int(self.graph.indptr[current]), int(self.graph.indptr[current + 1]))
+            neighbors, base = self.graph.neighbors(current)
+            np.testing.assert_array_equal(
+                self.overlay.cost(current, 0.0, edges, neighbors, base.astype(np.float64)), weights[edges])
+
+    def test_reverse_cost_is_the_cost_of_the_opposite_edges(self):
+        self.overlay.set_nodes([node(2, 2)], multiplier=1.5)
+        self.overlay.set_edges(np.arange(self.graph.indptr[node(2, 3)], self.graph.indptr[node(2, 4)]), multiplier=2.0)
+        weights = self.overlay.edge_weights()
+        reverse = self.graph.reverse_edges()
+        for current in (node(2, 2), node(2, 3), node(2, 4), node(6, 1)):
+            edges = slice(int(self.graph.indptr[current]), int(self.graph.indptr[current + 1]))
+            neighbors, base = self.graph.neighbors(current)
+            np.testing.assert_allclose(
+                self.overlay.reverse_cost(current, 0.0, edges, neighbors, base.astype(np.float64)),
+                weights[reverse[edges]], rtol=1e-6)
+
+    def test_version_follows_the_updates(self):
+        other = CostOverlay(self.graph)
+        for overlay in (self.overlay, other):
+            overlay.set_nodes([node(1, 1), node(2, 2)], multiplier=1.5)
+            overlay.set_edges([3], blocked=True)
+        self.assertFalse(self.overlay.is_base())
+        self.assertEqual(self.overlay.version, other.version)
+
+        versions = {self.overlay.version}
+        other.set_nodes([node(1, 1)], multiplier=1.5)
+        versions.add(other.version)
+        third = CostOverlay(self.graph)
+        third.set_edges([3], blocked=True)
+        third.set_nodes([node(2, 2), node(1, 1)], multiplier=1.5)
+        versions.add(third.version)
+        self.assertEqual(len(versions), 3)
+
+    def test_reset_returns_to_the_base_costs(self):
+        self.overlay.set_nodes([node(1, 1)], blocked=True)
+        self.overlay.set_edges([5], multiplier=4.0)
+        self.overlay.reset()
+        self.assertEqual(self.overlay.version, BASE_VERSION)
+        self.assertFalse(self.overlay.is_blocked(node(1, 1)))
+        np.testing.assert_array_equal(self.overlay.edge_weights(), np.asarray(self.graph.weights, dtype=np.float64))
+
+    def test_regions_and_weather(self):
+        # One degree of longitude at 3N is about 111 km, so 120 km reaches
+        # the four direct neighbours but not the diagonal ones
+        region = self.overlay.region_nodes(3.0, 3.0, 120.0)
+        self.assertEqual(sorted(region.tolist()), [node(2, 3), node(3, 2), node(3, 3), node(3, 4), node(4, 3)])
+
+        touched = self.overlay.apply_weather([
+            {"lat": 3.0, "lon": 3.0, "waveHeight": 2.0, "windSpeed": 0.0},
+            {"lat": 6.0, "lon": 6.0, "waveHeight": 9.0},
+        ], radius_km=120.0)
+        self.assertEqual(len(touched), 10)
+        np.testing.assert_allclose(self.overlay.node_multiplier[region], 1.1)
+        self.assertTrue(self.overlay.is_blocked(node(6, 6)))
+        self.assertTrue(self.overlay.is_blocked(node(5, 6)))
+        self.assertFalse(self.overlay.is_blocked(node(5, 5)))
+
+        self.overlay.reset_region(6.0, 6.0, 120.0)
+        self.assertFalse(self.overlay.is_blocked(node(6, 6)))
+        np.testing.assert_allclose(self.overlay.node_multiplier[region], 1.1)
+
+    def test_unwalkable_nodes_stay_blocked(self):
+        directory = os.path.join(self.tmp.name, 'walkable')
+        save_csr_arrays(directory, [0.0, 0.0, 0.0], [0.0, 1.0, 2.0], [0, 1], [1, 2], [111.3, 111.3],
+                        walkable=[True, False, True])
+        overlay = CostOverlay(load_csr_graph(directory))
+        self.assertTrue(overlay.is_blocked(1))
+        overlay.set_nodes([1], blocked=False)
+        self.assertFalse(overlay.is_blocked(1))
+        overlay.reset()
+        self.assertTrue(overlay.is_blocked(1))
+        overlay.reset_region(0.0, 1.0, 10.0)
+        self.assertTrue(overlay.is_blocked(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from routing.csr_graph import csr_graph_exists, export_csr_graph, load_csr_graph, save_csr_arrays
+from routing.graph_update import check_graph_connectivity, write_isolated_nodes_to_file
+from routing.tests.graphs import lattice_graph
+
+
+class CSRGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_lattice_round_trips_through_the_files(self):
+        directory = os.path.join(self.tmp.name, 'csr')
+        graph, expected = lattice_graph(directory, rows=4, cols=5)
+        self.assertTrue(csr_graph_exists(directory))
+        self.assertEqual(graph.number_of_nodes(), expected.number_of_nodes())
+        self.assertEqual(graph.number_of_edges(), expected.number_of_edges())
+        # Memory-mapped, not read into memory
+        self.assertIsInstance(graph.indices, np.memmap)
+        for node in expected.nodes:
+            neighbors, weights = graph.neighbors(node)
+            self.assertEqual(sorted(neighbors.tolist()), sorted(expected.neighbors(node)))
+            for neighbor, weight in zip(neighbors.tolist(), weights.tolist()):
+                self.assertAlmostEqual(weight, expected[node][neighbor]['weight'])
+        np.testing.assert_array_equal(graph.degrees(), [expected.degree(node) for node in range(len(graph))])
+        self.assertEqual(graph.coord(6), (1.0, 1.0))
+
+    def test_export_keeps_coordinates_walkable_flags_and_weather_nodes(self):
+        G = nx.Graph()
+        G.add_node((10.0, 20.0), walkable=True)
+        G.add_node((10.5, 20.0), walkable=False)
+        G.add_node((11.0, 20.5))
+        G.add_edge((10.0, 20.0), (10.5, 20.0), weight=55.6)
+        G.add_edge((10.5, 20.0), (11.0, 20.5), weight=77.0)
+        directory = os.path.join(self.tmp.name, 'exported')
+        export_csr_graph(G, directory, weather_nodes=[(11.0, 20.5), (0.0, 0.0)])
+        graph = load_csr_graph(directory)
+
+        nodes = list(G.nodes)
+        self.assertEqual(graph.coords(range(3)), nodes)
+        self.assertEqual(graph.walkable.tolist(), [True, False, True])
+        self.assertEqual(graph.weather_nodes.tolist(), [2])
+        neighbors, weights = graph.neighbors(1)
+        order = np.argsort(neighbors)
+        self.assertEqual(neighbors[order].tolist(), [0, 2])
+        np.testing.assert_allclose(weights[order], [55.6, 77.0], rtol=1e-6)
+
+    def test_components_answer_reachability(self):
+        # Two edges apart from each other and one node without any
+        directory = os.path.join(self.tmp.name, 'split')
+        save_csr_arrays(directory, [0, 0, 5, 5, 9], [0, 1, 5, 6, 9], [0, 2], [1, 3], [111.0, 110.0])
+        graph = load_csr_graph(directory)
+        self.assertEqual(graph.number_of_components(), 3)
+        self.assertTrue(graph.same_component(0, 1))
+        self.assertFalse(graph.same_component(1, 2))
+        self.assertEqual(graph.component_size(4), 1)
+        self.assertFalse(check_graph_connectivity(graph))
+
+    def test_isolated_nodes_are_written_once_across_resumes(self):
+        directory = os.path.join(self.tmp.name, 'isolated')
+        save_csr_arrays(directory, [0, 0, 10, 20.5, 30], [0, 1, 10, 5, 40], [0], [1], [111.0])
+        graph = load_csr_graph(directory)
+        output = os.path.join(self.tmp.name, 'isolated.txt')
+        checkpoint = os.path.join(self.tmp.name, 'checkpoint.txt')
+
+        blocks = write_isolated_nodes_to_file(graph, output, checkpoint)
+        # (30, 40) lies on the upper edges of the bounds and in no block
+        self.assertEqual(sum(blocks.values()), 2)
+        self.assertEqual(blocks[(1, 1)], 1)
+        self.assertEqual(blocks[(2, 0)], 1)
+        write_isolated_nodes_to_file(graph, output, checkpoint)
+        with open(output) as file:
+            self.assertEqual(file.read().splitlines(), ["10.0,10.0", "20.5,5.0", "30.0,40.0"])
+
+
+if __name__ == '__main__':
+    unittest.main()
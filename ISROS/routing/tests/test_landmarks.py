@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from routing.csr_graph import load_csr_graph, save_csr_arrays
+from routing.landmarks import get_landmarks, landmark_heuristic, preprocess_landmarks, select_landmarks
+from routing.search import SearchEngine, haversine_heuristic
+from routing.tests.graphs import lattice_graph
+
+
+class LandmarkHeuristicTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        # Long detours make the great-circle bound weak, which is where ALT helps
+        cls.graph, cls.expected = lattice_graph(os.path.join(cls.tmp.name, 'csr'), rows=15, cols=15, seed=3,
+                                                detour=3.0)
+        cls.engine = SearchEngine(cls.graph)
+        cls.landmarks, cls.table = preprocess_landmarks(cls.graph, count=6, seed=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_landmarks_are_distinct_and_spread_out(self):
+        self.assertEqual(len(set(self.landmarks)), 6)
+        # The farthest-point pick lands on the lattice corners first
+        corners = {0, 14, 210, 224}
+        self.assertTrue(corners & set(self.landmarks[:2]))
+
+    def test_table_holds_graph_distances(self):
+        self.assertEqual(self.table.shape, (self.graph.number_of_nodes(), 6))
+        for k, landmark in enumerate(self.landmarks):
+            lengths = nx.single_source_dijkstra_path_length(self.expected, landmark)
+            np.testing.assert_allclose(self.table[:, k], [lengths[node] for node in range(len(self.graph))], rtol=1e-6)
+        stored_landmarks, stored_table = get_landmarks(self.graph)
+        self.assertEqual(stored_landmarks.tolist(), self.landmarks)
+        np.testing.assert_array_equal(stored_table, self.table)
+
+    def test_bound_is_admissible_and_tighter_than_haversine(self):
+        nodes = np.arange(self.graph.number_of_nodes())
+        for goal in (0, 112, 224):
+            exact = nx.single_source_dijkstra_path_length(self.expected, goal)
+            exact = np.array([exact[node] for node in nodes])
+            alt = landmark_heuristic(self.engine, goal)(nodes)
+            self.assertTrue(np.all(alt <= exact + 1e-6))
+            self.assertTrue(np.all(alt >= haversine_heuristic(self.engine, goal)(nodes) - 1e-9))
+
+    def test_alt_search_is_optimal_and_expands_less(self):
+        plain_expanded = alt_expanded = 0
+        for start, goal in [(0, 224), (14, 210), (100, 7), (220, 30)]:
+            plain = self.engine.search(start, goal, heuristic=haversine_heuristic)
+            alt = self.engine.search(start, goal, heuristic=landmark_heuristic)
+            self.assertAlmostEqual(alt.cost, nx.dijkstra_path_length(self.expected, start, goal), places=6)
+            self.assertAlmostEqual(alt.cost, plain.cost, places=6)
+            plain_expanded += plain.expanded
+            alt_expanded += alt.expanded
+        self.assertLess(alt_expanded, plain_expanded)
+
+    def test_without_a_table_the_bound_is_haversine(self):
+        graph, _ = lattice_graph(os.path.join(self.tmp.name, 'bare'), rows=3, cols=3)
+        engine = SearchEngine(graph)
+        self.assertIsNone(get_landmarks(graph))
+        nodes = np.arange(9)
+        np.testing.assert_array_equal(landmark_heuristic(engine, 8)(nodes), haversine_heuristic(engine, 8)(nodes))
+
+    def test_selection_stays_in_the_largest_component(self):
+        directory = os.path.join(self.tmp.name, 'split')
+        graph, _ = lattice_graph(directory, rows=4, cols=4)
+        # The lattice plus two nodes joined only to each other
+        lat = np.append(graph.lat, [40.0, 41.0])
+        lon = np.append(graph.lon, [40.0, 41.0])
+        src = np.repeat(np.arange(16), np.diff(graph.indptr))
+        keep = src < graph.indices
+        save_csr_arrays(directory, lat, lon, np.append(src[keep], 16), np.append(graph.indices[keep], 17),
+                        np.append(graph.weights[keep], 150.0))
+        landmarks = select_landmarks(load_csr_graph(directory), count=4, seed=0)
+        self.assertTrue(all(landmark < 16 for landmark in landmarks))
+
+
+if __name__ == '__main__':
+    unittest.main()
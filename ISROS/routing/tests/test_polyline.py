@@ -0,0 +1,32 @@
+import unittest
+
+from routing.polyline import decode_polyline, encode_polyline
+
+# The worked example of the format documentation
+EXAMPLE_COORDS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+EXAMPLE_ENCODED = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+class PolylineTest(unittest.TestCase):
+    def test_known_example(self):
+        self.assertEqual(encode_polyline(EXAMPLE_COORDS), EXAMPLE_ENCODED)
+        self.assertEqual(decode_polyline(EXAMPLE_ENCODED), EXAMPLE_COORDS)
+
+    def test_round_trip(self):
+        coords = [(0.0, 0.0), (-33.86785, 151.20732), (51.50853, -0.12574), (1e-5, -1e-5), (89.99999, 179.99999),
+                  (-89.99999, -180.0)]
+        self.assertEqual(decode_polyline(encode_polyline(coords)), coords)
+
+    def test_precision(self):
+        coords = [(12.3456789, -98.7654321)]
+        encoded = encode_polyline(coords, precision=6)
+        self.assertEqual(decode_polyline(encoded, precision=6), [(12.345679, -98.765432)])
+        self.assertLess(len(encode_polyline(coords, precision=5)), len(encoded))
+
+    def test_empty(self):
+        self.assertEqual(encode_polyline([]), '')
+        self.assertEqual(decode_polyline(''), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from routing.port_matrix import (PortMatrix, assemble_port_matrix, build_port_matrix, route_tree, row_path,
+                                 tree_path)
+from routing.tests.graphs import lattice_graph
+
+
+class RouteTreeTest(unittest.TestCase):
+    def test_keeps_only_the_routes_to_the_targets(self):
+        #   0 - 1 - 2 - 3
+        #        \
+        #         4 - 5
+        predecessors = np.array([-9999, 0, 1, 2, 1, 4])
+        nodes, parents = route_tree(predecessors, np.array([2, 4]))
+        self.assertEqual(nodes.tolist(), [0, 1, 2, 4])
+        self.assertEqual(parents.tolist(), [-1, 0, 1, 1])
+        self.assertEqual(tree_path(nodes, parents, 2), [0, 1, 2])
+        self.assertEqual(tree_path(nodes, parents, 4), [0, 1, 4])
+        self.assertIsNone(tree_path(nodes, parents, 5))
+
+    def test_no_targets_gives_an_empty_tree(self):
+        nodes, parents = route_tree(np.array([-9999, 0]), np.array([], dtype=np.int64))
+        self.assertEqual(len(nodes), 0)
+        self.assertIsNone(tree_path(nodes, parents, 0))
+
+
+class PortMatrixTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.csr_dir = os.path.join(cls.tmp.name, 'csr')
+        cls.out_dir = os.path.join(cls.tmp.name, 'matrix')
+        cls.graph, cls.expected = lattice_graph(cls.csr_dir)
+        # Ports on lattice nodes, plus one far from any node that cannot be snapped
+        cls.port_nodes = [0, 13, 20, 29, 41, 13]
+        cls.ports = [{'name': f'port {k}', 'latitude': float(cls.graph.lat[node]),
+                      'longitude': float(cls.graph.lon[node])} for k, node in enumerate(cls.port_nodes)]
+        cls.ports.append({'name': 'inland', 'latitude': -40.0, 'longitude': 100.0})
+        build_port_matrix(csr_dir=cls.csr_dir, out_dir=cls.out_dir, ports=cls.ports, workers=1)
+        cls.matrix = PortMatrix(cls.out_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_distances_match_networkx(self):
+        for i, a in enumerate(self.port_nodes):
+            lengths = nx.single_source_dijkstra_path_length(self.expected, a)
+            for j, b in enumerate(self.port_nodes):
+                self.assertAlmostEqual(self.matrix.distance(i, j), lengths[b], places=2)
+
+    def test_unsnapped_port_has_no_routes(self):
+        last = len(self.ports) - 1
+        self.assertTrue(np.isinf(self.matrix.distances[last, :last]).all())
+        self.assertTrue(np.isinf(self.matrix.distances[:last, last]).all())
+        self.assertIsNone(self.matrix.lookup('port 0', 'inland', self.graph))
+
+    def test_routes_are_shortest_paths_in_both_directions(self):
+        for i in range(len(self.port_nodes)):
+            for j in range(len(self.port_nodes)):
+                if self.port_nodes[i] == self.port_nodes[j]:
+                    continue
+                nodes = self.matrix.route(i, j)
+                self.assertEqual((nodes[0], nodes[-1]), (self.port_nodes[i], self.port_nodes[j]))
+                length = nx.path_weight(self.expected, nodes, 'weight')
+                self.assertAlmostEqual(length, self.matrix.distance(i, j), places=2)
+                self.assertEqual(self.matrix.route(j, i), nodes[::-1])
+
+    def test_lookup_returns_coordinates(self):
+        path, distance = self.matrix.lookup('port 0', 'port 4', self.graph)
+        self.assertEqual(path[0], (0.0, 0.0))
+        self.assertEqual(path[-1], (5.0, 6.0))
+        self.assertAlmostEqual(distance, self.matrix.distance(0, 4))
+
+    def test_reassembled_shards_round_trip(self):
+        # Assembling again from the shards alone gives the same matrix
+        with open(os.path.join(self.out_dir, 'tree_nodes.npy'), 'rb') as file:
+            before = file.read()
+        header = self.matrix
+        with np.load(row_path(self.out_dir, 0)) as shard:
+            snapped = shard['snapped']
+        assemble_port_matrix(self.out_dir, header.names, header.port_nodes, snapped, header.graph_version)
+        with open(os.path.join(self.out_dir, 'tree_nodes.npy'), 'rb') as file:
+            self.assertEqual(file.read(), before)
+        reloaded = PortMatrix(self.out_dir)
+        np.testing.assert_array_equal(reloaded.distances, self.matrix.distances)
+        self.assertEqual(reloaded.route(1, 4), self.matrix.route(1, 4))
+
+    def test_stored_trees_are_smaller_than_all_routes(self):
+        stored = self.matrix.tree_offsets[-1]
+        routes = sum(len(self.matrix.route(i, j)) for i in range(6) for j in range(i + 1, 6)
+                     if self.port_nodes[i] != self.port_nodes[j])
+        self.assertLess(stored, routes)
+        self.assertLessEqual(self.matrix.tree_offsets[1] - self.matrix.tree_offsets[0],
+                             self.graph.number_of_nodes())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from routing.route_cache import RouteCache
+
+
+class RouteCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, 'cache', 'routes.sqlite3')
+
+    def test_memory_only_cache_evicts_least_recently_used(self):
+        cache = RouteCache(max_entries=2, db_path=None)
+        cache.put(1, 2, 'astar', 'v1', [1, 5, 2], 10.0)
+        cache.put(3, 4, 'astar', 'v1', [3, 4], 4.0)
+        self.assertEqual(cache.get(1, 2, 'astar', 'v1'), ([1, 5, 2], 10.0))
+        cache.put(5, 6, 'astar', 'v1', [5, 6], 1.0)
+        self.assertIsNone(cache.get(3, 4, 'astar', 'v1'))
+        self.assertIsNotNone(cache.get(1, 2, 'astar', 'v1'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (2, 1, 2))
+
+    def test_modes_are_kept_apart(self):
+        cache = RouteCache(db_path=None)
+        cache.put(1, 2, 'astar', 'v1', [1, 2], 3.0)
+        self.assertIsNone(cache.get(1, 2, 'dijkstra', 'v1'))
+        self.assertIsNone(cache.get(2, 1, 'astar', 'v1'))
+
+    def test_routes_survive_a_restart(self):
+        RouteCache(db_path=self.db_path).put(7, 9, 'astar', 'v1', [7, 8, 9], 12.5)
+        cache = RouteCache(db_path=self.db_path)
+        self.assertEqual(cache.get(7, 9, 'astar', 'v1'), ([7, 8, 9], 12.5))
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+    def test_versions_do_not_evict_each_other(self):
+        old, new = RouteCache(db_path=self.db_path), RouteCache(db_path=self.db_path)
+        old.put(1, 2, 'astar', 'v1', [1, 2], 1.0)
+        new.put(1, 2, 'astar', 'v2', [1, 3, 2], 2.0)
+        # A worker still on the old version keeps its rows, and never sees the new route
+        self.assertEqual(RouteCache(db_path=self.db_path).get(1, 2, 'astar', 'v1'), ([1, 2], 1.0))
+        self.assertEqual(RouteCache(db_path=self.db_path).get(1, 2, 'astar', 'v2'), ([1, 3, 2], 2.0))
+        self.assertIsNone(RouteCache(db_path=self.db_path).get(1, 2, 'astar', 'v3'))
+
+    def test_only_the_newest_versions_are_kept_on_disk(self):
+        cache = RouteCache(keep_versions=2, db_path=self.db_path)
+        for number in range(5):
+            cache.put(1, 2, 'astar', f'v{number}', [1, 2], float(number))
+        versions = {row[0] for row in sqlite3.connect(self.db_path).execute("SELECT version FROM routes")}
+        # The current version plus the two written most recently before it
+        self.assertEqual(versions, {'v2', 'v3', 'v4'})
+
+    def test_old_cache_file_is_replaced(self):
+        os.makedirs(os.path.dirname(self.db_path))
+        db = sqlite3.connect(self.db_path)
+        db.execute("CREATE TABLE routes (key TEXT PRIMARY KEY, nodes BLOB, cost REAL)")
+        db.execute("INSERT INTO routes VALUES ('1:2:astar', x'00', 1.0)")
+        db.commit()
+        db.close()
+        cache = RouteCache(db_path=self.db_path)
+        self.assertIsNone(cache.get(1, 2, 'astar', 'v1'))
+        cache.put(1, 2, 'astar', 'v1', [1, 2], 1.0)
+        self.assertEqual(RouteCache(db_path=self.db_path).get(1, 2, 'astar', 'v1'), ([1, 2], 1.0))
+
+    def test_journal_carries_puts_to_another_cache(self):
+        worker, parent = RouteCache(db_path=None), RouteCache(db_path=None)
+        worker.put(1, 2, 'astar', 'v1', [1, 2], 1.0)
+        worker.journal = []
+        worker.put(3, 4, 'astar@1.5', 'v1', [3, 5, 4], 2.0)
+        parent.merge(worker.journal)
+        self.assertEqual(worker.journal, [(3, 4, 'astar@1.5', 'v1', [3, 5, 4], 2.0)])
+        self.assertEqual(parent.get(3, 4, 'astar@1.5', 'v1'), ([3, 5, 4], 2.0))
+        self.assertIsNone(parent.get(1, 2, 'astar', 'v1'))
+
+    def test_clear(self):
+        cache = RouteCache(db_path=self.db_path)
+        cache.put(1, 2, 'astar', 'v1', [1, 2], 1.0)
+        cache.clear()
+        self.assertIsNone(cache.get(1, 2, 'astar', 'v1'))
+        self.assertIsNone(RouteCache(db_path=self.db_path).get(1, 2, 'astar', 'v1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
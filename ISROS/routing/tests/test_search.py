@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+import unittest
+
+import networkx as nx
+
+from routing.search import SearchEngine, SearchTimeout, haversine_heuristic, zero_heuristic
+from routing.tests.graphs import lattice_graph
+
+PAIRS = [(0, 399), (19, 380), (45, 310), (207, 12), (150, 151)]
+
+
+class SearchEngineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.graph, cls.expected = lattice_graph(os.path.join(cls.tmp.name, 'csr'), rows=20, cols=20, seed=2)
+        cls.engine = SearchEngine(cls.graph)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def assert_shortest(self, result, start, goal):
+        self.assertEqual((result.nodes[0], result.nodes[-1]), (start, goal))
+        self.assertTrue(nx.is_path(self.expected, result.nodes))
+        self.assertAlmostEqual(result.cost, nx.path_weight(self.expected, result.nodes, 'weight'), places=6)
+        self.assertAlmostEqual(result.cost, nx.dijkstra_path_length(self.expected, start, goal), places=6)
+
+    def test_astar_and_dijkstra_find_shortest_paths(self):
+        for start, goal in PAIRS:
+            for heuristic in (haversine_heuristic, zero_heuristic):
+                self.assert_shortest(self.engine.search(start, goal, heuristic=heuristic), start, goal)
+
+    def test_haversine_expands_fewer_nodes_than_dijkstra(self):
+        astar = self.engine.search(205, 219, heuristic=haversine_heuristic)
+        dijkstra = self.engine.search(205, 219, heuristic=zero_heuristic)
+        self.assertLess(astar.expanded, dijkstra.expanded)
+
+    def test_start_is_goal(self):
+        result = self.engine.search(57, 57)
+        self.assertEqual((result.nodes, result.cost), ([57], 0.0))
+
+    def test_cost_callback_blocks_and_weights_edges(self):
+        # Blocking the middle column leaves only the ways around it
+        blocked = {r * 20 + 10 for r in range(1, 19)}
+
+        def cost(node, g, edges, neighbors, weights):
+            weights = weights * 2
+            weights[[neighbor in blocked for neighbor in neighbors.tolist()]] = float('inf')
+            return weights
+
+        result = self.engine.search(200, 219, cost=cost)
+        self.assertFalse(blocked & set(result.nodes))
+        detour = self.expected.copy()
+        detour.remove_nodes_from(blocked)
+        self.assertAlmostEqual(result.cost, 2 * nx.dijkstra_path_length(detour, 200, 219), places=6)
+        self.assertAlmostEqual(self.engine.path_cost(result.nodes, cost), result.cost, places=6)
+
+    def test_unreachable_goal_returns_none(self):
+        def cost(node, g, edges, neighbors, weights):
+            weights = weights.copy()
+            weights[neighbors == 399] = float('inf')
+            return weights
+
+        self.assertIsNone(self.engine.search(0, 399, cost=cost))
+
+    def test_deadline_raises(self):
+        with self.assertRaises(SearchTimeout):
+            self.engine.search(0, 399, heuristic=zero_heuristic, deadline=time.perf_counter() - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
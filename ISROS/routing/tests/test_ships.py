@@ -0,0 +1,142 @@
+import json
+import os
+import unittest
+
+import django
+import numpy as np
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ISROS.settings')
+django.setup()
+
+from django.test import RequestFactory  # noqa: E402
+
+from routing import views  # noqa: E402
+from routing.ships import SHIP_TYPES, ContainerCargoShip, CrudeOilTankerShip, RoRoShip, laycan_sweep_all  # noqa: E402
+
+LOADS = [0.0, 25.0, 60.0, 100.0]
+
+
+class ShipArrayTest(unittest.TestCase):
+    def test_array_methods_match_the_scalar_ones(self):
+        for ship in (ContainerCargoShip(), CrudeOilTankerShip(1.2), RoRoShip(0.9)):
+            speeds = ship.get_adjusted_speeds_knots(LOADS)
+            np.testing.assert_allclose(ship.get_speed_adjustment_factors(LOADS),
+                                       [ship.get_speed_adjustment_factor(load) for load in LOADS])
+            np.testing.assert_allclose(speeds, [ship.get_adjusted_speed_knots(load) for load in LOADS])
+            np.testing.assert_allclose(ship.get_fuel_consumptions_per_hour(speeds, LOADS),
+                                       [ship.get_fuel_consumption_per_hour(load) for load in LOADS])
+            np.testing.assert_allclose(ship.get_fuel_consumptions_per_nautical_mile(speeds, LOADS),
+                                       [ship.get_fuel_consumption_per_nautical_mile(load) for load in LOADS])
+            np.testing.assert_allclose(ship.get_fuel_costs_per_nautical_mile(speeds, LOADS, 650.0),
+                                       [ship.get_fuel_cost_per_nautical_mile(load, 650.0) for load in LOADS])
+
+    def test_arguments_broadcast(self):
+        ship = ContainerCargoShip()
+        costs = ship.get_fuel_costs_per_nautical_mile([[11.0], [22.0]], 50.0, [500.0, 600.0])
+        self.assertEqual(costs.shape, (2, 2))
+        # Fuel per hour goes with the cube of the speed, so per mile with its square
+        np.testing.assert_allclose(costs[1] / costs[0], 4.0)
+
+    def test_load_outside_the_range_is_rejected(self):
+        ship = RoRoShip()
+        with self.assertRaises(ValueError):
+            ship.get_speed_adjustment_factors([50.0, 101.0])
+        with self.assertRaises(ValueError):
+            ship.get_adjusted_speeds_knots(-1.0)
+        with self.assertRaises(ValueError):
+            ship.laycan_sweep(1000.0, 120.0, 500.0, [1.0])
+
+
+class LaycanSweepTest(unittest.TestCase):
+    def setUp(self):
+        self.ship = ContainerCargoShip()
+
+    def test_best_speed_maximizes_profit(self):
+        # Roughly five days at full speed, the earlier days are worth more
+        distance_km, load, price = 22 * 1.852 * 24 * 4.5, 40.0, 60.0
+        day_values = [900000.0, 800000.0, 700000.0, 650000.0, 600000.0, 550000.0, 500000.0, 400000.0]
+        sweep = self.ship.laycan_sweep(distance_km, load, price, day_values, num_speeds=400)
+
+        speeds = sweep["speeds_knots"]
+        hours = distance_km / (speeds * 1.852)
+        fuel = (self.ship.fuel_consumption_rate * (speeds / self.ship.average_speed_knots) ** 3 * (1 + load / 100)
+                * hours * price)
+        days = np.ceil(hours / 24).astype(int)
+        profit = np.array([day_values[day - 1] if day <= len(day_values) else 0.0 for day in days]) - fuel
+
+        np.testing.assert_allclose(sweep["fuel_cost"], fuel)
+        np.testing.assert_allclose(sweep["profit"], profit)
+        self.assertAlmostEqual(sweep["best"]["profit"], profit.max())
+        self.assertAlmostEqual(sweep["best"]["speed_knots"], speeds[np.argmax(profit)])
+        self.assertEqual(sweep["best"]["arrival_day"], days[np.argmax(profit)])
+        self.assertTrue(sweep["best"]["on_time"])
+        self.assertAlmostEqual(speeds[-1], self.ship.get_adjusted_speed_knots(load))
+        self.assertAlmostEqual(speeds[0], speeds[-1] / 2)
+
+    def test_curve_holds_the_cheapest_speed_of_every_day(self):
+        sweep = self.ship.laycan_sweep(5000.0, 50.0, 500.0, [1.0] * 20)
+        days = [point["arrival_day"] for point in sweep["curve"]]
+        self.assertEqual(days, sorted(set(sweep["arrival_day"].tolist())))
+        for point in sweep["curve"]:
+            same_day = sweep["arrival_day"] == point["arrival_day"]
+            self.assertEqual(point["speed_knots"], sweep["speeds_knots"][same_day].min())
+            self.assertEqual(point["fuel_cost"], sweep["fuel_cost"][same_day].min())
+        costs = [point["fuel_cost"] for point in sweep["curve"]]
+        self.assertEqual(costs, sorted(costs, reverse=True))
+
+    def test_missing_the_laycan_is_worth_nothing(self):
+        # Even full speed needs more than a day
+        sweep = self.ship.laycan_sweep(2000.0, 0.0, 500.0, [1e6])
+        np.testing.assert_allclose(sweep["profit"], -sweep["fuel_cost"])
+        self.assertFalse(sweep["best"]["on_time"])
+        # Losing the delivery anyway, the cheapest speed is the slowest
+        self.assertEqual(sweep["best"]["speed_knots"], sweep["speeds_knots"][0])
+
+    def test_zero_distance_arrives_on_day_one(self):
+        sweep = self.ship.laycan_sweep(0.0, 50.0, 500.0, [100.0, 50.0])
+        self.assertTrue(np.all(sweep["arrival_day"] == 1))
+        self.assertTrue(np.all(sweep["fuel_cost"] == 0))
+        self.assertEqual(sweep["best"]["profit"], 100.0)
+        self.assertEqual(len(sweep["curve"]), 1)
+
+    def test_every_ship_type_is_swept(self):
+        sweeps = laycan_sweep_all(3000.0, 50.0, 500.0, [1e5] * 10, propeller_condition_factor=1.1, num_speeds=50)
+        self.assertEqual(set(sweeps), set(SHIP_TYPES))
+        for key, sweep in sweeps.items():
+            self.assertEqual(sweep["ship"], SHIP_TYPES[key]().name)
+            self.assertEqual(len(sweep["speeds_knots"]), 50)
+
+
+class LaycanSweepViewTest(unittest.TestCase):
+    def post(self, body):
+        request = RequestFactory().post('/laycan_sweep/', data=json.dumps(body), content_type='application/json')
+        return views.laycan_sweep(request)
+
+    def test_distance_sweep(self):
+        response = self.post({"distance_km": 4000, "weight": 30, "gas_price": 550, "day_values": [5e5] * 10})
+        self.assertEqual(response.status_code, 200)
+        payload = json.loads(response.content)
+        self.assertEqual(payload["distance_km"], 4000.0)
+        self.assertEqual(set(payload["ships"]), set(SHIP_TYPES))
+        self.assertEqual(set(payload["ships"]["roro"]), {"ship", "best", "curve"})
+
+    def test_bad_figures_are_rejected(self):
+        for body in ({"distance_km": [1], "day_values": [1]},
+                     {"distance_km": {}, "day_values": [1]},
+                     {"distance_km": "far", "day_values": [1]},
+                     {"distance_km": -5, "day_values": [1]},
+                     {"distance_km": "nan", "day_values": [1]},
+                     {"distance_km": 100},
+                     {"distance_km": 100, "day_values": 3},
+                     [1, 2]):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+
+    def test_bad_load_is_rejected(self):
+        response = self.post({"distance_km": 100, "weight": 150, "day_values": [1]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Load percentage", json.loads(response.content)["error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
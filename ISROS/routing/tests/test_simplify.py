@@ -0,0 +1,98 @@
+import unittest
+from unittest import mock
+
+from routing import simplify
+from routing.simplify import path_length_km, simplify_path, simplify_route
+
+
+class OpenSea:
+    def segment_crosses_land(self, start, end):
+        return False
+
+
+class Island:
+    """Land inside a latitude/longitude box, checked at the segment's sampled points."""
+
+    def __init__(self, south, north, west, east, samples=100):
+        self.box = (south, north, west, east)
+        self.samples = samples
+        self.checked = []
+
+    def segment_crosses_land(self, start, end):
+        self.checked.append((start, end))
+        south, north, west, east = self.box
+        for step in range(self.samples + 1):
+            t = step / self.samples
+            lat = start[0] + t * (end[0] - start[0])
+            lon = start[1] + t * (end[1] - start[1])
+            if south <= lat <= north and west <= lon <= east:
+                return True
+        return False
+
+
+class SimplifyPathTest(unittest.TestCase):
+    def test_straight_line_keeps_its_ends(self):
+        path = [(0.0, lon / 10) for lon in range(51)]
+        self.assertEqual(simplify_path(path, land_mask=OpenSea()), [path[0], path[-1]])
+
+    def test_short_paths_are_returned_as_they_are(self):
+        self.assertEqual(simplify_path([(0.0, 0.0), (1.0, 1.0)], land_mask=OpenSea()), [(0.0, 0.0), (1.0, 1.0)])
+
+    def test_tolerance_decides_what_a_corner_is(self):
+        # The middle waypoint lies 0.1 degrees, about 11 km, off the chord
+        path = [(0.0, 0.0), (0.05, 0.5), (0.1, 1.0), (0.05, 1.5), (0.0, 2.0)]
+        self.assertEqual(simplify_path(path, tolerance_km=20.0, land_mask=OpenSea()), [path[0], path[-1]])
+        self.assertEqual(simplify_path(path, tolerance_km=5.0, land_mask=OpenSea()), [path[0], path[2], path[-1]])
+
+    def test_shortcuts_never_cross_land(self):
+        # A path around the north of an island: the straight line would cross it
+        path = [(0.0, 0.0), (1.0, 0.5), (2.0, 1.0), (2.0, 2.0), (2.0, 3.0), (1.0, 3.5), (0.0, 4.0)]
+        island = Island(-0.5, 1.5, 1.5, 2.5)
+        simplified = simplify_path(path, tolerance_km=None, land_mask=island)
+        self.assertEqual(simplified[0], path[0])
+        self.assertEqual(simplified[-1], path[-1])
+        self.assertLess(len(simplified), len(path))
+        self.assertTrue(set(simplified) <= set(path))
+        for start, end in zip(simplified, simplified[1:]):
+            self.assertFalse(island.segment_crosses_land(start, end), (start, end))
+
+    def test_land_check_applies_within_tolerance(self):
+        path = [(0.0, 0.0), (0.01, 1.0), (0.0, 2.0)]
+        island = Island(-0.5, 0.005, 0.9, 1.1)
+        self.assertEqual(simplify_path(path, tolerance_km=50.0, land_mask=island), path)
+
+    def test_antimeridian_segments_stay_short(self):
+        path = [(0.0, 179.0), (0.0, 179.5), (0.0, -180.0), (0.0, -179.5), (0.0, -179.0)]
+        island = Island(-1.0, 1.0, -1.0, 1.0)
+        self.assertEqual(simplify_path(path, land_mask=island), [path[0], path[-1]])
+        # The chord was checked in continuous longitudes, not across the globe
+        self.assertEqual(island.checked, [((0.0, 179.0), (0.0, 181.0))])
+
+    def test_without_a_land_mask_the_path_is_unchanged(self):
+        path = [(0.0, lon / 10) for lon in range(10)]
+        with mock.patch.object(simplify, 'get_land_mask', return_value=None):
+            self.assertEqual(simplify_path(path), path)
+
+
+class PathLengthTest(unittest.TestCase):
+    def test_one_degree_of_latitude(self):
+        self.assertAlmostEqual(path_length_km([(0.0, 0.0), (1.0, 0.0)]), 111.195, places=3)
+
+    def test_lengths_add_up(self):
+        path = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (2.0, 2.0)]
+        legs = sum(path_length_km(leg) for leg in zip(path, path[1:]))
+        self.assertAlmostEqual(path_length_km(path), legs, places=9)
+        self.assertEqual(path_length_km(path[:1]), 0.0)
+
+    def test_route_summary(self):
+        path = [(0.0, lon / 10) for lon in range(11)]
+        with mock.patch.object(simplify, 'get_land_mask', return_value=OpenSea()):
+            route = simplify_route(path)
+        self.assertEqual(route["path"], [path[0], path[-1]])
+        self.assertEqual((route["waypoints"], route["original_waypoints"]), (2, 11))
+        self.assertEqual(route["distance_km"], route["original_distance_km"])
+        self.assertAlmostEqual(route["distance_km"], 111.19, places=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import networkx as nx
+
+from routing import pathing
+from routing.route_cache import RouteCache
+from routing.search import BOUND_TOLERANCE, SearchEngine, haversine_heuristic, zero_heuristic
+from routing.tests.graphs import lattice_graph
+
+PAIRS = [(0, 399), (19, 380), (45, 310), (207, 12), (150, 170)]
+WEIGHTS = (1.2, 1.5, 3.0)
+
+
+class WeightedSearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.graph, cls.expected = lattice_graph(os.path.join(cls.tmp.name, 'csr'), rows=20, cols=20, seed=5,
+                                                detour=1.0)
+        cls.engine = SearchEngine(cls.graph)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_cost_is_within_the_weight_and_the_reported_bound(self):
+        for start, goal in PAIRS:
+            optimum = nx.dijkstra_path_length(self.expected, start, goal)
+            for weight in WEIGHTS:
+                result = self.engine.search(start, goal, weight=weight)
+                self.assertTrue(nx.is_path(self.expected, result.nodes))
+                self.assertGreaterEqual(result.cost, optimum - 1e-6)
+                self.assertLessEqual(result.cost, weight * optimum + 1e-6)
+                self.assertLessEqual(result.cost / optimum, result.bound * (1 + BOUND_TOLERANCE))
+                self.assertLessEqual(result.bound, weight)
+
+    def test_reported_cost_is_the_cost_of_the_path(self):
+        for start, goal in PAIRS:
+            for weight in WEIGHTS:
+                for heuristic in (haversine_heuristic, zero_heuristic):
+                    result = self.engine.search(start, goal, heuristic=heuristic, weight=weight)
+                    self.assertAlmostEqual(self.engine.path_cost(result.nodes), result.cost, places=6)
+                    self.assertAlmostEqual(nx.path_weight(self.expected, result.nodes, 'weight'), result.cost,
+                                           places=6)
+        self.assertEqual(pathing.check_search_costs(self.graph, PAIRS, weights=WEIGHTS), [])
+
+    def test_inflating_the_heuristic_expands_fewer_nodes(self):
+        exact = sum(self.engine.search(start, goal).expanded for start, goal in PAIRS)
+        inflated = sum(self.engine.search(start, goal, weight=3.0).expanded for start, goal in PAIRS)
+        self.assertLess(inflated, exact)
+
+    def test_exact_search_reports_bound_one(self):
+        self.assertEqual(self.engine.search(0, 399).bound, 1.0)
+
+
+class AnytimePathingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.graph, cls.expected = lattice_graph(os.path.join(cls.tmp.name, 'csr'), rows=20, cols=20, seed=5,
+                                                detour=1.0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        patcher = mock.patch.object(pathing, 'route_cache', RouteCache(db_path=None))
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_generous_budget_returns_the_optimum(self):
+        route = pathing.anytime_node_pathing(self.graph, 0, 399, budget_ms=60000)
+        self.assertTrue(route["exact"])
+        self.assertEqual(route["bound"], 1.0)
+        self.assertAlmostEqual(route["cost"], nx.dijkstra_path_length(self.expected, 0, 399), places=6)
+        self.assertIsNotNone(self.cache.get(0, 399, "astar", pathing.routing_version(self.graph)))
+
+    def test_spent_budget_returns_a_bounded_route_and_refines_it(self):
+        route = pathing.anytime_node_pathing(self.graph, 19, 380, budget_ms=0)
+        optimum = nx.dijkstra_path_length(self.expected, 19, 380)
+        self.assertLessEqual(route["cost"], route["bound"] * optimum * (1 + BOUND_TOLERANCE))
+        self.assertFalse(route["exact"])
+        self.assertLessEqual(route["bound"], pathing.ANYTIME_WEIGHTS[0])
+        self.assertEqual(route["path"][0], self.graph.coord(19))
+        # The refiner runs one job at a time, so the exact search is done once this one is
+        pathing._refiner.submit(lambda: None).result()
+        cached = self.cache.get(19, 380, "astar", pathing.routing_version(self.graph))
+        self.assertAlmostEqual(cached[1], optimum, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
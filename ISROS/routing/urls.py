@@ -11,6 +11,14 @@ urlpatterns = [
     path('logout/', LogoutView.as_view(next_page='index'), name='logout'),
     path('signup/', views.signup, name='signup'),
     path('debug/', views.debug_view, name='debug'),
+    path('map/base/', views.base_map, name="base_map"),
     path('simulate/', views.simulate, name="simulate"),
+    path('routes/batch/', views.batch_route, name="batch_route"),
+    path('ports/autocomplete/', views.port_autocomplete, name="port_autocomplete"),
+    path('laycan/', views.laycan_sweep, name="laycan_sweep"),
+    path('route-cache/', views.route_cache_stats, name="route_cache_stats"),
+    path('weather-cache/', views.weather_cache_stats, name="weather_cache_stats"),
+    path('graph/', views.graph_status, name="graph_status"),
+    path('metrics/', views.metrics_view, name="metrics"),
     # Add other paths as needed
 ]
\ No newline at end of file
@@ -5,125 +5,97 @@ from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
 from django.urls import reverse
 from .forms import SignUpForm
-from .pathing import a_star_pathing, G, weather_nodes, calculate_distance
-from .ships import ContainerCargoShip, CrudeOilTankerShip, RoRoShip
+from .graph_provider import get_graph, graph_provider
+from .weather_cache import weather_cache
 from django.contrib.auth.views import LoginView, LogoutView
 from .utils import get_ports_from_csv
-import folium
 import os
-from .ports import parse_ports
+from .ports import get_port_registry
+from .metrics import metrics, stage, server_timing
+from .port_routing import find_port_route, port_endpoints, route_port_pairs
 
-from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
-import numpy as np
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods, etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.clickjacking import xframe_options_sameorigin
+from django.views.decorators.csrf import csrf_exempt
+import json
+import math
+from datetime import datetime, timezone
 
-def debug_view(request):
-
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    csv_filepath = os.path.join(script_dir, "data", "ports.csv")
-    
-    ports = parse_ports()
+# The routing stack (numpy, scipy, folium and the modules built on them) is
+# imported inside the views that route, so the account pages and every
+# process that never routes start without it.
 
-    hide_input_box = request.session.pop('hide_input_box', False)
-
-    min_lat, max_lat = -90, 90  
-    min_lon, max_lon = -180, 180  
-    
-    # Create a map object centered on the geographic midpoint with a starting zoom level
-    #Always Mercator Projection
-    m = folium.Map(
-        location=[(max_lat + min_lat) / 2, (max_lon + min_lon) / 2],
-        zoom_start=3,
-        min_zoom=3,
-        tiles="Cartodb Positron",
-        max_bounds=[[min_lat, min_lon], [max_lat, max_lon]],  # This will restrict the view to the map's initial bounds
-    )
+BATCH_ROUTE_MAX_REQUESTS = 1000
 
-    bounds = [[min_lat, min_lon], [max_lat, max_lon]]
-    m.fit_bounds(bounds)  # Fit the map to the bounds
+# Addresses allowed to scrape /metrics/, e.g. ISROS_METRICS_ALLOWED_IPS=127.0.0.1,10.0.0.5
+METRICS_ALLOWED_IPS = set(os.environ.get('ISROS_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(','))
 
-    grid_size = 1
-
-    # Create horizontal lines (latitude lines)
-    for lat in range(-90, 90, grid_size):
-        folium.PolyLine([(lat, -180), (lat, 180)], color="blue", weight=0.1).add_to(m)
-
-    # Create vertical lines (longitude lines)
-    for lon in range(-180, 180, grid_size):
-        folium.PolyLine([(-90, lon), (90, lon)], color="blue", weight=0.1).add_to(m)
-
-    # Emphasize the boundaries (equator and prime meridian)
-    folium.PolyLine([(0, -180), (0, 180)], color="red", weight=0.3).add_to(m)  # Equator
-    folium.PolyLine([(-90, 0), (90, 0)], color="red", weight=0.3).add_to(m)  # Prime Meridian
-
-    # Render map to HTML
-    init_map_html = m._repr_html_()
+def debug_view(request):
+    hide_input_box = request.session.pop('hide_input_box', False)
 
+    # The map itself is the cached page served by base_map
     context = {
-        'map_html': init_map_html,
         'hide_input_box': hide_input_box,
-        'ports': ports,
     }
 
     return render(request, 'debug.html', context)
 
+def base_map_etag(request):
+    from .base_map import base_map_html
+    return base_map_html()[1]
+
+@xframe_options_sameorigin
+@cache_control(max_age=24 * 3600)
+@etag(base_map_etag)
+def base_map(request):
+    # Rendered once per process, the browser keeps it across simulations
+    from .base_map import base_map_html
+    return HttpResponse(base_map_html()[0])
+
 @require_http_methods(["POST"])
+@server_timing
 def simulate(request):
-    min_lat, max_lat = -90, 90 
-    min_lon, max_lon = -180, 180 
-    grid_size = 1
-
-    m = folium.Map(
-    location=[0, 0],
-    zoom_start=3,
-    min_zoom=3,
-    tiles="Cartodb Positron",
-    max_bounds=[[min_lat, min_lon], [max_lat, max_lon]],
-)
-    bounds = [[min_lat, min_lon], [max_lat, max_lon]]
-    m.fit_bounds(bounds)  # Fit the map to the bounds
-    
-    #Create horizontal lines (latitude lines)
-    for lat in range(-90, 90, grid_size):
-        folium.PolyLine([(lat, -180), (lat, 180)], color="blue", weight=0.1).add_to(m)
-
-    #Create vertical lines (longitude lines)
-    for lon in range(-180, 180, grid_size):
-        folium.PolyLine([(-90, lon), (90, lon)], color="blue", weight=0.1).add_to(m)
+    from .pathing import time_dependent_pathing, anytime_node_pathing, calculate_distance, ROUTING_MODES
+    from .simplify import simplify_route
+    from .ships import SHIP_TYPES
+    from .base_map import route_payload
 
     # Extract location A and B from the POST data
     loc_a_name = request.POST.get("locationA")
     loc_b_name = request.POST.get("locationB")
     
-    ports = parse_ports()
-    loc_a = next((port for port in ports if port["name"] == loc_a_name), None)
-    loc_b = next((port for port in ports if port["name"] == loc_b_name), None)
+    with stage("ports"):
+        registry = get_port_registry()
+        loc_a = registry.get(loc_a_name)
+        loc_b = registry.get(loc_b_name)
     
     if loc_a is None or loc_b is None:
         return JsonResponse({"error": "One or both locations not found."}, status=400)
 
     ship_type = request.POST.get("shipType")
-    ship_types = {
-        "container": ContainerCargoShip,
-        "tanker": CrudeOilTankerShip,
-        "roro": RoRoShip,
-    }
     # Retrieve cargo weight, propeller condition, and current gas price from POST data
     cargo_weight_percentage = float(request.POST.get("weight", 50))  # Default to 50 if not provided
     propeller_condition = float(request.POST.get("propellerCondition", 1.0))  # Default to 1 if not provided
     current_gas_price = float(request.POST.get("currentGasPrice", 0))  # Default to 0 if not provided
 
-    ship_class = ship_types.get(ship_type)
+    ship_class = SHIP_TYPES.get(ship_type)
     if ship_class is None:
         return JsonResponse({"error": "Invalid ship type selected."}, status=400)
     
     ship = ship_class(propeller_condition_factor=propeller_condition)
 
-    # Calculate the adjusted speed, fuel consumption, and cost
-    adjusted_speed_knots = ship.get_adjusted_speed_knots(cargo_weight_percentage)
-    adjusted_speed_kmh = ship.get_adjusted_speed_kmh(cargo_weight_percentage)
-    fuel_consumption_per_hour = ship.get_fuel_consumption_per_hour(cargo_weight_percentage)
-    fuel_cost_per_nautical_mile = ship.get_fuel_cost_per_nautical_mile(cargo_weight_percentage, current_gas_price)
+    mode = request.POST.get("mode", "astar")
+    if mode not in ROUTING_MODES:
+        return JsonResponse({"error": f"Unknown routing mode '{mode}'."}, status=400)
+
+    # A route within epsilon of the shortest, or the best one found in budget_ms
+    try:
+        epsilon = max(float(request.POST.get("epsilon") or 1.0), 1.0)
+        budget_ms = float(request.POST["budget_ms"]) if request.POST.get("budget_ms") else None
+    except ValueError:
+        return JsonResponse({"error": "epsilon and budget_ms must be numbers."}, status=400)
 
     start_node = (float(loc_a['latitude']), float(loc_a['longitude']))
     goal_node = (float(loc_b['latitude']), float(loc_b['longitude']))
@@ -135,81 +107,210 @@ def simulate(request):
     if goal_node is None:
         return JsonResponse({"error": "Goal location is not walkable or not found."}, status=400)
 
-    # Add markers for start and goal nodes
-    start_marker = folium.Marker(
-        location=[start_node[0], start_node[1]],  # folium takes coordinates in lat, lon order
-        popup=f'Start: {start_node[0]}, {start_node[1]}',
-        icon=folium.Icon(color='green', icon='play')
-    )
-    start_marker.add_to(m)
-    goal_marker = folium.Marker(
-        location=[goal_node[0], goal_node[1]],  # folium takes coordinates in lat, lon order
-        popup=f'Goal: {goal_node[0]}, {goal_node[1]}',
-        icon=folium.Icon(color='red', icon='flag')
-    )
-    goal_marker.add_to(m)
-
-    # Add red transparent circles around weather nodes
-    for node in weather_nodes:
-        folium.Circle(
-            location=node,
-            radius=15000,  
-            color='red',
-            fill=True,
-            fill_opacity=0.2
-        ).add_to(m)
-        
+    graph = get_graph()
+
     try:
-        a_star_path = a_star_pathing(G, start_node, goal_node)
+        # With a departure time the route is chosen for the forecast along the way
+        departure = request.POST.get("departure")
+        timed_route = None
+        bound = None
+        if departure:
+            departure = datetime.fromisoformat(departure)
+            if departure.tzinfo is None:
+                departure = departure.replace(tzinfo=timezone.utc)
+            timed_route = time_dependent_pathing(graph, start_node, goal_node, departure, ship, cargo_weight_percentage,
+                                                 mode=mode)
+            a_star_path = timed_route["path"] if timed_route is not None else None
+        elif budget_ms is not None:
+            endpoints = port_endpoints(graph, loc_a, loc_b)
+            anytime_route = anytime_node_pathing(graph, *endpoints, budget_ms=budget_ms) if endpoints else None
+            a_star_path = anytime_route["path"] if anytime_route is not None else None
+            bound = anytime_route["bound"] if anytime_route is not None else None
+        else:
+            a_star_path = find_port_route(loc_a, loc_b, mode=mode, epsilon=epsilon)
+            bound = epsilon if epsilon > 1 else None
         if a_star_path is None:
             raise ValueError("No path found or the start and goal nodes are not connected.")
-        folium.PolyLine(a_star_path, color="green", weight=1, opacity=1).add_to(m)
 
+        # Straight water-only legs instead of the grid's zig-zag
+        route = simplify_route(a_star_path)
+        a_star_path = route["path"]
         request.session['path'] = a_star_path
         distance_km = calculate_distance(a_star_path)
         
         # Ensure distance_km is a float
         distance_km = float(distance_km)
-        
-        # Ensure ship.average_speed_knots is a float
-        average_speed_knots = float(ship.average_speed_knots)
-        
-        travel_time_hours = distance_km / (average_speed_knots * 1.852)
-        fuel_consumption = travel_time_hours * ship.fuel_consumption_rate
-        travel_time_hours_rounded = round(travel_time_hours, 3)
-        fuel_consumption_rounded = round(fuel_consumption, 3)
 
-        # Calculate the total fuel consumption and cost for the given distance
-        total_fuel_consumption = fuel_consumption_per_hour * (distance_km / adjusted_speed_knots)
-        total_fuel_cost = fuel_cost_per_nautical_mile * distance_km
+        # Travel time, fuel consumption and cost for the given distance
+        voyage_figures = ship.get_voyage_figures(distance_km, cargo_weight_percentage, current_gas_price)
+        voyage_figures["original_distance_km"] = route["original_distance_km"]
+        if bound is not None:
+            # Proven ratio of the grid route's length to the shortest one
+            voyage_figures["suboptimality_bound"] = round(bound, 4)
+        if timed_route is not None:
+            voyage_figures.update({
+                "departure_time": departure.strftime("%Y-%m-%d %H:%M"),
+                "arrival_time": timed_route["arrival"].astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M"),
+                "weather_travel_time_hours": round(timed_route["travel_time_hours"], 3),
+            })
 
     except ValueError as e:
         return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-    # Serialize the map to HTML
-    map_html = m._repr_html_()
-
+    # The page draws the route, the endpoint markers and the red circles
+    # around the weather nodes on the cached base map
     context = {
-        "map_html": map_html,
+        "route_payload": route_payload(a_star_path, start_node, goal_node, graph.coords(graph.weather_nodes)),
         "simulation_run": True,
-        "distance_km": distance_km,
         "locationA": request.POST.get("locationA"),
         "locationB": request.POST.get("locationB"),
         "selected_ship": ship_type,
-        "average_speed_knots": ship.average_speed_knots,
-        "adjusted_speed_kmh": round(adjusted_speed_kmh, 3),
-        "fuel_consumption_per_hour": fuel_consumption_per_hour,
-        "fuel_cost_per_nautical_mile": round(fuel_cost_per_nautical_mile, 3),
-        "total_fuel_consumption": round(total_fuel_consumption, 3),
-        "total_fuel_cost": round(total_fuel_cost, 3),
-        "fuel_consumption_rate": ship.fuel_consumption_rate,
-        "travel_time_hours": travel_time_hours_rounded,
-        "fuel_consumption": fuel_consumption_rounded,
+        **voyage_figures,
     }
 
-    return render(request, 'debug.html', context)
+    with stage("render"):
+        return render(request, 'debug.html', context)
+
+def voyage_result(item, route):
+    # One batch result: the simplified route plus the figures of the requested ship on it
+    from .ships import SHIP_TYPES
+
+    ship_class = SHIP_TYPES.get(item.get("ship_type"))
+    if ship_class is None:
+        return {"error": "Invalid ship type selected."}
+    try:
+        ship = ship_class(propeller_condition_factor=float(item.get("propeller_condition", 1.0)))
+        figures = ship.get_voyage_figures(route["distance_km"],
+                                          float(item.get("weight", 50)), float(item.get("gas_price", 0)))
+    except (TypeError, ValueError) as e:
+        return {"error": str(e)}
+    return {"path": route["path"], "original_distance_km": route["original_distance_km"], **figures}
+
+def is_endpoint(value):
+    # Port names and codes; anything else (lists, objects, booleans) is rejected per item
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def batch_route(request):
+    """Route many port pairs in one call.
+
+    The body is ``{"mode": "astar", "epsilon": 1.0, "routes": [{"from": ..., "to": ...,
+    "ship_type": ..., "weight": ..., "propeller_condition": ..., "gas_price": ...}]}``.
+    Identical port pairs are searched once and the results are streamed back
+    as newline-delimited JSON, one object per request item (tagged with its
+    "index"), in the order the searches finish. Paths are simplified, the
+    distance along the unsimplified grid path is given as "original_distance_km".
+    With an epsilon above 1 routes may be up to that factor longer than the
+    shortest ones and come back faster.
+    """
+    from .pathing import ROUTING_MODES
+
+    try:
+        body = json.loads(request.body)
+        items = body["routes"]
+        mode = body.get("mode", "astar")
+        epsilon = max(float(body.get("epsilon", 1.0)), 1.0)
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Expected a JSON object with a 'routes' list."}, status=400)
+    if not isinstance(items, list) or len(items) > BATCH_ROUTE_MAX_REQUESTS:
+        return JsonResponse({"error": f"'routes' must be a list of at most {BATCH_ROUTE_MAX_REQUESTS} items."}, status=400)
+    if mode not in ROUTING_MODES:
+        return JsonResponse({"error": f"Unknown routing mode '{mode}'."}, status=400)
+
+    # Deduplicate identical pairs, every pair remembers which items asked for it
+    pairs, invalid = {}, []
+    for index, item in enumerate(items):
+        pair = (item.get("from"), item.get("to")) if isinstance(item, dict) else (None, None)
+        if all(is_endpoint(endpoint) for endpoint in pair):
+            pairs.setdefault(pair, []).append(index)
+        else:
+            invalid.append(index)
+
+    def stream():
+        for index in invalid:
+            yield json.dumps({"index": index, "error": "'from' and 'to' must be port names or codes."}) + "\n"
+        for pair, route, error in route_port_pairs(pairs, mode, epsilon):
+            for index in pairs[pair]:
+                result = {"error": error} if error else voyage_result(items[index], route)
+                yield json.dumps({"index": index, "from": pair[0], "to": pair[1], **result}) + "\n"
+
+    return StreamingHttpResponse(stream(), content_type="application/x-ndjson")
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def laycan_sweep(request):
+    """Speed sweep of every ship type for one voyage.
+
+    The body is ``{"from": ..., "to": ..., "weight": ..., "gas_price": ...,
+    "propeller_condition": ..., "day_values": [...]}`` where ``day_values``
+    lists what delivering on day 1, 2, ... is worth; ``"distance_km"`` can
+    be given instead of the two ports. Returns the cost-vs-arrival-day curve
+    and the profit-maximizing speed of every ship type.
+    """
+    from .simplify import simplify_route
+    from .ships import laycan_sweep_all
+
+    try:
+        body = json.loads(request.body)
+        day_values = [float(value) for value in body["day_values"]]
+        load_percentage = float(body.get("weight", 50))
+        fuel_price = float(body.get("gas_price", 0))
+        propeller_condition = float(body.get("propeller_condition", 1.0))
+        distance_km = body.get("distance_km")
+        if distance_km is not None:
+            distance_km = float(distance_km)
+            if not 0 <= distance_km < math.inf:
+                raise ValueError(distance_km)
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Expected a JSON object with a 'day_values' list and numeric figures."},
+                            status=400)
+
+    if distance_km is None:
+        registry = get_port_registry()
+        loc_a, loc_b = registry.get(body.get("from")), registry.get(body.get("to"))
+        if loc_a is None or loc_b is None:
+            return JsonResponse({"error": "One or both locations not found."}, status=400)
+        path = find_port_route(loc_a, loc_b)
+        if path is None:
+            return JsonResponse({"error": "No path found or the start and goal nodes are not connected."}, status=400)
+        distance_km = simplify_route(path)["distance_km"]
+
+    try:
+        sweeps = laycan_sweep_all(distance_km, load_percentage, fuel_price, day_values, propeller_condition)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({
+        "distance_km": distance_km,
+        "ships": {key: {"ship": sweep["ship"], "best": sweep["best"], "curve": sweep["curve"]}
+                  for key, sweep in sweeps.items()},
+    })
+
+def port_autocomplete(request):
+    # Ports matching ?q=, for the location inputs of the debug page
+    try:
+        limit = min(int(request.GET.get("limit", 10)), 50)
+    except ValueError:
+        limit = 10
+    return JsonResponse({"ports": get_port_registry().autocomplete(request.GET.get("q", ""), limit)})
+
+def route_cache_stats(request):
+    from .route_cache import route_cache
+    return JsonResponse(route_cache.stats())
+
+def weather_cache_stats(request):
+    return JsonResponse(weather_cache.stats())
+
+def graph_status(request):
+    return JsonResponse(graph_provider.stats())
+
+def metrics_view(request):
+    # Stage timings and search counters in the Prometheus text format, for local scrapers only
+    if request.META.get("REMOTE_ADDR") not in METRICS_ALLOWED_IPS:
+        return HttpResponse("Forbidden", status=403, content_type="text/plain")
+    return HttpResponse(metrics.prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 def export_path(request):
     path = request.session.get('path')
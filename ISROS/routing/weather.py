@@ -1,50 +1,176 @@
-import requests
-from config import API_KEY
-from pathing import get_path_coordinates
+import abc
+import asyncio
+import json
+import logging
+import random
+from .config import API_KEY
+
+logger = logging.getLogger(__name__)
 
 STORM_GLASS_API_ENDPOINT = 'https://api.stormglass.io/v2/weather/point'
+WEATHER_PARAMS = ["airTemperature", "windSpeed", "waveHeight"]
 
-def get_weather_data(latitude, longitude):
-    params =v{
-        "lat":latitude,
-        "lon":longitude,
-        "params": ",".join(["airTemperature", "windSpeed", "waveheight"]),
-        #check if anything else should be added
-    }
-
-    headers = {
-        "Authorization": API_KEY
-    }
-
-    response = requests.get(STORM_GLASS_API_ENDPOINT, params=params, headers=headers)
-
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Error for data: ({latitude}, {longitude})")
-        return None
-    
-def generate_weather_map(path_coordinates):
-    weather_data = []
 
+class WeatherUnavailable(Exception):
+    """Raised by providers for failures worth retrying (timeouts, 429, 5xx)."""
+
+
+class WeatherProvider(abc.ABC):
+    """Source of current weather for a single point.
+
+    ``fetch`` returns a dict with the WEATHER_PARAMS keys, or None when the
+    provider has no data for the point. Providers are async context managers
+    so they can hold on to connections for the duration of a batch.
+    """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @abc.abstractmethod
+    async def fetch(self, latitude, longitude):
+        """Weather at one point, see the class docstring."""
+
+
+class StormGlassProvider(WeatherProvider):
+    def __init__(self, api_key=API_KEY, endpoint=STORM_GLASS_API_ENDPOINT, max_connections=8, timeout=10):
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.session = None
+
+    async def __aenter__(self):
+        import aiohttp
+
+        # One pooled session for the whole batch so connections are reused
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                             headers={"Authorization": self.api_key})
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+        return False
+
+    async def fetch(self, latitude, longitude):
+        import aiohttp
+
+        params = {
+            "lat": latitude,
+            "lng": longitude,
+            "params": ",".join(WEATHER_PARAMS),
+        }
+        try:
+            async with self.session.get(self.endpoint, params=params) as response:
+                if response.status == 429 or response.status >= 500:
+                    raise WeatherUnavailable(f"HTTP {response.status} for ({latitude}, {longitude})")
+                if response.status != 200:
+                    logger.warning("Weather request for (%s, %s) failed with HTTP %d", latitude, longitude, response.status)
+                    return None
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise WeatherUnavailable(str(e)) from e
+
+        hour = data["hours"][0]
+        return {name: hour.get(name, {}).get("noaa") for name in WEATHER_PARAMS}
+
+
+class FileWeatherProvider(WeatherProvider):
+    """Weather from a JSON file of {"lat,lon": {param: value}} entries, keyed
+    by the rounded cell coordinates. Meant for tests and offline runs."""
+
+    def __init__(self, file_path, precision=2):
+        with open(file_path) as file:
+            self.data = json.load(file)
+        self.precision = precision
+
+    async def fetch(self, latitude, longitude):
+        return self.data.get(f"{round(latitude, self.precision)},{round(longitude, self.precision)}")
+
+
+def to_lat_lon(coord):
+    # Accepts {"latitude": .., "longitude": ..} dicts as well as (lat, lon) pairs
+    if isinstance(coord, dict):
+        return float(coord["latitude"]), float(coord["longitude"])
+    return float(coord[0]), float(coord[1])
+
+
+def weather_cells(path_coordinates, cell_size=1.0):
+    """Down-sample waypoints into unique weather cells.
+
+    Returns the cell centres in path order and, for every waypoint, the index
+    of its cell, so one request per cell covers the whole path.
+    """
+    cells = {}
+    waypoint_cells = []
     for coord in path_coordinates:
-        data = get_weather_data(coord["latitude"], coord["longitude"])
+        lat, lon = to_lat_lon(coord)
+        key = (int(lat // cell_size), int(lon // cell_size))
+        if key not in cells:
+            cells[key] = len(cells)
+        waypoint_cells.append(cells[key])
+    centres = [((row + 0.5) * cell_size, (col + 0.5) * cell_size) for row, col in cells]
+    return centres, waypoint_cells
+
+
+async def fetch_with_retry(provider, latitude, longitude, retries=3, backoff=0.5):
+    # Exponential backoff with jitter between attempts, None once retries run out
+    for attempt in range(retries + 1):
+        try:
+            return await provider.fetch(latitude, longitude)
+        except WeatherUnavailable as e:
+            if attempt == retries:
+                logger.warning("Giving up on weather for (%s, %s): %s", latitude, longitude, e)
+                return None
+            await asyncio.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+
+
+async def fetch_weather_cells(provider, cells, max_concurrency=8, retries=3, backoff=0.5):
+    # At most max_concurrency requests are in flight at any time
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch(lat, lon):
+        async with semaphore:
+            return await fetch_with_retry(provider, lat, lon, retries, backoff)
 
+    async with provider:
+        return await asyncio.gather(*(fetch(lat, lon) for lat, lon in cells))
+
+
+def default_provider():
+    # Storm Glass behind the shared tile cache, imported late as weather_cache imports this module
+    from .weather_cache import CachedWeatherProvider, weather_cache
+    return CachedWeatherProvider(StormGlassProvider(), weather_cache)
+
+
+def get_path_weather(path_coordinates, provider=None, cell_size=1.0, max_concurrency=8, retries=3, backoff=0.5):
+    """Weather for every waypoint of a path, fetched once per weather cell."""
+    provider = provider or default_provider()
+    cells, waypoint_cells = weather_cells(path_coordinates, cell_size)
+    cell_weather = asyncio.run(fetch_weather_cells(provider, cells, max_concurrency, retries, backoff))
+
+    weather_data = []
+    for coord, cell in zip(path_coordinates, waypoint_cells):
+        data = cell_weather[cell]
         if data:
-            weather_data.append({
-                "lat":coord["latitude"],
-                "lon": coord["longitude"],
-                "airTemperature": data["hours"][0]["airTemperature"]["noaa"],
-                "windSpeed": data["hours"][0]["windSpeed"]["noaa"],
-                "waveHeight": data["hours"][0]["waveHeight"]["noaa"],
-                #maybe something else, i dont know
-            })
+            lat, lon = to_lat_lon(coord)
+            weather_data.append({"lat": lat, "lon": lon, **data})
+    return weather_data
+
+
+def get_weather_data(latitude, longitude, provider=None):
+    provider = provider or default_provider()
+    return asyncio.run(fetch_weather_cells(provider, [(latitude, longitude)]))[0]
+
+
+def generate_weather_map(path_coordinates, provider=None):
+    weather_data = get_path_weather(path_coordinates, provider)
     #Integrate the data in the debug.html, find a way
     #just print for now
     for item in weather_data:
         print(item)
-    
-    #if get_path_coordinates from pathing.py return coordinates like:
-    #[{"latitude": 59.91, "longitude":10.75}, "latitude": 59.92, "longitude":10.76}]
-    path_coordinates = get_path_coordinates()
-    generate_weather_map(path_coordinates)
\ No newline at end of file
+    return weather_data
@@ -0,0 +1,152 @@
+import os
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from .weather import WeatherProvider
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+weather_cache_path = os.path.join(script_dir, 'grid_map', 'weather_cache.sqlite3')
+
+
+class WeatherTileCache:
+    """Weather keyed by (lat tile, lon tile, forecast hour).
+
+    Every entry carries its own expiry time. The in-memory LRU is bounded by
+    max_entries and backed by a SQLite file, so a restarted worker starts with
+    whatever is still fresh on disk. The disk copy is pruned of expired rows
+    and capped at max_disk_entries, checked every prune_every writes so it
+    may run over the cap by that many rows in between.
+    """
+
+    def __init__(self, tile_size=1.0, ttl_seconds=3 * 3600, max_entries=20000,
+                 max_disk_entries=200000, prune_every=1000, db_path=weather_cache_path):
+        self.tile_size = tile_size
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.prune_every = prune_every
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._puts_since_prune = 0
+
+    def _connection(self):
+        if self._db is None and self.db_path is not None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._db.execute("CREATE TABLE IF NOT EXISTS tiles ("
+                             "key TEXT PRIMARY KEY, fetched_at REAL, expires_at REAL, data TEXT)")
+            self._db.execute("DELETE FROM tiles WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+        return self._db
+
+    def tile_key(self, latitude, longitude, when=None):
+        hour = int((time.time() if when is None else when) // 3600)
+        return f"{math.floor(latitude / self.tile_size)}:{math.floor(longitude / self.tile_size)}:{hour}"
+
+    def get(self, latitude, longitude, when=None):
+        key = self.tile_key(latitude, longitude, when)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                db = self._connection()
+                row = db.execute("SELECT fetched_at, expires_at, data FROM tiles WHERE key = ?",
+                                 (key,)).fetchone() if db is not None else None
+                if row is not None:
+                    entry = (row[0], row[1], json.loads(row[2]))
+                    self._remember(key, entry)
+
+            if entry is not None and entry[1] <= now:
+                self.expired += 1
+                self._entries.pop(key, None)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, latitude, longitude, data, when=None, ttl_seconds=None):
+        key = self.tile_key(latitude, longitude, when)
+        now = time.time()
+        entry = (now, now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds), data)
+        with self._lock:
+            self._remember(key, entry)
+            db = self._connection()
+            if db is not None:
+                db.execute("INSERT OR REPLACE INTO tiles (key, fetched_at, expires_at, data) VALUES (?, ?, ?, ?)",
+                           (key, entry[0], entry[1], json.dumps(data)))
+                self._puts_since_prune += 1
+                if self._puts_since_prune >= self.prune_every:
+                    self._puts_since_prune = 0
+                    self._prune(db, now)
+                db.commit()
+
+    def _prune(self, db, now):
+        # Called with the lock held. Sorting the whole table is only worth it
+        # once the cap is actually exceeded
+        db.execute("DELETE FROM tiles WHERE expires_at <= ?", (now,))
+        if db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0] > self.max_disk_entries:
+            db.execute("DELETE FROM tiles WHERE key IN (SELECT key FROM tiles ORDER BY fetched_at DESC "
+                       "LIMIT -1 OFFSET ?)", (self.max_disk_entries,))
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            lookups = self.hits + self.misses
+            ages = [now - entry[0] for entry in self._entries.values()]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "mean_age_seconds": sum(ages) / len(ages) if ages else 0.0,
+                "max_age_seconds": max(ages) if ages else 0.0,
+            }
+
+
+class CachedWeatherProvider(WeatherProvider):
+    """Reads through a WeatherTileCache before asking the wrapped provider."""
+
+    def __init__(self, provider, cache):
+        self.provider = provider
+        self.cache = cache
+
+    async def __aenter__(self):
+        await self.provider.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self.provider.__aexit__(*exc_info)
+
+    async def fetch(self, latitude, longitude):
+        data = self.cache.get(latitude, longitude)
+        if data is None:
+            data = await self.provider.fetch(latitude, longitude)
+            if data is not None:
+                self.cache.put(latitude, longitude, data)
+        return data
+
+
+weather_cache = WeatherTileCache()